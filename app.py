@@ -1,4 +1,4 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, get_template_attribute, abort, make_response, has_request_context, g, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from oauthlib.oauth2 import WebApplicationClient
@@ -7,26 +7,174 @@ from dotenv import load_dotenv
 from flask_migrate import Migrate
 import requests
 import json
+import socket
+import time
+import threading
+import uuid
+import click
+import itertools
+import sqlite3
+from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from reminders import ReminderQueue
+from cache import TTLCache
+from scheduling import working_windows, free_slots
+from snapshot import SnapshotManager, RoutingSession, read_from_snapshot
+from typeahead import PrefixIndex
+from assets import AssetPipeline
+from compression import CompressionMiddleware, CompressionStats, skip_compression
+from cascade import SubtreeCascade, archive_table
+from audit import AuditWriter
+from serializers import FastJSONProvider, Field, Schema, date_format, iso_format, age_on
+from timeline import merge_timeline, decode_cursor
+from tenancy import ClinicScoped, DEFAULT_CLINIC_ID, current_clinic_id, scope_to_clinic, clinic_criteria, clinic_scope
+from jobs import JobQueue, WorkerPool, job_table, JOB_STATUSES
+from ratelimit import AdmissionControl, RateLimited, retry_after_header
+from dedupe import blocking_keys, match_score, duplicate_clusters
+from werkzeug.datastructures import MultiDict
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder='app/static')
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///healthcare_new.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///healthcare_new.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Reminder scheduler config
+app.config['REMINDER_LEAD_MINUTES'] = int(os.getenv('REMINDER_LEAD_MINUTES', 60))
+app.config['REMINDER_LOOKAHEAD_MINUTES'] = int(os.getenv('REMINDER_LOOKAHEAD_MINUTES', 30))
+app.config['REMINDER_REFRESH_SECONDS'] = int(os.getenv('REMINDER_REFRESH_SECONDS', 60))
+app.config['REMINDER_POLL_SECONDS'] = int(os.getenv('REMINDER_POLL_SECONDS', 15))
+app.config['REMINDER_LEASE_SECONDS'] = int(os.getenv('REMINDER_LEASE_SECONDS', 45))
+app.config['REMINDER_BATCH_SIZE'] = int(os.getenv('REMINDER_BATCH_SIZE', 100))
+# How late a reminder may still go out, e.g. after the scheduler was down
+app.config['REMINDER_GRACE_MINUTES'] = int(os.getenv('REMINDER_GRACE_MINUTES', 15))
+
+# Activities stored without a duration block this many minutes of a doctor's time
+app.config['DEFAULT_ACTIVITY_DURATION_MINUTES'] = int(os.getenv('DEFAULT_ACTIVITY_DURATION_MINUTES', 30))
+# Longest activity that can be booked; overlap checks look back this far
+app.config['MAX_ACTIVITY_DURATION_MINUTES'] = int(os.getenv('MAX_ACTIVITY_DURATION_MINUTES', 480))
+
+# Working hours used by the free slot finder
+app.config['WORKING_HOURS_START'] = os.getenv('WORKING_HOURS_START', '09:00')
+app.config['WORKING_HOURS_END'] = os.getenv('WORKING_HOURS_END', '17:00')
+app.config['WORKING_DAYS'] = [int(day) for day in os.getenv('WORKING_DAYS', '0,1,2,3,4').split(',')]  # Monday is 0
+app.config['SLOT_STEP_MINUTES'] = int(os.getenv('SLOT_STEP_MINUTES', 15))
+app.config['SLOT_MAX_HORIZON_DAYS'] = int(os.getenv('SLOT_MAX_HORIZON_DAYS', 90))
+
+# Default page size for paginated lists and their fragments
+app.config['LIST_PAGE_SIZE'] = int(os.getenv('LIST_PAGE_SIZE', 25))
+
+# Most rows one bulk update may change; larger selections must be narrowed
+app.config['BULK_UPDATE_MAX_ROWS'] = int(os.getenv('BULK_UPDATE_MAX_ROWS', 1000))
+
+# Patient typeahead: how many matches to return and how often to rebuild
+# the in-memory index in full (to pick up writes from other processes)
+app.config['PATIENT_SEARCH_LIMIT'] = int(os.getenv('PATIENT_SEARCH_LIMIT', 20))
+app.config['PATIENT_INDEX_REFRESH_SECONDS'] = int(os.getenv('PATIENT_INDEX_REFRESH_SECONDS', 300))
+
+# Dashboard summary is memoized per user for this many seconds
+app.config['DASHBOARD_SUMMARY_TTL_SECONDS'] = int(os.getenv('DASHBOARD_SUMMARY_TTL_SECONDS', 5))
+
+# Response compression: skip bodies smaller than this, and flush streamed
+# bodies to the client at least every COMPRESSION_FLUSH_SIZE input bytes
+app.config['COMPRESSION_MIN_SIZE'] = int(os.getenv('COMPRESSION_MIN_SIZE', 500))
+app.config['COMPRESSION_GZIP_LEVEL'] = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+app.config['COMPRESSION_FLUSH_SIZE'] = int(os.getenv('COMPRESSION_FLUSH_SIZE', 8192))
+
+# Audit trail: records are buffered in memory (at most AUDIT_BUFFER_SIZE) and
+# written in batches. AUDIT_OVERFLOW_POLICY is block, drop_oldest or drop_newest;
+# block waits up to AUDIT_BLOCK_SECONDS for room before dropping the record
+app.config['AUDIT_BUFFER_SIZE'] = int(os.getenv('AUDIT_BUFFER_SIZE', 10000))
+app.config['AUDIT_BATCH_SIZE'] = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+app.config['AUDIT_FLUSH_SECONDS'] = float(os.getenv('AUDIT_FLUSH_SECONDS', 1.0))
+app.config['AUDIT_OVERFLOW_POLICY'] = os.getenv('AUDIT_OVERFLOW_POLICY', 'block')
+app.config['AUDIT_BLOCK_SECONDS'] = float(os.getenv('AUDIT_BLOCK_SECONDS', 1.0))
+
+# Background jobs: worker threads per `flask jobs run` (and optionally per web
+# process), how long a claimed job stays hidden from other workers, and the
+# retry policy, which backs off exponentially from JOBS_BACKOFF_SECONDS
+app.config['JOBS_WORKERS'] = int(os.getenv('JOBS_WORKERS', 4))
+app.config['JOBS_IN_PROCESS_WORKERS'] = int(os.getenv('JOBS_IN_PROCESS_WORKERS', 0))
+app.config['JOBS_POLL_SECONDS'] = float(os.getenv('JOBS_POLL_SECONDS', 1.0))
+app.config['JOBS_VISIBILITY_TIMEOUT_SECONDS'] = int(os.getenv('JOBS_VISIBILITY_TIMEOUT_SECONDS', 300))
+app.config['JOBS_MAX_ATTEMPTS'] = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+app.config['JOBS_BACKOFF_SECONDS'] = float(os.getenv('JOBS_BACKOFF_SECONDS', 10))
+app.config['JOBS_MAX_BACKOFF_SECONDS'] = float(os.getenv('JOBS_MAX_BACKOFF_SECONDS', 3600))
+app.config['EXPORT_DIR'] = os.getenv('EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+
+# Admission control for the expensive endpoints. Each class has a per-user
+# token bucket (PER_MINUTE refill, BURST size) and at most CONCURRENCY requests
+# running across all processes, with up to QUEUE more waiting WAIT_SECONDS for
+# a slot; anything beyond gets 429. Override with RATE_LIMIT_<CLASS>_<KEY>
+RATE_LIMIT_DEFAULTS = {
+    'export': {'per_minute': 6, 'burst': 3, 'concurrency': 2, 'queue': 2, 'wait_seconds': 10.0},
+    'analytics': {'per_minute': 30, 'burst': 10, 'concurrency': 4, 'queue': 4, 'wait_seconds': 5.0},
+    'search': {'per_minute': 240, 'burst': 40, 'concurrency': 16, 'queue': 16, 'wait_seconds': 1.0},
+}
+app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', '1') not in ('0', 'false', 'no')
+app.config['RATE_LIMIT_DATABASE_PATH'] = os.getenv('RATE_LIMIT_DATABASE_PATH', os.path.join(app.instance_path, 'ratelimit.db'))
+app.config['RATE_LIMIT_SLOT_LEASE_SECONDS'] = int(os.getenv('RATE_LIMIT_SLOT_LEASE_SECONDS', 300))
+app.config['RATE_LIMITS'] = {
+    endpoint_class: {key: type(value)(os.getenv(f'RATE_LIMIT_{endpoint_class.upper()}_{key.upper()}', value))
+                     for key, value in limits.items()}
+    for endpoint_class, limits in RATE_LIMIT_DEFAULTS.items()
+}
+
+# Duplicate patient detection: patients scoring at least
+# DUPLICATE_PATIENT_THRESHOLD (0-1) against a new one are reported, and the
+# batch search skips blocking keys shared by more than DUPLICATE_MAX_BLOCK_SIZE
+# patients (placeholder phone numbers and the like)
+app.config['DUPLICATE_PATIENT_THRESHOLD'] = float(os.getenv('DUPLICATE_PATIENT_THRESHOLD', 0.7))
+app.config['DUPLICATE_MAX_BLOCK_SIZE'] = int(os.getenv('DUPLICATE_MAX_BLOCK_SIZE', 50))
+
+# Activity tiers: completed and cancelled activities scheduled more than
+# ACTIVITY_COLD_AFTER_DAYS ago are moved out of the activity table, in
+# transactions of ACTIVITY_COLD_BATCH_SIZE rows
+app.config['ACTIVITY_COLD_AFTER_DAYS'] = int(os.getenv('ACTIVITY_COLD_AFTER_DAYS', 365))
+app.config['ACTIVITY_COLD_BATCH_SIZE'] = int(os.getenv('ACTIVITY_COLD_BATCH_SIZE', 1000))
+
+# Read-only snapshot used by the heavy analytics and export endpoints
+app.config['SNAPSHOT_DATABASE_PATH'] = os.getenv('SNAPSHOT_DATABASE_PATH', os.path.join(app.instance_path, 'healthcare_snapshot.db'))
+app.config['SNAPSHOT_MAX_STALENESS_SECONDS'] = int(os.getenv('SNAPSHOT_MAX_STALENESS_SECONDS', 300))
+app.config['SNAPSHOT_REFRESH_SECONDS'] = int(os.getenv('SNAPSHOT_REFRESH_SECONDS', 60))
+
 # Google OAuth2 config
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
-GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+GOOGLE_DISCOVERY_URL = os.getenv('GOOGLE_DISCOVERY_URL', "https://accounts.google.com/.well-known/openid-configuration")
+
+# Outbound OAuth calls: (connect, read) timeout per request, a deadline for
+# the whole callback and how long to cache Google's discovery document
+app.config['OAUTH_HTTP_TIMEOUT'] = (float(os.getenv('OAUTH_CONNECT_TIMEOUT', 3.05)), float(os.getenv('OAUTH_READ_TIMEOUT', 5)))
+app.config['OAUTH_CALLBACK_TIMEOUT_SECONDS'] = float(os.getenv('OAUTH_CALLBACK_TIMEOUT_SECONDS', 10))
+app.config['OAUTH_DISCOVERY_TTL_SECONDS'] = int(os.getenv('OAUTH_DISCOVERY_TTL_SECONDS', 3600))
+# Most request threads per process that may wait on Google at once; keep it
+# below the server's worker threads so the other routes always have some
+app.config['OAUTH_MAX_CONCURRENT_CALLS'] = int(os.getenv('OAUTH_MAX_CONCURRENT_CALLS', 2))
 
 # Initialize SQLAlchemy
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 migrate = Migrate(app, db)
+snapshot = SnapshotManager(app, db)
+asset_pipeline = AssetPipeline(app)
+compression_stats = CompressionStats()
+app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app,
+    min_size=app.config['COMPRESSION_MIN_SIZE'],
+    level=app.config['COMPRESSION_GZIP_LEVEL'],
+    brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+    flush_size=app.config['COMPRESSION_FLUSH_SIZE'],
+    stats=compression_stats
+)
 
 # Initialize Login Manager
 login_manager = LoginManager()
@@ -36,9 +184,18 @@ login_manager.login_view = 'login'
 # Initialize OAuth2 client
 client = WebApplicationClient(GOOGLE_CLIENT_ID)
 
+# Clinic model: the tenant that staff and clinical records belong to
+class Clinic(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # User model
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Staff see and create records of their own clinic only
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinic.id'), nullable=False,
+                          default=DEFAULT_CLINIC_ID, server_default=str(DEFAULT_CLINIC_ID))
     email = db.Column(db.String(100), unique=True)
     password_hash = db.Column(db.String(200))
     name = db.Column(db.String(100))
@@ -53,7 +210,7 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 # Patient model
-class Patient(db.Model):
+class Patient(ClinicScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
@@ -68,10 +225,28 @@ class Patient(db.Model):
     current_medications = db.Column(db.Text)
     allergies = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    # Set in Python rather than with CURRENT_TIMESTAMP, whose one-second
+    # resolution would give two quick edits the same ETag
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Blocking keys for duplicate detection (see dedupe.blocking_keys), set
+    # on every insert and update
+    name_key = db.Column(db.String(20))
+    phone_key = db.Column(db.String(20))
+
+    __table_args__ = (
+        # Listing order within a clinic
+        db.Index('ix_patient_clinic_name', 'clinic_id', 'first_name', 'id'),
+        db.Index('ix_patient_clinic_name_key', 'clinic_id', 'name_key'),
+        db.Index('ix_patient_clinic_phone_key', 'clinic_id', 'phone_key'),
+    )
+
+@event.listens_for(Patient, 'before_insert')
+@event.listens_for(Patient, 'before_update')
+def set_patient_blocking_keys(mapper, connection, target):
+    target.name_key, target.phone_key = blocking_keys(target.last_name, target.date_of_birth, target.phone)
 
 # Care Plan model
-class CarePlan(db.Model):
+class CarePlan(ClinicScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -81,17 +256,25 @@ class CarePlan(db.Model):
     goals = db.Column(db.Text, nullable=False)
     interventions = db.Column(db.Text, nullable=False)
     notes = db.Column(db.Text)
-    status = db.Column(db.String(20), default='active')  # active, pending, completed
+    status = db.Column(db.String(20), default='active', index=True)  # active, pending, completed
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship with Patient
     patient = db.relationship('Patient', backref=db.backref('care_plans', lazy=True))
     # Relationship with Goals
     patient_goals = db.relationship('Goal', backref='care_plan', lazy=True)
 
+    __table_args__ = (
+        # Serve a clinic's listing, with or without the status filter, in
+        # its start_date, id order
+        db.Index('ix_care_plan_clinic_status_start', 'clinic_id', 'status', 'start_date', 'id'),
+        db.Index('ix_care_plan_clinic_start', 'clinic_id', 'start_date', 'id'),
+        db.Index('ix_care_plan_patient_start', 'patient_id', 'start_date', 'id'),
+    )
+
 # Goal model
-class Goal(db.Model):
+class Goal(ClinicScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -100,12 +283,24 @@ class Goal(db.Model):
     target_date = db.Column(db.Date)
     status = db.Column(db.String(20), default='pending')  # pending, in_progress, completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every UPDATE; a stale version makes the flush fail instead of
+    # silently overwriting someone else's edit
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationship with Patient
     patient = db.relationship('Patient', backref=db.backref('goals', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_goal_care_plan', 'care_plan_id'),
+        # Serve the listing's filters in its target_date, id order
+        db.Index('ix_goal_clinic_status_target', 'clinic_id', 'status', 'target_date', 'id'),
+        db.Index('ix_goal_patient_target', 'patient_id', 'target_date', 'id'),
+        db.Index('ix_goal_clinic_target', 'clinic_id', 'target_date', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
 # Activity model
-class Activity(db.Model):
+class Activity(ClinicScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -128,6 +323,17 @@ class Activity(db.Model):
     care_plan = db.relationship('CarePlan', backref=db.backref('activities', lazy=True))
     goal = db.relationship('Goal', backref=db.backref('activities', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_activity_clinic_scheduled', 'clinic_id', 'scheduled_date', 'id'),
+        # The reminder scheduler works across clinics
+        db.Index('ix_activity_reminder_scheduled', 'enable_reminder', 'scheduled_date'),
+        db.Index('ix_activity_clinic_doctor_scheduled', 'clinic_id', 'doctor_name', 'scheduled_date'),
+        db.Index('ix_activity_clinic_location_scheduled', 'clinic_id', 'location', 'scheduled_date'),
+        db.Index('ix_activity_care_plan', 'care_plan_id'),
+        db.Index('ix_activity_goal_status', 'goal_id', 'status'),
+        db.Index('ix_activity_patient_scheduled', 'patient_id', 'scheduled_date', 'id'),
+    )
+
     def __repr__(self):
         return f'<Activity {self.title} for Patient {self.patient_id}>'
 
@@ -139,10 +345,1421 @@ class Activity(db.Model):
     def formatted_time(self):
         return self.scheduled_date.strftime('%I:%M %p') if self.scheduled_date else 'No time set'
 
+# Cold tier of the activity table. Closed activities past
+# ACTIVITY_COLD_AFTER_DAYS are moved here by move_cold_activities(), so the
+# listings, calendars and exports only scan recent activities unless asked
+# to include_archived. Goal and care plan counts and the patient timeline
+# always read both tiers.
+ACTIVITY_CLOSED_STATUSES = ('completed', 'cancelled')
+activity_cold = archive_table(Activity.__table__, db.metadata, name='activity_cold')
+db.Index('ix_activity_cold_clinic_scheduled', activity_cold.c.clinic_id, activity_cold.c.scheduled_date)
+db.Index('ix_activity_cold_patient_scheduled', activity_cold.c.patient_id, activity_cold.c.scheduled_date, activity_cold.c.id)
+
+def hot_and_cold_activities():
+    """The current clinic's activities in both tiers as one subquery with
+    the activity table's columns plus ``archived``.
+
+    Query it through ``select_entity_from`` so filters written against
+    Activity apply to both tiers, and read rows rather than entities: an
+    archived activity can share its id with a live one. The ORM's clinic
+    scoping does not reach inside the union, so each half filters by
+    clinic itself.
+    """
+    hot = Activity.__table__
+    return db.union_all(
+        db.select([*hot.columns, db.literal(False).label('archived')]).where(clinic_criteria(hot.c)),
+        db.select([*(activity_cold.c[column.name] for column in hot.columns), db.literal(True).label('archived')])
+        .where(clinic_criteria(activity_cold.c))
+    ).subquery('activity_all')
+
+# Message model
+class Message(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_message_recipient_read', 'recipient_id', 'read'),
+    )
+
+# Notification model
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    type = db.Column(db.String(50))  # system, care_plan, appointment, medication
+    read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_notification_user_read_created', 'user_id', 'read', 'created_at'),
+    )
+
+# Materialized unread notification count per user, kept in step by the
+# notification service so the sidebar badge never has to run COUNT(*)
+class NotificationCounter(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+# Who read or changed which patient record, and when. Append-only: rows are
+# inserted in batches by the audit writer and never updated or deleted.
+class AuditEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, index=True)  # no FK: the trail outlives the account
+    action = db.Column(db.String(20), nullable=False)  # read, create, update, delete, archive
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    details = db.Column(db.Text)  # JSON: changed field names, or rows removed per table
+    ip_address = db.Column(db.String(45))
+
+    __table_args__ = (
+        db.Index('ix_audit_event_entity', 'entity_type', 'entity_id', 'occurred_at'),
+    )
+
+@event.listens_for(AuditEvent, 'before_update')
+@event.listens_for(AuditEvent, 'before_delete')
+def reject_audit_event_change(mapper, connection, target):
+    raise ValueError('Audit events are append-only')
+
+# Notification service
+NOTIFICATION_RECIPIENT_ROLES = ('doctor', 'nurse')
+
+def notification_recipients(clinic_id):
+    """Return the ids of the staff users that receive the clinical events of
+    ``clinic_id``; staff never hear about another clinic's patients."""
+    rows = db.session.query(User.id).filter(
+        User.role.in_(NOTIFICATION_RECIPIENT_ROLES),
+        User.clinic_id == clinic_id
+    ).all()
+    return [row.id for row in rows]
+
+def fan_out_notifications(user_ids, messages):
+    """Deliver a list of (title, content, type) messages to many users.
+
+    The notification rows are written with a single executemany INSERT and
+    the unread counters are bumped with one upsert. The caller owns the
+    transaction, so the fan-out commits (or rolls back) together with the
+    change that triggered it.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids or not messages:
+        return 0
+
+    now = datetime.utcnow()
+    db.session.execute(Notification.__table__.insert(), [{
+        'user_id': user_id,
+        'title': title,
+        'content': content,
+        'type': type,
+        'read': False,
+        'created_at': now
+    } for title, content, type in messages for user_id in user_ids])
+
+    counter = NotificationCounter.__table__
+    upsert = sqlite_insert(counter)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[counter.c.user_id],
+        set_={'unread': counter.c.unread + upsert.excluded.unread}
+    )
+    db.session.execute(upsert, [{'user_id': user_id, 'unread': len(messages)} for user_id in user_ids])
+    return len(user_ids) * len(messages)
+
+def fan_out_notification(user_ids, title, content, type='system'):
+    """Deliver the same notification to many users."""
+    return fan_out_notifications(user_ids, [(title, content, type)])
+
+def mark_notifications_read(user_id, notification_ids=None, type=None):
+    """Mark a user's notifications read with one set-based UPDATE.
+
+    With no ids every unread notification of the user (optionally of one
+    type) is marked. Returns the number of rows that flipped to read.
+    """
+    notifications_table = Notification.__table__
+    stmt = notifications_table.update().where(
+        notifications_table.c.user_id == user_id,
+        notifications_table.c.read == False
+    )
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        stmt = stmt.where(notifications_table.c.id.in_(notification_ids))
+    if type:
+        stmt = stmt.where(notifications_table.c.type == type)
+
+    updated = db.session.execute(stmt.values(read=True)).rowcount
+    if updated:
+        counter = NotificationCounter.__table__
+        db.session.execute(
+            counter.update()
+            .where(counter.c.user_id == user_id)
+            .values(unread=func.max(counter.c.unread - updated, 0))
+        )
+    return updated
+
+def unread_notification_count(user_id):
+    # Shown in the navbar of every page, snapshot-routed ones included, so
+    # always read from the primary
+    count = db.session.query(NotificationCounter.unread).filter_by(user_id=user_id) \
+        .execution_options(use_primary=True).scalar()
+    return count or 0
+
+def rebuild_notification_counters():
+    """Recompute every unread counter from the notification table. Returns
+    the number of users with unread notifications; the caller commits."""
+    counter = NotificationCounter.__table__
+    notifications_table = Notification.__table__
+    db.session.execute(counter.delete())
+    return db.session.execute(counter.insert().from_select(
+        ['user_id', 'unread'],
+        db.select([notifications_table.c.user_id, func.count()])
+        .where(notifications_table.c.read == False)
+        .group_by(notifications_table.c.user_id)
+    )).rowcount
+
+def notify_care_plan_created(care_plan):
+    patient = db.session.query(Patient.first_name, Patient.last_name).filter_by(id=care_plan.patient_id).first()
+    patient_name = f"{patient.first_name} {patient.last_name}" if patient else 'a patient'
+    return fan_out_notification(
+        notification_recipients(care_plan.clinic_id),
+        'New Care Plan',
+        f"Care plan \"{care_plan.title}\" was created for {patient_name}.",
+        type='care_plan'
+    )
+
+def notify_activity_scheduled(activity):
+    if activity.activity_type == 'medication':
+        title, type = 'Medication Scheduled', 'medication'
+    else:
+        title, type = 'New Appointment Scheduled', 'appointment'
+    when = activity.scheduled_date.strftime('%B %d, %Y at %I:%M %p')
+    with_doctor = f" with {activity.doctor_name}" if activity.doctor_name else ''
+    return fan_out_notification(
+        notification_recipients(activity.clinic_id),
+        title,
+        f"{activity.title}{with_doctor} is scheduled for {when}.",
+        type=type
+    )
+
+# Reminder scheduler state, one row per scheduler. The high-water mark is
+# the (fire time, activity id) of the last reminder sent, and the lease makes
+# sure only one worker process dispatches at a time.
+class ReminderState(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    high_water_at = db.Column(db.DateTime)
+    high_water_id = db.Column(db.Integer, default=0)
+    owner = db.Column(db.String(100))
+    lease_expires = db.Column(db.DateTime)
+
+class ReminderScheduler:
+    """Sends a notification ``REMINDER_LEAD_MINUTES`` before each activity.
+
+    Only the upcoming window is scanned, using the
+    ``(enable_reminder, scheduled_date)`` index, and the due reminders are
+    held in a min-heap until they fire. Reminders go out in batches, and each
+    batch advances the persisted high-water mark in the same transaction as
+    its notifications, so a restart never sends a reminder twice. The window
+    is reloaded before every batch, so an activity added or moved since the
+    last load is sent in order instead of falling below the mark. Activities
+    created inside their own lead window get no reminder; the "scheduled"
+    notification already covers them. After downtime, reminders more than
+    ``REMINDER_GRACE_MINUTES`` late are dropped rather than replayed.
+    """
+
+    def __init__(self, name='activity'):
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.queue = ReminderQueue()
+        self.loaded_at = None
+
+    @property
+    def lead(self):
+        return timedelta(minutes=app.config['REMINDER_LEAD_MINUTES'])
+
+    def acquire_lease(self, now):
+        """Take or renew the dispatch lease. Returns True if we hold it."""
+        state_table = ReminderState.__table__
+        db.session.execute(sqlite_insert(state_table).values(name=self.name, high_water_id=0).on_conflict_do_nothing())
+        result = db.session.execute(
+            state_table.update()
+            .where(
+                state_table.c.name == self.name,
+                db.or_(
+                    state_table.c.owner.is_(None),
+                    state_table.c.owner == self.owner,
+                    state_table.c.lease_expires < now
+                )
+            )
+            .values(owner=self.owner, lease_expires=now + timedelta(seconds=app.config['REMINDER_LEASE_SECONDS']))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def load_window(self, now, state):
+        """Queue every reminder that fires between the high-water mark (or
+        the grace period, if the mark is older) and the lookahead."""
+        self.queue.clear()
+        if state.high_water_at is None:
+            # First run: start from now rather than replaying the past
+            state.high_water_at, state.high_water_id = now, 0
+            db.session.commit()
+        high_water = (state.high_water_at, state.high_water_id)
+        replay_from = max(high_water[0], now - timedelta(minutes=app.config['REMINDER_GRACE_MINUTES']))
+        window_end = now + timedelta(minutes=app.config['REMINDER_LOOKAHEAD_MINUTES'])
+
+        rows = db.session.query(Activity.id, Activity.scheduled_date).filter(
+            Activity.enable_reminder == True,
+            Activity.scheduled_date >= replay_from + self.lead,
+            Activity.scheduled_date <= window_end + self.lead
+        ).all()
+        for activity_id, scheduled_date in rows:
+            fire_at = scheduled_date - self.lead
+            if (fire_at, activity_id) > high_water:
+                self.queue.push(fire_at, activity_id)
+        self.loaded_at = now
+
+    def dispatch(self, batch):
+        """Send one batch of reminders and advance the high-water mark."""
+        activities = db.session.query(
+            Activity.id, Activity.clinic_id, Activity.title, Activity.activity_type,
+            Activity.doctor_name, Activity.scheduled_date
+        ).filter(
+            Activity.id.in_([activity_id for _, activity_id in batch]),
+            Activity.enable_reminder == True,
+            Activity.status.notin_(['completed', 'cancelled'])
+        ).all()
+
+        # The scheduler works across clinics; each clinic's staff only hear
+        # about that clinic's activities
+        messages = {}
+        for activity in activities:
+            type = 'medication' if activity.activity_type == 'medication' else 'appointment'
+            with_doctor = f" with {activity.doctor_name}" if activity.doctor_name else ''
+            messages.setdefault(activity.clinic_id, []).append((
+                'Upcoming Activity Reminder',
+                f"{activity.title}{with_doctor} starts at {activity.scheduled_date.strftime('%I:%M %p on %B %d, %Y')}.",
+                type
+            ))
+        for clinic_id, clinic_messages in messages.items():
+            fan_out_notifications(notification_recipients(clinic_id), clinic_messages)
+
+        fire_at, activity_id = batch[-1]
+        state_table = ReminderState.__table__
+        result = db.session.execute(
+            state_table.update()
+            .where(state_table.c.name == self.name, state_table.c.owner == self.owner)
+            .values(high_water_at=fire_at, high_water_id=activity_id)
+        )
+        if result.rowcount != 1:
+            # Another worker took over the lease; it will send this batch
+            db.session.rollback()
+            return None
+        db.session.commit()
+        return len(activities)
+
+    def tick(self, now=None):
+        """Run one scheduling pass. Returns the number of reminders sent."""
+        now = now or datetime.now()
+        if not self.acquire_lease(now):
+            self.queue.clear()
+            self.loaded_at = None
+            return 0
+
+        refresh = timedelta(seconds=app.config['REMINDER_REFRESH_SECONDS'])
+        stale = self.loaded_at is None or now - self.loaded_at >= refresh
+
+        sent = 0
+        while stale or self.queue.has_due(now):
+            # Reload before every batch: the batch advances the high-water
+            # mark, and a reminder added since the last load that fires
+            # before the mark would never be sent
+            self.load_window(now, db.session.get(ReminderState, self.name))
+            stale = False
+            batch = self.queue.pop_due(now, app.config['REMINDER_BATCH_SIZE'])
+            if not batch:
+                break
+            dispatched = self.dispatch(batch)
+            if dispatched is None:
+                self.queue.clear()
+                self.loaded_at = None
+                break
+            sent += dispatched
+        return sent
+
+    def run(self):
+        while True:
+            try:
+                sent = self.tick()
+                if sent:
+                    print(f"Sent {sent} activity reminders")
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error dispatching reminders: {str(e)}")
+            time.sleep(app.config['REMINDER_POLL_SECONDS'])
+
+# Double-booking detection
+def activity_end(scheduled_date, duration):
+    if duration is None:
+        duration = app.config['DEFAULT_ACTIVITY_DURATION_MINUTES']
+    return scheduled_date + timedelta(minutes=duration)
+
+def booked_activities(column, value, start, end, entities=(Activity,)):
+    """Query the non-cancelled activities of a doctor or location (``column
+    == value``) that overlap ``[start, end)``.
+
+    One range scan on the ``(resource, scheduled_date)`` index from
+    ``MAX_ACTIVITY_DURATION_MINUTES`` before ``start``: activities may
+    overlap each other (older rows, imports, bulk changes), so the latest
+    one starting before ``start`` is not the only one that can still be
+    running. The caller drops the rows that end by ``start``.
+    """
+    lookback = timedelta(minutes=app.config['MAX_ACTIVITY_DURATION_MINUTES'])
+    return db.session.query(*entities).filter(
+        column == value,
+        Activity.status != 'cancelled',
+        Activity.scheduled_date >= start - lookback,
+        Activity.scheduled_date < end
+    ).order_by(Activity.scheduled_date)
+
+def find_schedule_conflicts(doctor_name, start, duration, exclude_id=None, location=None):
+    """Return the activities of the doctor or at the location that overlap
+    ``[start, start + duration)``."""
+    start = start.replace(tzinfo=None)
+    end = activity_end(start, duration)
+    conflicts = {}
+    for column, value in ((Activity.doctor_name, doctor_name), (Activity.location, location)):
+        if not value:
+            continue
+        query = booked_activities(column, value, start, end)
+        if exclude_id is not None:
+            query = query.filter(Activity.id != exclude_id)
+        for activity in query:
+            if activity_end(activity.scheduled_date, activity.duration) > start:
+                conflicts[activity.id] = activity
+    return sorted(conflicts.values(), key=lambda activity: (activity.scheduled_date, activity.id))
+
+def schedule_conflict_response(conflicts, doctor_name=None, location=None):
+    booked = [value for value, attr in ((doctor_name, 'doctor_name'), (location, 'location'))
+              if value and any(getattr(activity, attr) == value for activity in conflicts)]
+    return jsonify({
+        'success': False,
+        'message': f'{" and ".join(booked)} already {"have" if len(booked) > 1 else "has"} {len(conflicts)} overlapping activit{"y" if len(conflicts) == 1 else "ies"} at this time.',
+        'conflicts': [{
+            'id': activity.id,
+            'title': activity.title,
+            'scheduled_date': activity.scheduled_date.isoformat(),
+            'duration': activity.duration,
+            'location': activity.location,
+            'status': activity.status
+        } for activity in conflicts]
+    }), 409
+
+def busy_intervals(start, end, doctor_name=None, location=None):
+    """Return the sorted (start, end) intervals booked for a doctor and/or
+    location that overlap ``[start, end)``, one range query per resource."""
+    intervals = []
+    for column, value in ((Activity.doctor_name, doctor_name), (Activity.location, location)):
+        if not value:
+            continue
+        rows = booked_activities(column, value, start, end, (Activity.scheduled_date, Activity.duration))
+        for row in rows:
+            row_end = activity_end(row.scheduled_date, row.duration)
+            if row_end > start:
+                intervals.append((row.scheduled_date, row_end))
+    intervals.sort()
+    return intervals
+
+# Dashboard summary
+dashboard_summary_cache = TTLCache(ttl=app.config['DASHBOARD_SUMMARY_TTL_SECONDS'])
+
+def compute_dashboard_summary(user_id):
+    """Compute every dashboard stat card in one aggregate statement.
+
+    The statement selects only scalar subqueries, which the ORM's clinic
+    scoping does not see, so each count filters by clinic itself.
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+
+    total_patients = db.select([func.count(Patient.id)]).where(clinic_criteria(Patient)).scalar_subquery()
+    todays_appointments = db.select([func.count(Activity.id)]).where(
+        clinic_criteria(Activity),
+        Activity.scheduled_date >= today,
+        Activity.scheduled_date < tomorrow,
+        Activity.status != 'cancelled'
+    ).scalar_subquery()
+    active_care_plans = db.select([func.count(CarePlan.id)]).where(
+        clinic_criteria(CarePlan),
+        CarePlan.status == 'active'
+    ).scalar_subquery()
+    unread_messages = db.select([func.count(Message.id)]).where(
+        Message.recipient_id == user_id,
+        Message.read == False
+    ).scalar_subquery()
+
+    row = db.session.execute(db.select([
+        total_patients.label('total_patients'),
+        todays_appointments.label('todays_appointments'),
+        active_care_plans.label('active_care_plans'),
+        unread_messages.label('unread_messages')
+    ])).one()
+    return dict(row._mapping)
+
+def get_dashboard_summary(user_id):
+    return dashboard_summary_cache.get(user_id, lambda: compute_dashboard_summary(user_id))
+
+# Patient typeahead, one index per clinic (None: all clinics, for callers
+# outside a clinic scope)
+patient_indexes = {}
+patient_index_lock = threading.Lock()
+patient_index_loaded_at = {}
+
+def patient_index_entry(patient_id, first_name, last_name):
+    # Indexed under both name orders so "doe" finds John Doe too
+    return (
+        patient_id,
+        (f'{first_name} {last_name}', f'{last_name} {first_name}'),
+        {'id': patient_id, 'first_name': first_name, 'last_name': last_name}
+    )
+
+def patient_index_is_fresh(clinic_id):
+    loaded_at = patient_index_loaded_at.get(clinic_id)
+    return loaded_at is not None and time.monotonic() - loaded_at < app.config['PATIENT_INDEX_REFRESH_SECONDS']
+
+def ensure_patient_index():
+    """Return the current clinic's patient name index, (re)building it from
+    the database when it has never been loaded or is older than
+    PATIENT_INDEX_REFRESH_SECONDS."""
+    clinic_id = current_clinic_id()
+    if patient_index_is_fresh(clinic_id):
+        return patient_indexes[clinic_id]
+    with patient_index_lock:
+        if not patient_index_is_fresh(clinic_id):
+            # The statement is clinic-scoped like any other read
+            rows = db.session.execute(db.select([Patient.id, Patient.first_name, Patient.last_name])).all()
+            index = patient_indexes.get(clinic_id) or PrefixIndex()
+            index.load(patient_index_entry(*row) for row in rows)
+            patient_indexes[clinic_id] = index
+            patient_index_loaded_at[clinic_id] = time.monotonic()
+    return patient_indexes[clinic_id]
+
+@event.listens_for(RoutingSession, 'after_flush')
+def track_patient_index_changes(session, flush_context):
+    changes = session.info.setdefault('patient_index_changes', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Patient):
+            changes[obj.id] = (obj.clinic_id, patient_index_entry(obj.id, obj.first_name, obj.last_name))
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            changes[obj.id] = None
+
+@event.listens_for(RoutingSession, 'after_commit')
+def apply_patient_index_changes(session):
+    # Only committed writes reach the index; an unloaded index will read them on first use
+    # Changes map a patient id to (clinic_id, entry), or to None for a removal
+    changes = session.info.pop('patient_index_changes', None)
+    if not changes or not patient_indexes:
+        return
+    for patient_id, change in changes.items():
+        if change is None:
+            for index in list(patient_indexes.values()):
+                index.remove(patient_id)
+            continue
+        clinic_id, entry = change
+        for key in (clinic_id, None):
+            if key in patient_indexes:
+                patient_indexes[key].add(*entry)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard_patient_index_changes(session):
+    session.info.pop('patient_index_changes', None)
+
+# Duplicate patients. A new patient is only compared with the patients
+# sharing one of its blocking keys, which is an index probe per key.
+def find_duplicate_patients(patient):
+    """Patients of the current clinic who are likely the same person as
+    ``patient`` (which need not be saved yet), as ``(patient, score)``
+    pairs, best match first. Importers should call this for every record
+    too."""
+    name_key, phone_key = blocking_keys(patient.last_name, patient.date_of_birth, patient.phone)
+    # One index probe per key, scoped to the clinic by hand: left to the
+    # ORM, the clinic criteria on the outer query tempt SQLite into walking
+    # the whole clinic instead of looking up the handful of ids
+    probes = [db.select([Patient.id]).where(clinic_criteria(Patient), column == key)
+              for column, key in ((Patient.name_key, name_key), (Patient.phone_key, phone_key)) if key]
+    if not probes:
+        return []
+    query = Patient.query.execution_options(all_clinics=True).filter(Patient.id.in_(db.union(*probes)))
+    if patient.id is not None:
+        query = query.filter(Patient.id != patient.id)
+    threshold = app.config['DUPLICATE_PATIENT_THRESHOLD']
+    scored = ((candidate, match_score(patient, candidate))
+              for candidate in query.limit(app.config['DUPLICATE_MAX_BLOCK_SIZE']))
+    return sorted(((candidate, score) for candidate, score in scored if score >= threshold),
+                  key=lambda pair: -pair[1])
+
+def duplicate_payload(patient, score):
+    return {
+        'id': patient.id,
+        'first_name': patient.first_name,
+        'last_name': patient.last_name,
+        'date_of_birth': patient.date_of_birth.isoformat(),
+        'phone': patient.phone,
+        'score': round(score, 2)
+    }
+
+def backfill_patient_blocking_keys(batch_size=1000):
+    """Set the blocking keys of patients written before they existed, or
+    by bulk loads that bypass the ORM, one transaction per batch. Returns
+    the number of patients updated."""
+    table = Patient.__table__
+    updated, after = 0, 0
+    while True:
+        rows = db.session.execute(
+            db.select([table.c.id, table.c.last_name, table.c.date_of_birth, table.c.phone])
+            .where(table.c.id > after, table.c.name_key.is_(None), table.c.phone_key.is_(None))
+            .order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            db.session.rollback()
+            return updated
+        params = []
+        for row in rows:
+            name_key, phone_key = blocking_keys(row.last_name, row.date_of_birth, row.phone)
+            if name_key or phone_key:
+                params.append({'patient_id': row.id, 'new_name_key': name_key, 'new_phone_key': phone_key})
+        try:
+            if params:
+                # updated_at is kept as it is: the patient did not change
+                db.session.execute(
+                    table.update().where(table.c.id == db.bindparam('patient_id'))
+                    .values(name_key=db.bindparam('new_name_key'), phone_key=db.bindparam('new_phone_key'),
+                            updated_at=table.c.updated_at),
+                    params
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        updated += len(params)
+        after = rows[-1].id
+
+def find_duplicate_patient_clusters():
+    """Clusters of patients that are likely the same person, within each
+    clinic (or only the current one, inside a clinic scope). Only patients
+    sharing a blocking key with another patient are loaded and compared."""
+    table = Patient.__table__
+    records, blocks = {}, []
+    for key in (table.c.name_key, table.c.phone_key):
+        shared = db.select([table.c.clinic_id, key]) \
+            .where(key.isnot(None), clinic_criteria(table.c)) \
+            .group_by(table.c.clinic_id, key).having(db.func.count() > 1).subquery()
+        rows = db.session.execute(
+            db.select([table.c.id, table.c.clinic_id, table.c.first_name, table.c.last_name,
+                       table.c.date_of_birth, table.c.phone, table.c.email, key.label('block')])
+            .select_from(table.join(shared, db.and_(table.c.clinic_id == shared.c.clinic_id,
+                                                    key == shared.c[key.name])))
+            .order_by(table.c.clinic_id, key, table.c.id)
+        ).all()
+        for _, block in itertools.groupby(rows, key=lambda row: (row.clinic_id, row.block)):
+            block = list(block)
+            records.update((row.id, row) for row in block)
+            blocks.append(block)
+    clusters = duplicate_clusters(blocks, app.config['DUPLICATE_PATIENT_THRESHOLD'],
+                                  app.config['DUPLICATE_MAX_BLOCK_SIZE'])
+    return [[records[patient_id] for patient_id in cluster] for cluster in clusters]
+
+# Audit trail. Reads of the detail APIs and committed changes to the
+# audited models are queued on the write-behind audit writer; nothing on
+# the request path touches the audit table.
+AUDITED_MODELS = {Patient: 'patient', CarePlan: 'care_plan', Goal: 'goal', Activity: 'activity'}
+AUDIT_IGNORED_FIELDS = {'updated_at', 'version', 'name_key', 'phone_key'}
+
+def write_audit_events(records):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(AuditEvent.__table__.insert(), records)
+
+audit_writer = AuditWriter(
+    write_audit_events,
+    capacity=app.config['AUDIT_BUFFER_SIZE'],
+    batch_size=app.config['AUDIT_BATCH_SIZE'],
+    flush_interval=app.config['AUDIT_FLUSH_SECONDS'],
+    overflow=app.config['AUDIT_OVERFLOW_POLICY'],
+    block_timeout=app.config['AUDIT_BLOCK_SECONDS']
+)
+
+def audit_entry(action, entity_type, entity_id, details=None):
+    user_id = ip_address = None
+    if has_request_context():
+        ip_address = request.remote_addr
+        if current_user.is_authenticated:
+            user_id = current_user.id
+    return {
+        'occurred_at': datetime.utcnow(),
+        'user_id': user_id,
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'details': json.dumps(details) if details is not None else None,
+        'ip_address': ip_address
+    }
+
+def audit(action, entity_type, entity_id, details=None):
+    audit_writer.record(audit_entry(action, entity_type, entity_id, details))
+
+@event.listens_for(RoutingSession, 'after_flush')
+def track_audited_changes(session, flush_context):
+    # Captured now, while the attribute history is still there, and only
+    # queued once the transaction commits
+    pending = session.info.setdefault('audit_pending', [])
+    for obj in session.new:
+        if type(obj) in AUDITED_MODELS:
+            pending.append(audit_entry('create', AUDITED_MODELS[type(obj)], obj.id))
+    for obj in session.dirty:
+        if type(obj) in AUDITED_MODELS and session.is_modified(obj, include_collections=False):
+            state = db.inspect(obj)
+            fields = sorted(
+                attr.key for attr in state.mapper.column_attrs
+                if attr.key not in AUDIT_IGNORED_FIELDS and state.attrs[attr.key].history.has_changes()
+            )
+            if fields:
+                pending.append(audit_entry('update', AUDITED_MODELS[type(obj)], obj.id, {'fields': fields}))
+    for obj in session.deleted:
+        if type(obj) in AUDITED_MODELS:
+            pending.append(audit_entry('delete', AUDITED_MODELS[type(obj)], obj.id))
+
+@event.listens_for(RoutingSession, 'after_commit')
+def queue_audited_changes(session):
+    for entry in session.info.pop('audit_pending', ()):
+        audit_writer.record(entry)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard_audited_changes(session):
+    session.info.pop('audit_pending', None)
+
+# Subtree deletion and archival. Removing a patient or care plan takes its
+# care plans, goals and activities with it in a few set-based statements.
+ARCHIVE_TABLES = {
+    model.__table__: archive_table(model.__table__, db.metadata)
+    for model in (Patient, CarePlan, Goal, Activity)
+}
+ARCHIVE_TABLES[activity_cold] = ARCHIVE_TABLES[Activity.__table__]
+
+patient_subtree = SubtreeCascade([
+    (activity_cold, lambda ids: activity_cold.c.patient_id.in_(ids)),
+    (Activity.__table__, lambda ids: Activity.patient_id.in_(ids)),
+    (Goal.__table__, lambda ids: Goal.patient_id.in_(ids)),
+    (CarePlan.__table__, lambda ids: CarePlan.patient_id.in_(ids)),
+    (Patient.__table__, lambda ids: Patient.id.in_(ids)),
+], archives=ARCHIVE_TABLES)
+
+care_plan_subtree = SubtreeCascade([
+    # Activities filed under the plan or under one of its goals
+    (activity_cold, lambda ids: db.or_(
+        activity_cold.c.care_plan_id.in_(ids),
+        activity_cold.c.goal_id.in_(db.select([Goal.id]).where(Goal.care_plan_id.in_(ids)))
+    )),
+    (Activity.__table__, lambda ids: db.or_(
+        Activity.care_plan_id.in_(ids),
+        Activity.goal_id.in_(db.select([Goal.id]).where(Goal.care_plan_id.in_(ids)))
+    )),
+    (Goal.__table__, lambda ids: Goal.care_plan_id.in_(ids)),
+    (CarePlan.__table__, lambda ids: CarePlan.id.in_(ids)),
+], archives=ARCHIVE_TABLES)
+
+def remove_subtrees(cascade, ids, archive=False, dry_run=False):
+    """Delete, or archive, the subtrees rooted at ``ids`` in one transaction.
+
+    Returns the number of rows per table; with ``dry_run`` the rows are
+    only counted and nothing changes.
+    """
+    if dry_run:
+        return cascade.count(db.session, ids)
+    try:
+        if archive:
+            counts = cascade.archive(db.session, ids, datetime.utcnow())
+        else:
+            counts = cascade.delete(db.session, ids)
+        # Core deletes bypass the flush hooks, so queue the index updates and
+        # audit records directly
+        if cascade is patient_subtree:
+            changes = db.session.info.setdefault('patient_index_changes', {})
+            changes.update((patient_id, None) for patient_id in ids)
+        root = cascade.steps[-1][0].name
+        db.session.info.setdefault('audit_pending', []).extend(
+            audit_entry('archive' if archive else 'delete', root, root_id, {'removed': counts})
+            for root_id in ids
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    dashboard_summary_cache.invalidate()
+    return counts
+
+def move_cold_activities(before, batch_size):
+    """Move closed activities scheduled before ``before`` to activity_cold,
+    ``batch_size`` per transaction so writers are never held up for long.
+    Works across all clinics; returns the number of activities moved."""
+    hot = Activity.__table__
+    criteria = [hot.c.status.in_(ACTIVITY_CLOSED_STATUSES), hot.c.scheduled_date < before]
+    moved = 0
+    while True:
+        try:
+            ids = db.session.execute(
+                db.select([hot.c.id]).where(*criteria).order_by(hot.c.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                db.session.rollback()
+                break
+            # The criteria are repeated so an activity reopened since the
+            # ids were read stays where it is
+            selected = [hot.c.id.in_(ids), *criteria]
+            db.session.execute(activity_cold.insert().from_select(
+                [column.name for column in hot.columns] + ['archived_at'],
+                db.select([*hot.columns, db.literal(datetime.utcnow(), db.DateTime)]).where(*selected)
+            ))
+            moved += db.session.execute(hot.delete().where(*selected)).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if len(ids) < batch_size:
+            break
+    return moved
+
+# Bulk activity status changes. Only statuses that free the activity's time
+# are allowed here; anything that puts an activity back on the schedule
+# goes through the single-activity edit and its conflict check.
+BULK_ACTIVITY_STATUSES = ('completed', 'cancelled')
+
+def bulk_update_activity_status(criteria, status, limit):
+    """Set ``status`` on every activity of the current clinic matching
+    ``criteria`` with one UPDATE, and return the ids that changed.
+
+    Only open activities change: closed ones are left alone, so a cancelled
+    activity is never completed behind the double-booking check, and
+    ``updated_at`` and the ETag only move for rows that really changed.
+    Raises ValueError, changing nothing, if more than ``limit`` activities
+    match.
+    """
+    criteria = list(criteria) + [
+        db.or_(Activity.status.notin_(ACTIVITY_CLOSED_STATUSES), Activity.status.is_(None))
+    ]
+    try:
+        # The ids are read first for the audit trail; the UPDATE repeats the
+        # criteria so a row changed in between is not touched
+        ids = [row.id for row in Activity.query.with_entities(Activity.id).filter(*criteria).limit(limit + 1)]
+        if len(ids) > limit:
+            raise ValueError(f'More than {limit} activities match; narrow the selection.')
+        if ids:
+            db.session.execute(
+                db.update(Activity)
+                .where(Activity.id.in_(ids), *criteria)
+                .values(status=status, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            # Core-style updates bypass the flush hooks, so queue the audit
+            # records directly
+            db.session.info.setdefault('audit_pending', []).extend(
+                audit_entry('update', 'activity', activity_id, {'fields': ['status'], 'bulk': True})
+                for activity_id in ids
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if ids:
+        dashboard_summary_cache.invalidate()
+    return ids
+
+# Background jobs, kept in the job table so they survive restarts. Workers
+# run in `flask jobs run`, and in the web processes too when
+# JOBS_IN_PROCESS_WORKERS is set.
+jobs_table = job_table(db.metadata)
+job_queue = JobQueue(
+    jobs_table,
+    lambda: db.engine,
+    visibility_timeout=app.config['JOBS_VISIBILITY_TIMEOUT_SECONDS'],
+    max_attempts=app.config['JOBS_MAX_ATTEMPTS'],
+    backoff=app.config['JOBS_BACKOFF_SECONDS'],
+    max_backoff=app.config['JOBS_MAX_BACKOFF_SECONDS']
+)
+job_reminder_scheduler = None
+job_reminder_lock = threading.Lock()
+in_process_workers = None
+
+def job_worker_pool(workers):
+    return WorkerPool(job_queue, workers=workers, poll_interval=app.config['JOBS_POLL_SECONDS'],
+                      context=app.app_context)
+
+@app.before_request
+def start_in_process_workers():
+    global in_process_workers
+    workers = app.config['JOBS_IN_PROCESS_WORKERS']
+    # Started lazily, and again in a forked worker, whose copy of the
+    # parent's threads does not run
+    if workers and (in_process_workers is None or in_process_workers[0] != os.getpid()):
+        in_process_workers = (os.getpid(), job_worker_pool(workers).start())
+
+# Admission control state lives in its own SQLite file shared by every
+# process on the host
+admission_control = AdmissionControl(app.config['RATE_LIMIT_DATABASE_PATH'],
+                                     lease=app.config['RATE_LIMIT_SLOT_LEASE_SECONDS'])
+
+def too_many_requests(e):
+    response = jsonify({'success': False, 'message': str(e)})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(e.retry_after)
+    return response
+
+def acquire_admission_slot(endpoint_class):
+    """Take one of ``endpoint_class``'s concurrency slots, waiting in its
+    queue for up to ``wait_seconds``, or raise RateLimited. Returns the slot
+    id, or None when admission control is off or its database cannot be
+    used."""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return None
+    limits = app.config['RATE_LIMITS'][endpoint_class]
+    try:
+        return admission_control.acquire(endpoint_class, limits['concurrency'], limits['queue'],
+                                         limits['wait_seconds'])
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error in admission control: {str(e)}")
+        return None
+
+def release_admission_slot(slot_id):
+    if slot_id is None:
+        return
+    try:
+        admission_control.release(slot_id)
+    except sqlite3.Error as e:
+        # The slot's lease frees it eventually
+        print(f"Error releasing admission slot: {str(e)}")
+
+def admission(endpoint_class, hold_slot=True):
+    """Admit a request to an ``endpoint_class`` of RATE_LIMITS or answer 429
+    with Retry-After. Apply it below ``login_required`` so limits are per
+    user; if the admission database cannot be used the request goes ahead.
+    With ``hold_slot=False`` only the per-user rate applies, for views that
+    hand the work to a job which takes the slot itself."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not app.config['RATE_LIMIT_ENABLED']:
+                return view(*args, **kwargs)
+            limits = app.config['RATE_LIMITS'][endpoint_class]
+            user = current_user.id if current_user.is_authenticated else request.remote_addr
+            try:
+                admission_control.take(f'{endpoint_class}:{user}', limits['per_minute'] / 60, limits['burst'])
+            except RateLimited as e:
+                return too_many_requests(e)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error in admission control: {str(e)}")
+            if not hold_slot:
+                return view(*args, **kwargs)
+            try:
+                slot_id = acquire_admission_slot(endpoint_class)
+            except RateLimited as e:
+                return too_many_requests(e)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                release_admission_slot(slot_id)
+        return wrapper
+    return decorator
+
+@job_queue.task('reminders.tick')
+def reminders_tick_job(job):
+    """Run one reminder pass and queue the next one REMINDER_POLL_SECONDS
+    later, so `flask jobs enqueue reminders.tick` starts a chain that keeps
+    going. The next tick is queued with this one's success and only if no
+    tick is queued already, so a second enqueue or a re-run tick merges
+    into the chain instead of forking it. Like `flask reminders run`, a
+    failed pass is logged rather than retried; the next tick picks up from
+    the high-water mark."""
+    global job_reminder_scheduler
+    # One scheduler per process, so successive ticks keep the same lease;
+    # the lock keeps two worker threads from ticking it at once
+    with job_reminder_lock:
+        if job_reminder_scheduler is None:
+            job_reminder_scheduler = ReminderScheduler()
+        try:
+            result = {'sent': job_reminder_scheduler.tick()}
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error dispatching reminders: {str(e)}")
+            result = {'sent': 0, 'error': str(e)}
+    job.then('reminders.tick', delay=app.config['REMINDER_POLL_SECONDS'], unique=True)
+    return result
+
+@job_queue.task('snapshot.refresh')
+def refresh_snapshot_job(job):
+    snapshot.refresh()
+    return {'path': snapshot.path}
+
+@job_queue.task('activities.move_cold')
+def move_cold_activities_job(job):
+    days = job.payload.get('days', app.config['ACTIVITY_COLD_AFTER_DAYS'])
+    return {'moved': move_cold_activities(datetime.now() - timedelta(days=days),
+                                          app.config['ACTIVITY_COLD_BATCH_SIZE'])}
+
+@job_queue.task('patients.find_duplicates')
+def find_duplicate_patients_job(job):
+    backfill_patient_blocking_keys()
+    clusters = find_duplicate_patient_clusters()
+    return {'clusters': [[{'id': row.id, 'clinic_id': row.clinic_id, 'name': f'{row.first_name} {row.last_name}',
+                           'date_of_birth': row.date_of_birth, 'phone': row.phone} for row in cluster]
+                         for cluster in clusters]}
+
+def write_export_file(path, text):
+    """Write ``path`` through a temporary file, so a download never sees a
+    partial export and a failed write leaves no copy of the data behind."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+@job_queue.task('export')
+def export_job(job):
+    """Write an export to EXPORT_DIR, with the filters and clinic of the
+    request that queued it. The export holds one of the export class's
+    concurrency slots, shared with the synchronous exports; if none frees
+    up in time the job fails and is retried later."""
+    kind = job.payload['kind']
+    slot_id = acquire_admission_slot('export')
+    try:
+        with clinic_scope(job.payload.get('clinic_id')):
+            data = export_data(kind, MultiDict(job.payload.get('filters', {})))
+        os.makedirs(app.config['EXPORT_DIR'], exist_ok=True)
+        path = os.path.join(app.config['EXPORT_DIR'], f'{kind}-{job.id}.json')
+        write_export_file(path, app.json.dumps({'success': True, 'data': data}))
+    finally:
+        release_admission_slot(slot_id)
+    return {'path': path, 'rows': len(data)}
+
+@app.context_processor
+def inject_notification_count():
+    if not current_user.is_authenticated:
+        return {}
+    return {'unread_notification_count': unread_notification_count(current_user.id)}
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Tenancy: a signed-in user's requests only see and create records of their
+# clinic. Requests without a user, background workers and CLI commands are
+# unscoped unless they enter a tenancy.clinic_scope block.
+@app.before_request
+def set_current_clinic():
+    if current_user.is_authenticated:
+        g.clinic_id = current_user.clinic_id
+
+event.listen(RoutingSession, 'do_orm_execute', scope_to_clinic)
+
+# List filters shared by the pages, their HTML fragments and the exports
+def page_args():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', app.config['LIST_PAGE_SIZE'], type=int), 1), 100)
+    return page, per_page
+
+def filtered_patients_query(args):
+    """Return the patient query for the search/gender/age filters in ``args``
+    together with the normalised filters, for building pager links."""
+    search_term = args.get('search', '').lower()
+    gender_filter = args.get('gender', 'all')
+    age_filter = args.get('age', 'all')
+    filters = {'search': search_term, 'gender': gender_filter, 'age': age_filter}
+
+    # Base query
+    query = Patient.query
+
+    # Apply search
+    if search_term:
+        query = query.filter(
+            db.or_(
+                Patient.first_name.ilike(f'%{search_term}%'),
+                Patient.last_name.ilike(f'%{search_term}%'),
+                Patient.email.ilike(f'%{search_term}%'),
+                Patient.phone.ilike(f'%{search_term}%')
+            )
+        )
+
+    # Apply gender filter
+    if gender_filter != 'all':
+        query = query.filter(Patient.gender == gender_filter)
+
+    # Apply age filter
+    if age_filter != 'all':
+        today = datetime.now().date()
+        if age_filter == '0-18':
+            query = query.filter(Patient.date_of_birth >= today - timedelta(days=18*365))
+        elif age_filter == '19-30':
+            query = query.filter(
+                Patient.date_of_birth < today - timedelta(days=18*365),
+                Patient.date_of_birth >= today - timedelta(days=30*365)
+            )
+        elif age_filter == '31-50':
+            query = query.filter(
+                Patient.date_of_birth < today - timedelta(days=30*365),
+                Patient.date_of_birth >= today - timedelta(days=50*365)
+            )
+        elif age_filter == '50+':
+            query = query.filter(Patient.date_of_birth < today - timedelta(days=50*365))
+
+    return query.order_by(Patient.first_name, Patient.id), filters
+
+def filtered_activities_query(args):
+    """Return the activity query for the type/status/search filters in ``args``
+    together with the normalised filters. With ``include_archived`` the query
+    reads both activity tiers and returns rows flagged ``archived`` instead
+    of Activity objects."""
+    search_term = args.get('search', '').lower()
+    activity_type = args.get('type', 'all')
+    status_filter = args.get('status', 'all') or 'all'
+    include_archived = args.get('include_archived', 'false').lower() in ('1', 'true')
+    filters = {'search': search_term, 'type': activity_type, 'status': status_filter}
+
+    # Base query
+    if include_archived:
+        filters['include_archived'] = 'true'
+        activities = hot_and_cold_activities()
+        query = Activity.query.select_entity_from(activities) \
+            .with_entities(*(attr.class_attribute for attr in db.inspect(Activity).column_attrs), activities.c.archived)
+    else:
+        query = Activity.query
+
+    # Apply filters
+    if activity_type != 'all':
+        query = query.filter(Activity.activity_type == activity_type)
+    if status_filter != 'all':
+        query = query.filter(Activity.status == status_filter)
+    if search_term:
+        query = query.filter(
+            db.or_(
+                Activity.title.ilike(f'%{search_term}%'),
+                Activity.description.ilike(f'%{search_term}%'),
+                Activity.doctor_name.ilike(f'%{search_term}%'),
+                Activity.location.ilike(f'%{search_term}%')
+            )
+        )
+
+    return query.order_by(Activity.scheduled_date.desc(), Activity.id.desc()), filters
+
+def filtered_care_plans_query(args):
+    status_filter = args.get('status', 'all') or 'all'
+    patient_id = args.get('patient_id', type=int)
+    filters = {'status': status_filter}
+
+    # The patient name comes in with the page, not one lazy load per row
+    query = CarePlan.query.options(db.joinedload(CarePlan.patient, innerjoin=True))
+    if status_filter != 'all':
+        query = query.filter(CarePlan.status == status_filter)
+    if patient_id:
+        query = query.filter(CarePlan.patient_id == patient_id)
+        filters['patient_id'] = patient_id
+    return query.order_by(CarePlan.start_date.desc(), CarePlan.id.desc()), filters
+
+def care_plan_counts(care_plans):
+    """Goal and activity counts for a page of care plans, keyed by plan id.
+
+    Both counts come from grouped subqueries restricted to the page's ids,
+    so the cost tracks the page size rather than the size of the tables.
+    """
+    ids = [care_plan.id for care_plan in care_plans]
+    if not ids:
+        return {}
+    goal_counts = db.select([Goal.care_plan_id, db.func.count().label('total')]) \
+        .where(Goal.care_plan_id.in_(ids)).group_by(Goal.care_plan_id).subquery()
+    activity_ids = db.union_all(
+        db.select([Activity.care_plan_id]).where(Activity.care_plan_id.in_(ids)),
+        db.select([activity_cold.c.care_plan_id]).where(activity_cold.c.care_plan_id.in_(ids))
+    ).subquery()
+    activity_counts = db.select([activity_ids.c.care_plan_id, db.func.count().label('total')]) \
+        .group_by(activity_ids.c.care_plan_id).subquery()
+    rows = db.session.execute(
+        db.select([
+            CarePlan.id,
+            db.func.coalesce(goal_counts.c.total, 0),
+            db.func.coalesce(activity_counts.c.total, 0),
+        ])
+        .select_from(CarePlan.__table__
+                     .outerjoin(goal_counts, goal_counts.c.care_plan_id == CarePlan.id)
+                     .outerjoin(activity_counts, activity_counts.c.care_plan_id == CarePlan.id))
+        .where(CarePlan.id.in_(ids))
+    )
+    return {care_plan_id: {'goals': goals, 'activities': activities}
+            for care_plan_id, goals, activities in rows}
+
+# Goal progress, computed in the database: how many activities are linked
+# to the goal and how many of them are completed (answered from
+# ix_activity_goal_status and the cold tier's goal_id index), and whether
+# its target date passed unmet
+goal_activity_count = db.select([db.func.count()]) \
+    .where(Activity.goal_id == Goal.id).correlate(Goal).scalar_subquery() \
+    + db.select([db.func.count()]) \
+    .where(activity_cold.c.goal_id == Goal.id).correlate(Goal).scalar_subquery()
+goal_completed_count = db.select([db.func.count()]) \
+    .where(Activity.goal_id == Goal.id, Activity.status == 'completed').correlate(Goal).scalar_subquery() \
+    + db.select([db.func.count()]) \
+    .where(activity_cold.c.goal_id == Goal.id, activity_cold.c.status == 'completed').correlate(Goal).scalar_subquery()
+
+def goal_overdue(today):
+    # A goal without a target date or status is not overdue, rather than NULL
+    return db.func.coalesce(db.and_(Goal.target_date < today, Goal.status != 'completed'), False)
+
+def filtered_goals_query(args):
+    """Return the goal listing query for the status/patient filters in
+    ``args`` and the normalised filters. Each row carries the goal with its
+    patient name, care plan title, activity counts and overdue flag, all
+    fetched by the one statement."""
+    status_filter = args.get('status', 'all') or 'all'
+    patient_id = args.get('patient_id', type=int)
+    filters = {'status': status_filter}
+
+    query = db.session.query(
+        Goal,
+        (Patient.first_name + ' ' + Patient.last_name).label('patient_name'),
+        CarePlan.title.label('care_plan_title'),
+        goal_activity_count.label('activity_count'),
+        goal_completed_count.label('completed_count'),
+        goal_overdue(datetime.now().date()).label('overdue')
+    ).join(Patient, Goal.patient_id == Patient.id).join(CarePlan, Goal.care_plan_id == CarePlan.id)
+    if status_filter != 'all':
+        query = query.filter(Goal.status == status_filter)
+    if patient_id:
+        query = query.filter(Goal.patient_id == patient_id)
+        filters['patient_id'] = patient_id
+    return query.order_by(Goal.target_date, Goal.id), filters
+
+def render_fragment(template_name, macro_name, *args):
+    """Render a single macro from a partial template instead of a whole page."""
+    return get_template_attribute(template_name, macro_name)(*args)
+
+# API serializers. Each schema selects only the columns its payload needs,
+# as tuples, instead of loading whole objects and their relationships.
+PATIENT_FIELDS = (
+    Field('first_name', Patient.first_name),
+    Field('last_name', Patient.last_name),
+    Field('date_of_birth', Patient.date_of_birth, date_format('%Y-%m-%d')),
+    Field('gender', Patient.gender),
+    Field('phone', Patient.phone),
+    Field('email', Patient.email),
+    Field('address', Patient.address),
+    Field('emergency_contact', Patient.emergency_contact),
+    Field('emergency_phone', Patient.emergency_phone),
+    Field('medical_history', Patient.medical_history),
+    Field('current_medications', Patient.current_medications),
+    Field('allergies', Patient.allergies)
+)
+
+patient_schema = Schema(Field('id', Patient.id), *PATIENT_FIELDS)
+
+def patient_export_schema(today):
+    return Schema(*PATIENT_FIELDS[:3], Field('age', Patient.date_of_birth, age_on(today)), *PATIENT_FIELDS[3:])
+
+care_plan_schema = Schema(
+    Field('id', CarePlan.id),
+    Field('patient_id', CarePlan.patient_id),
+    Field('patient_name', Patient.first_name + ' ' + Patient.last_name),
+    Field('title', CarePlan.title),
+    Field('diagnosis', CarePlan.diagnosis),
+    Field('start_date', CarePlan.start_date, date_format('%Y-%m-%d')),
+    Field('end_date', CarePlan.end_date, date_format('%Y-%m-%d')),
+    Field('goals', CarePlan.goals),
+    Field('interventions', CarePlan.interventions),
+    Field('notes', CarePlan.notes),
+    Field('status', CarePlan.status),
+    joins=[(Patient, CarePlan.patient_id == Patient.id)]
+)
+
+def goal_schema(today):
+    return Schema(
+        Field('id', Goal.id),
+        Field('title', Goal.title),
+        Field('description', Goal.description),
+        Field('patient_name', Patient.first_name + ' ' + Patient.last_name),
+        Field('patient_id', Goal.patient_id),
+        Field('care_plan_title', CarePlan.title),
+        Field('care_plan_id', Goal.care_plan_id),
+        Field('target_date', Goal.target_date, date_format('%Y-%m-%d')),
+        Field('status', Goal.status),
+        Field('created_at', Goal.created_at, date_format('%Y-%m-%d %H:%M:%S')),
+        Field('activity_count', goal_activity_count),
+        Field('completed_count', goal_completed_count),
+        Field('overdue', goal_overdue(today), bool),
+        joins=[(Patient, Goal.patient_id == Patient.id), (CarePlan, Goal.care_plan_id == CarePlan.id)]
+    )
+
+ACTIVITY_JOINS = [
+    (Patient, Activity.patient_id == Patient.id),
+    (CarePlan, Activity.care_plan_id == CarePlan.id),
+    (Goal, Activity.goal_id == Goal.id)
+]
+
+activity_schema = Schema(
+    Field('id', Activity.id),
+    Field('title', Activity.title),
+    Field('description', Activity.description),
+    Field('scheduled_date', Activity.scheduled_date, iso_format),
+    Field('formatted_date', Activity.scheduled_date, date_format('%Y-%m-%d')),
+    Field('formatted_time', Activity.scheduled_date, date_format('%I:%M %p')),
+    Field('doctor_name', Activity.doctor_name),
+    Field('location', Activity.location),
+    Field('duration', Activity.duration),
+    Field('activity_type', Activity.activity_type),
+    Field('status', Activity.status),
+    Field('patient_id', Activity.patient_id),
+    Field('care_plan_id', Activity.care_plan_id),
+    Field('goal_id', Activity.goal_id),
+    Field('patient_first_name', Patient.first_name),
+    Field('patient_last_name', Patient.last_name),
+    Field('care_plan_title', CarePlan.title),
+    Field('goal_title', Goal.title),
+    joins=ACTIVITY_JOINS
+)
+
+activity_export_schema = Schema(
+    Field('title', Activity.title),
+    Field('description', Activity.description),
+    Field('date', Activity.scheduled_date, date_format('%Y-%m-%d')),
+    Field('time', Activity.scheduled_date, date_format('%I:%M %p')),
+    Field('type', Activity.activity_type),
+    Field('doctor', Activity.doctor_name),
+    Field('location', Activity.location),
+    Field('status', Activity.status),
+    Field('patient', func.coalesce(Patient.first_name + ' ' + Patient.last_name, '')),
+    Field('care_plan', func.coalesce(CarePlan.title, '')),
+    Field('goal', func.coalesce(Goal.title, '')),
+    joins=ACTIVITY_JOINS
+)
+
+def activity_payload(row):
+    """Nest the related records of an ``activity_schema`` row the way the
+    activity API has always returned them."""
+    activity = activity_schema.dump_one(row)
+    first_name, last_name = activity.pop('patient_first_name'), activity.pop('patient_last_name')
+    care_plan_title, goal_title = activity.pop('care_plan_title'), activity.pop('goal_title')
+    activity['formatted_date'] = activity['formatted_date'] or 'No date set'
+    activity['formatted_time'] = activity['formatted_time'] or 'No time set'
+    activity['patient'] = {'id': activity['patient_id'], 'first_name': first_name, 'last_name': last_name} \
+        if first_name is not None else None
+    activity['care_plan'] = {'id': activity['care_plan_id'], 'title': care_plan_title} \
+        if care_plan_title is not None else None
+    activity['goal'] = {'id': activity['goal_id'], 'title': goal_title} if goal_title is not None else None
+    return activity
+
+# Patient timeline sources: the column each kind of record is placed by on
+# the timeline, and the event it contributes. Each is read with a keyset
+# scan of its (patient_id, <date>, id) index.
+TIMELINE_SOURCES = {
+    'care_plan': (CarePlan, CarePlan.start_date, Schema(
+        Field('id', CarePlan.id),
+        Field('at', CarePlan.start_date, iso_format),
+        Field('title', CarePlan.title),
+        Field('detail', CarePlan.diagnosis),
+        Field('status', CarePlan.status)
+    )),
+    'goal': (Goal, Goal.target_date, Schema(
+        Field('id', Goal.id),
+        Field('at', Goal.target_date, iso_format),
+        Field('title', Goal.title),
+        Field('detail', Goal.description),
+        Field('status', Goal.status)
+    )),
+    'activity': (Activity, Activity.scheduled_date, Schema(
+        Field('id', Activity.id),
+        Field('at', Activity.scheduled_date, iso_format),
+        Field('title', Activity.title),
+        Field('detail', Activity.activity_type),
+        Field('status', Activity.status)
+    )),
+}
+
+def timeline_fetch(kind, patient_id, descending):
+    """Return the ``fetch(after, count)`` callable :func:`merge_timeline`
+    reads one kind of a patient's records through. Goals without a target
+    date have no place on the timeline and are left out."""
+    model, column, schema = TIMELINE_SOURCES[kind]
+    parse = datetime.fromisoformat if isinstance(column.type, db.DateTime) else \
+        (lambda value: datetime.fromisoformat(value).date())
+
+    def fetch(after, count):
+        if model is Activity:
+            # A patient's history includes their archived activities. Ids
+            # are only unique per tier, so the tier is part of the position
+            activities = hot_and_cold_activities()
+            query = Activity.query.select_entity_from(activities)
+            keys = [column, activities.c.archived, model.id]
+            fields = Schema(*schema.fields, Field('archived', activities.c.archived))
+        else:
+            query, keys, fields = model.query, [column, model.id], schema
+        query = query.filter(model.patient_id == patient_id, column.isnot(None))
+        if after is not None:
+            at, archived, id = after
+            bound = [parse(at), archived, id] if model is Activity else [parse(at), id]
+            position, bound = db.tuple_(*keys), db.tuple_(*bound)
+            query = query.filter(position < bound if descending else position > bound)
+        order = [key.desc() for key in keys] if descending else keys
+        return fields.dump(fields.project(query.order_by(*order).limit(count)).all())
+    return fetch
+
+# Conditional requests on the entity detail APIs. The ETag is derived from
+# the row's id and last-change stamp, which is a single-column lookup, so a
+# client revalidating its copy never pays for loading the relationships.
+def entity_etag(model, entity_id):
+    stamp_column = model.version if model is Goal else model.updated_at
+    row = db.session.execute(
+        db.select([model.id, stamp_column]).where(model.id == entity_id)
+    ).first()
+    if row is None:
+        abort(404)
+    stamp = row[1]
+    if isinstance(stamp, datetime):
+        stamp = stamp.isoformat()
+    return f'{model.__tablename__}-{entity_id}-{stamp}'
+
+def not_modified(etag):
+    """A 304 response if the client's cached copy is still current."""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        return with_etag(response, etag)
+    return None
+
+def precondition_failed(etag):
+    """A 412 response if If-Match names a version other than the current one."""
+    if request.if_match and not request.if_match.contains_weak(etag):
+        return edit_conflict(etag)
+    return None
+
+def edit_conflict(etag):
+    response = jsonify({
+        'success': False,
+        'message': 'This record was changed by someone else. Reload it and try again.'
+    })
+    response.status_code = 412
+    return with_etag(response, etag)
+
+def with_etag(response, etag):
+    response = make_response(response)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 # Routes
 @app.route('/')
 def index():
@@ -204,10 +1821,48 @@ def signup():
 
     return render_template('signup.html')
 
+# Google OAuth
+google_provider_cache = TTLCache(ttl=app.config['OAUTH_DISCOVERY_TTL_SECONDS'])
+oauth_call_slots = threading.BoundedSemaphore(app.config['OAUTH_MAX_CONCURRENT_CALLS'])
+
+def oauth_busy():
+    response = make_response("Google sign-in is busy right now. Please try again in a moment.", 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
+def get_google_provider_cfg():
+    """Google's discovery document, fetched at most once per TTL per process."""
+    def fetch():
+        response = requests.get(GOOGLE_DISCOVERY_URL, timeout=app.config['OAUTH_HTTP_TIMEOUT'])
+        response.raise_for_status()
+        return response.json()
+    return google_provider_cache.get('google', fetch)
+
+def oauth_request(method, url, deadline, **kwargs):
+    """Make an outbound OAuth call with (connect, read) timeouts, the read
+    timeout cut short so the call cannot outlive ``deadline``."""
+    connect_timeout, read_timeout = app.config['OAUTH_HTTP_TIMEOUT']
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise requests.Timeout('Google sign-in deadline exceeded')
+    response = requests.request(method, url, timeout=(connect_timeout, min(read_timeout, remaining)), **kwargs)
+    response.raise_for_status()
+    return response.json()
+
 @app.route('/google-login')
 def google_login():
-    # Find out what URL to hit for Google login
-    google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+    # Find out what URL to hit for Google login. Only a cache miss calls
+    # Google, but that call still counts against the OAuth slots
+    if not oauth_call_slots.acquire(blocking=False):
+        return oauth_busy()
+    try:
+        google_provider_cfg = get_google_provider_cfg()
+    except requests.RequestException as e:
+        print(f"Error fetching Google discovery document: {str(e)}")
+        flash('Google sign-in is unavailable right now. Please try again.', 'error')
+        return redirect(url_for('login'))
+    finally:
+        oauth_call_slots.release()
     authorization_endpoint = google_provider_cfg["authorization_endpoint"]
 
     # Use library to construct the request for login and provide
@@ -219,43 +1874,66 @@ def google_login():
     )
     return redirect(request_uri)
 
-@app.route('/google-login/callback')
-def google_callback():
-    # Get authorization code Google sent back to you
-    code = request.args.get("code")
-    
-    # Find out what URL to hit to get tokens that allow you to ask for
-    # things on behalf of a user
-    google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
-    token_endpoint = google_provider_cfg["token_endpoint"]
-    
+def fetch_google_userinfo(code):
+    """Exchange the authorization code and fetch the user's profile.
+
+    The discovery document is served from cache when possible, which
+    leaves the token and userinfo calls; the second needs the first's
+    token, so they run one after the other. Both share one deadline, which
+    bounds how long a callback can hold a worker.
+    """
+    deadline = time.monotonic() + app.config['OAUTH_CALLBACK_TIMEOUT_SECONDS']
+    # A client per request: the shared one stores the parsed token, which
+    # concurrent callbacks would overwrite
+    oauth_client = WebApplicationClient(GOOGLE_CLIENT_ID)
+    google_provider_cfg = get_google_provider_cfg()
+
     # Prepare and send request to get tokens
-    token_url, headers, body = client.prepare_token_request(
-        token_endpoint,
+    token_url, headers, body = oauth_client.prepare_token_request(
+        google_provider_cfg["token_endpoint"],
         authorization_response=request.url,
         redirect_url=request.base_url,
         code=code
     )
-    token_response = requests.post(
+    token_response = oauth_request(
+        'POST',
         token_url,
+        deadline,
         headers=headers,
         data=body,
         auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
     )
 
-    # Parse the tokens
-    client.parse_request_body_response(json.dumps(token_response.json()))
-    
-    # Now that we have tokens, let's find and hit URL
-    # from Google that gives you user's profile information
-    userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
-    uri, headers, body = client.add_token(userinfo_endpoint)
-    userinfo_response = requests.get(uri, headers=headers, data=body)
-    
-    if userinfo_response.json().get("email_verified"):
-        unique_id = userinfo_response.json()["sub"]
-        users_email = userinfo_response.json()["email"]
-        users_name = userinfo_response.json()["given_name"]
+    # Parse the tokens, then ask Google for the user's profile information
+    oauth_client.parse_request_body_response(json.dumps(token_response))
+    uri, headers, body = oauth_client.add_token(google_provider_cfg["userinfo_endpoint"])
+    return oauth_request('GET', uri, deadline, headers=headers, data=body)
+
+@app.route('/google-login/callback')
+def google_callback():
+    # Get authorization code Google sent back to you
+    code = request.args.get("code")
+
+    # At most OAUTH_MAX_CONCURRENT_CALLS threads wait on Google at once; a
+    # slow Google turns extra callbacks away instead of tying up every
+    # worker the other routes need
+    if not oauth_call_slots.acquire(blocking=False):
+        return oauth_busy()
+    try:
+        userinfo = fetch_google_userinfo(code)
+    except requests.Timeout:
+        print("Google sign-in timed out")
+        return "Google sign-in timed out. Please try again.", 504
+    except requests.RequestException as e:
+        print(f"Error during Google sign-in: {str(e)}")
+        return "Could not complete Google sign-in. Please try again.", 502
+    finally:
+        oauth_call_slots.release()
+
+    if userinfo.get("email_verified"):
+        unique_id = userinfo["sub"]
+        users_email = userinfo["email"]
+        users_name = userinfo["given_name"]
         
         # Check if user exists, if not create new user
         user = User.query.filter_by(email=users_email).first()
@@ -266,8 +1944,13 @@ def google_callback():
                 email=users_email,
                 role='patient'  # Default role
             )
-            db.session.add(user)
-            db.session.commit()
+            try:
+                db.session.add(user)
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent callback for the same account created it first
+                db.session.rollback()
+                user = User.query.filter_by(email=users_email).first()
         
         # Begin user session
         login_user(user)
@@ -285,67 +1968,58 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html')
+    return render_template('dashboard.html', summary=get_dashboard_summary(current_user.id))
+
+@app.route('/api/dashboard/summary')
+@login_required
+def get_dashboard_summary_api():
+    try:
+        return jsonify({
+            'success': True,
+            'summary': get_dashboard_summary(current_user.id)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/metrics/audit')
+@login_required
+def get_audit_metrics():
+    return jsonify({
+        'success': True,
+        'metrics': audit_writer.stats()
+    })
+
+@app.route('/api/metrics/compression')
+@login_required
+def get_compression_metrics():
+    return jsonify({
+        'success': True,
+        'metrics': compression_stats.snapshot()
+    })
 
 @app.route('/patients')
 @login_required
 def patients():
     try:
-        # Get search and filter parameters
-        search_term = request.args.get('search', '').lower()
-        gender_filter = request.args.get('gender', 'all')
-        age_filter = request.args.get('age', 'all')
-        
-        # Base query
-        query = Patient.query
-        
-        # Apply search
-        if search_term:
-            query = query.filter(
-                db.or_(
-                    Patient.first_name.ilike(f'%{search_term}%'),
-                    Patient.last_name.ilike(f'%{search_term}%'),
-                    Patient.email.ilike(f'%{search_term}%'),
-                    Patient.phone.ilike(f'%{search_term}%')
-                )
-            )
-        
-        # Apply gender filter
-        if gender_filter != 'all':
-            query = query.filter(Patient.gender == gender_filter)
-        
-        # Apply age filter
-        if age_filter != 'all':
-            today = datetime.now().date()
-            if age_filter == '0-18':
-                query = query.filter(Patient.date_of_birth >= today - timedelta(days=18*365))
-            elif age_filter == '19-30':
-                query = query.filter(
-                    Patient.date_of_birth < today - timedelta(days=18*365),
-                    Patient.date_of_birth >= today - timedelta(days=30*365)
-                )
-            elif age_filter == '31-50':
-                query = query.filter(
-                    Patient.date_of_birth < today - timedelta(days=30*365),
-                    Patient.date_of_birth >= today - timedelta(days=50*365)
-                )
-            elif age_filter == '50+':
-                query = query.filter(Patient.date_of_birth < today - timedelta(days=50*365))
-        
-        # Get patients
-        patients_list = query.order_by(Patient.first_name).all()
+        query, filters = filtered_patients_query(request.args)
+        page, per_page = page_args()
         
         return render_template('patients.html', 
-            patients=patients_list,
-            search_term=search_term,
-            gender_filter=gender_filter,
-            age_filter=age_filter,
+            patient_page=query.paginate(page=page, per_page=per_page, error_out=False),
+            filters=filters,
+            search_term=filters['search'],
+            gender_filter=filters['gender'],
+            age_filter=filters['age'],
             now=datetime.now
         )
     except Exception as e:
         print(f"Error in patients route: {str(e)}")
         return render_template('patients.html', 
-            patients=[],
+            patient_page=None,
+            filters={},
             search_term='',
             gender_filter='all',
             age_filter='all',
@@ -353,6 +2027,17 @@ def patients():
             error="An error occurred while loading patients."
         )
 
+@app.route('/fragments/patients')
+@login_required
+def patients_fragment():
+    query, filters = filtered_patients_query(request.args)
+    page, per_page = page_args()
+    return render_fragment('partials/patient_list.html', 'patient_list',
+        query.paginate(page=page, per_page=per_page, error_out=False),
+        filters,
+        datetime.now().date()
+    )
+
 @app.route('/add-patient', methods=['POST'])
 @login_required
 def add_patient():
@@ -407,6 +2092,16 @@ def add_patient():
             )
             
             print("Created patient object:", new_patient.__dict__)
+
+            # Ask before adding someone who looks like an existing patient
+            if request.form.get('allow_duplicate', 'false').lower() not in ('1', 'true'):
+                duplicates = find_duplicate_patients(new_patient)
+                if duplicates:
+                    return jsonify({
+                        'success': False,
+                        'message': 'This patient may already exist.',
+                        'duplicates': [duplicate_payload(patient, score) for patient, score in duplicates]
+                    })
             
             db.session.add(new_patient)
             db.session.commit()
@@ -444,9 +2139,26 @@ def messages():
 @app.route('/care-plans')
 @login_required
 def care_plans():
-    patients = Patient.query.all()
-    care_plans_list = CarePlan.query.all()
-    return render_template('care_plans.html', patients=patients, care_plans=care_plans_list)
+    query, filters = filtered_care_plans_query(request.args)
+    page, per_page = page_args()
+    care_plan_page = query.paginate(page=page, per_page=per_page, error_out=False)
+    return render_template('care_plans.html',
+        care_plan_page=care_plan_page,
+        care_plan_counts=care_plan_counts(care_plan_page.items),
+        filters=filters
+    )
+
+@app.route('/fragments/care-plans')
+@login_required
+def care_plans_fragment():
+    query, filters = filtered_care_plans_query(request.args)
+    page, per_page = page_args()
+    care_plan_page = query.paginate(page=page, per_page=per_page, error_out=False)
+    return render_fragment('partials/care_plan_list.html', 'care_plan_list',
+        care_plan_page,
+        filters,
+        care_plan_counts(care_plan_page.items)
+    )
 
 @app.route('/add-care-plan', methods=['POST'])
 @login_required
@@ -483,10 +2195,18 @@ def add_care_plan():
                 'success': False,
                 'message': 'Invalid date format. Please use YYYY-MM-DD format.'
             })
+
+        # The patient must belong to the current clinic
+        patient = Patient.query.filter(Patient.id == request.form.get('patient_id')).first()
+        if patient is None:
+            return jsonify({
+                'success': False,
+                'message': 'Patient not found.'
+            }), 404
         
         # Create new care plan
         new_care_plan = CarePlan(
-            patient_id=request.form.get('patient_id'),
+            patient_id=patient.id,
             title=request.form.get('title'),
             diagnosis=request.form.get('diagnosis'),
             start_date=start_date,
@@ -501,6 +2221,8 @@ def add_care_plan():
         
         try:
             db.session.add(new_care_plan)
+            db.session.flush()
+            notify_care_plan_created(new_care_plan)
             db.session.commit()
             print("Successfully added care plan to database")
             
@@ -531,30 +2253,41 @@ def add_care_plan():
 @app.route('/goals')
 @login_required
 def goals():
-    patients = Patient.query.all()
-    goals_list = Goal.query.all()
-    return render_template('goals.html', patients=patients, goals=goals_list)
+    query, filters = filtered_goals_query(request.args)
+    page, per_page = page_args()
+    return render_template('goals.html',
+        goal_page=query.paginate(page=page, per_page=per_page, error_out=False),
+        filters=filters
+    )
+
+@app.route('/fragments/goals')
+@login_required
+def goals_fragment():
+    query, filters = filtered_goals_query(request.args)
+    page, per_page = page_args()
+    return render_fragment('partials/goal_list.html', 'goal_list',
+        query.paginate(page=page, per_page=per_page, error_out=False),
+        filters
+    )
 
 @app.route('/goals/<int:goal_id>')
 @login_required
 def view_goal(goal_id):
-    goal = Goal.query.get_or_404(goal_id)
-    return jsonify({
-        'id': goal.id,
-        'title': goal.title,
-        'description': goal.description,
-        'patient_name': f"{goal.patient.first_name} {goal.patient.last_name}",
-        'patient_id': goal.patient_id,
-        'care_plan_title': goal.care_plan.title,
-        'care_plan_id': goal.care_plan_id,
-        'target_date': goal.target_date.strftime('%Y-%m-%d'),
-        'status': goal.status,
-        'created_at': goal.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    })
+    etag = entity_etag(Goal, goal_id)
+    audit('read', 'goal', goal_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    schema = goal_schema(datetime.now().date())
+    row = schema.project(Goal.query.filter(Goal.id == goal_id)).first_or_404()
+    return with_etag(jsonify(schema.dump_one(row)), etag)
 
 @app.route('/goals/<int:goal_id>/edit', methods=['POST'])
 @login_required
 def edit_goal(goal_id):
+    conflict = precondition_failed(entity_etag(Goal, goal_id))
+    if conflict:
+        return conflict
     try:
         goal = Goal.query.get_or_404(goal_id)
         
@@ -591,11 +2324,15 @@ def edit_goal(goal_id):
             db.session.commit()
             print("Successfully updated goal")
             
-            return jsonify({
+            return with_etag(jsonify({
                 'success': True,
                 'message': 'Goal updated successfully',
                 'redirect_url': url_for('goals')
-            })
+            }), entity_etag(Goal, goal_id))
+        except StaleDataError:
+            # Another request saved the goal between our read and this write
+            db.session.rollback()
+            return edit_conflict(entity_etag(Goal, goal_id))
         except Exception as db_error:
             db.session.rollback()
             print(f"Database error: {str(db_error)}")
@@ -637,11 +2374,22 @@ def add_goal():
                 'success': False,
                 'message': 'Invalid date format. Please use YYYY-MM-DD format.'
             })
+
+        # The care plan must belong to the current clinic and to the patient
+        care_plan = CarePlan.query.filter(
+            CarePlan.id == request.form.get('care_plan_id'),
+            CarePlan.patient_id == request.form.get('patient_id')
+        ).first()
+        if care_plan is None:
+            return jsonify({
+                'success': False,
+                'message': 'Care plan not found.'
+            }), 404
         
         # Create new goal
         new_goal = Goal(
-            patient_id=request.form.get('patient_id'),
-            care_plan_id=request.form.get('care_plan_id'),
+            patient_id=care_plan.patient_id,
+            care_plan_id=care_plan.id,
             title=request.form.get('title'),
             description=request.form.get('description'),
             target_date=target_date,
@@ -683,35 +2431,21 @@ def activities():
         # Get current month for calendar
         current_month = datetime.now()
         
-        # Get search and filter parameters
-        search_term = request.args.get('search', '').lower()
-        activity_type = request.args.get('type', 'all')
-        status_filter = request.args.get('status', 'all')
-        
-        # Base query
-        query = Activity.query
-        
-        # Apply filters
-        if activity_type != 'all':
-            query = query.filter(Activity.activity_type == activity_type)
-        if status_filter != 'all':
-            query = query.filter(Activity.status == status_filter)
-        if search_term:
-            query = query.filter(
-                db.or_(
-                    Activity.title.ilike(f'%{search_term}%'),
-                    Activity.description.ilike(f'%{search_term}%'),
-                    Activity.doctor_name.ilike(f'%{search_term}%'),
-                    Activity.location.ilike(f'%{search_term}%')
-                )
-            )
+        query, filters = filtered_activities_query(request.args)
+        page, per_page = page_args()
         
-        # Get all activities or filter by status
-        all_activities = query.order_by(Activity.scheduled_date.desc()).all()
+        # The calendar shows six weeks starting on the Sunday on or before
+        # the 1st; only those activities are loaded, not the whole table
+        month_start = current_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        calendar_start = month_start - timedelta(days=(month_start.weekday() + 1) % 7)
+        calendar_activities = query.filter(
+            Activity.scheduled_date >= calendar_start,
+            Activity.scheduled_date < calendar_start + timedelta(days=42)
+        )
         
         # Get activities grouped by date for calendar
         activities_by_date = {}
-        for activity in all_activities:
+        for activity in calendar_activities:
             date_key = activity.scheduled_date.strftime('%Y-%m-%d')
             if date_key not in activities_by_date:
                 activities_by_date[date_key] = []
@@ -725,29 +2459,27 @@ def activities():
                 'status': activity.status
             })
         
-        # Get all patients for the schedule activity form
-        patients = Patient.query.order_by(Patient.first_name).all()
-        
-        # Get all doctors for the schedule activity form
-        doctors = User.query.filter_by(role='doctor').all()
+        # Get the clinic's doctors for the schedule activity form; users
+        # are not clinic-scoped, so filter by clinic here
+        doctors = User.query.filter_by(role='doctor', clinic_id=current_user.clinic_id).all()
         
         return render_template('activities.html', 
             current_month=current_month,
             activities_by_date=activities_by_date,
-            all_activities=all_activities,
-            patients=patients,
+            activity_page=query.paginate(page=page, per_page=per_page, error_out=False),
+            filters=filters,
             doctors=doctors,
-            status_filter=status_filter or 'all',
-            activity_type=activity_type,
-            search_term=search_term
+            status_filter=filters['status'],
+            activity_type=filters['type'],
+            search_term=filters['search']
         )
     except Exception as e:
         print(f"Error in activities route: {str(e)}")
         return render_template('activities.html', 
             current_month=datetime.now(),
             activities_by_date={},
-            all_activities=[],
-            patients=[],
+            activity_page=None,
+            filters={},
             doctors=[],
             status_filter='all',
             activity_type='all',
@@ -755,6 +2487,16 @@ def activities():
             error="An error occurred while loading activities."
         )
 
+@app.route('/fragments/activities')
+@login_required
+def activities_fragment():
+    query, filters = filtered_activities_query(request.args)
+    page, per_page = page_args()
+    return render_fragment('partials/activity_list.html', 'activity_list',
+        query.paginate(page=page, per_page=per_page, error_out=False),
+        filters
+    )
+
 @app.route('/add_activity', methods=['POST'])
 @login_required
 def add_activity():
@@ -827,12 +2569,42 @@ def add_activity():
                 'success': False,
                 'message': 'Invalid date, time, or duration format.'
             }), 400
+        if not 0 < duration <= app.config['MAX_ACTIVITY_DURATION_MINUTES']:
+            return jsonify({
+                'success': False,
+                'message': f"Duration must be between 1 and {app.config['MAX_ACTIVITY_DURATION_MINUTES']} minutes."
+            }), 400
+
+        # The care plan and goal must belong to the current clinic and to the patient
+        care_plan = CarePlan.query.filter(
+            CarePlan.id == care_plan_id,
+            CarePlan.patient_id == patient_id
+        ).first()
+        if care_plan is None:
+            return jsonify({
+                'success': False,
+                'message': 'Care plan not found.'
+            }), 404
+        goal = None
+        if goal_id:
+            goal = Goal.query.filter(Goal.id == goal_id, Goal.care_plan_id == care_plan.id).first()
+            if goal is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Goal not found.'
+                }), 404
+
+        # Reject double bookings for the doctor or the location
+        conflicts = find_schedule_conflicts(doctor_name, scheduled_date, duration, location=location)
+        if conflicts:
+            print(f"\nSchedule conflict with activities: {[a.id for a in conflicts]}")
+            return schedule_conflict_response(conflicts, doctor_name, location)
 
         # Create new activity
         new_activity = Activity(
-            patient_id=patient_id,
-            care_plan_id=care_plan_id,
-            goal_id=goal_id if goal_id else None,
+            patient_id=care_plan.patient_id,
+            care_plan_id=care_plan.id,
+            goal_id=goal.id if goal else None,
             title=title,
             description=description,
             scheduled_date=scheduled_date,
@@ -848,6 +2620,8 @@ def add_activity():
 
         # Add to database
         db.session.add(new_activity)
+        db.session.flush()
+        notify_activity_scheduled(new_activity)
         db.session.commit()
         print("\nSuccessfully added activity to database")
         
@@ -874,6 +2648,8 @@ def add_activity():
 
 @app.route('/analytics')
 @login_required
+@admission('analytics')
+@read_from_snapshot
 def analytics():
     try:
         # Treatment Outcomes Data
@@ -915,7 +2691,35 @@ def analytics():
 @app.route('/notifications')
 @login_required
 def notifications():
-    return render_template('notifications.html')
+    notifications_list = Notification.query.filter_by(user_id=current_user.id)\
+        .order_by(Notification.created_at.desc())\
+        .limit(100).all()
+    return render_template('notifications.html', notifications=notifications_list)
+
+@app.route('/api/notifications/unread-count')
+@login_required
+def get_unread_notification_count():
+    return jsonify({'unread': unread_notification_count(current_user.id)})
+
+@app.route('/api/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_as_read():
+    try:
+        data = request.get_json(silent=True) or {}
+        updated = mark_notifications_read(
+            current_user.id,
+            notification_ids=data.get('ids'),
+            type=data.get('type')
+        )
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'unread': unread_notification_count(current_user.id)
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/profile')
 @login_required
@@ -956,21 +2760,14 @@ def get_care_plan_goals(care_plan_id):
 @app.route('/api/care-plan/<int:care_plan_id>')
 @login_required
 def get_care_plan(care_plan_id):
+    etag = entity_etag(CarePlan, care_plan_id)
+    audit('read', 'care_plan', care_plan_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     try:
-        care_plan = CarePlan.query.get_or_404(care_plan_id)
-        return jsonify({
-            'id': care_plan.id,
-            'patient_id': care_plan.patient_id,
-            'patient_name': f"{care_plan.patient.first_name} {care_plan.patient.last_name}",
-            'title': care_plan.title,
-            'diagnosis': care_plan.diagnosis,
-            'start_date': care_plan.start_date.strftime('%Y-%m-%d'),
-            'end_date': care_plan.end_date.strftime('%Y-%m-%d'),
-            'goals': care_plan.goals,
-            'interventions': care_plan.interventions,
-            'notes': care_plan.notes,
-            'status': care_plan.status
-        })
+        row = care_plan_schema.project(CarePlan.query.filter(CarePlan.id == care_plan_id)).first_or_404()
+        return with_etag(jsonify(care_plan_schema.dump_one(row)), etag)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -980,6 +2777,9 @@ def get_care_plan(care_plan_id):
 @app.route('/api/care-plan/<int:care_plan_id>', methods=['PUT'])
 @login_required
 def update_care_plan(care_plan_id):
+    conflict = precondition_failed(entity_etag(CarePlan, care_plan_id))
+    if conflict:
+        return conflict
     try:
         care_plan = CarePlan.query.get_or_404(care_plan_id)
         
@@ -994,10 +2794,10 @@ def update_care_plan(care_plan_id):
         
         db.session.commit()
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'message': 'Care plan updated successfully'
-        })
+        }), entity_etag(CarePlan, care_plan_id))
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -1008,14 +2808,26 @@ def update_care_plan(care_plan_id):
 @app.route('/api/care-plan/<int:care_plan_id>', methods=['DELETE'])
 @login_required
 def delete_care_plan(care_plan_id):
+    return remove_care_plan(care_plan_id, archive=False)
+
+@app.route('/api/care-plan/<int:care_plan_id>/archive', methods=['POST'])
+@login_required
+def archive_care_plan(care_plan_id):
+    return remove_care_plan(care_plan_id, archive=True)
+
+def remove_care_plan(care_plan_id, archive):
+    # ?dry_run=1 reports what would be removed without touching anything
+    dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true')
+    if db.session.query(CarePlan.id).filter(CarePlan.id == care_plan_id).first() is None:
+        abort(404)
     try:
-        care_plan = CarePlan.query.get_or_404(care_plan_id)
-        db.session.delete(care_plan)
-        db.session.commit()
-        
+        counts = remove_subtrees(care_plan_subtree, [care_plan_id], archive=archive, dry_run=dry_run)
+        action = 'archived' if archive else 'deleted'
         return jsonify({
             'success': True,
-            'message': 'Care plan deleted successfully'
+            'dry_run': dry_run,
+            'counts': counts,
+            'message': f'Care plan would be {action}' if dry_run else f'Care plan {action} successfully'
         })
     except Exception as e:
         db.session.rollback()
@@ -1024,26 +2836,43 @@ def delete_care_plan(care_plan_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/patient/<int:patient_id>/timeline')
+@login_required
+def patient_timeline(patient_id):
+    """A patient's care plans, goals and activities as one chronological
+    feed, newest first unless ``order=asc``. Pass the returned
+    ``next_cursor`` back as ``cursor`` for the following page."""
+    if db.session.query(Patient.id).filter(Patient.id == patient_id).first() is None:
+        abort(404)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    positions, descending = None, request.args.get('order', 'desc') != 'asc'
+    if request.args.get('cursor'):
+        try:
+            positions, descending = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    audit('read', 'patient', patient_id)
+    try:
+        sources = {kind: timeline_fetch(kind, patient_id, descending) for kind in TIMELINE_SOURCES}
+        events, next_cursor = merge_timeline(sources, positions, limit, descending)
+        return jsonify({'events': events, 'next_cursor': next_cursor})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @app.route('/api/patient/<int:patient_id>')
 @login_required
 def get_patient(patient_id):
+    etag = entity_etag(Patient, patient_id)
+    audit('read', 'patient', patient_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     try:
-        patient = Patient.query.get_or_404(patient_id)
-        return jsonify({
-            'id': patient.id,
-            'first_name': patient.first_name,
-            'last_name': patient.last_name,
-            'date_of_birth': patient.date_of_birth.strftime('%Y-%m-%d'),
-            'gender': patient.gender,
-            'phone': patient.phone,
-            'email': patient.email,
-            'address': patient.address,
-            'emergency_contact': patient.emergency_contact,
-            'emergency_phone': patient.emergency_phone,
-            'medical_history': patient.medical_history,
-            'current_medications': patient.current_medications,
-            'allergies': patient.allergies
-        })
+        row = patient_schema.project(Patient.query.filter(Patient.id == patient_id)).first_or_404()
+        return with_etag(jsonify(patient_schema.dump_one(row)), etag)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1053,6 +2882,9 @@ def get_patient(patient_id):
 @app.route('/api/patient/<int:patient_id>', methods=['PUT'])
 @login_required
 def update_patient(patient_id):
+    conflict = precondition_failed(entity_etag(Patient, patient_id))
+    if conflict:
+        return conflict
     try:
         patient = Patient.query.get_or_404(patient_id)
         
@@ -1072,10 +2904,10 @@ def update_patient(patient_id):
         
         db.session.commit()
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'message': 'Patient updated successfully'
-        })
+        }), entity_etag(Patient, patient_id))
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -1086,14 +2918,26 @@ def update_patient(patient_id):
 @app.route('/api/patient/<int:patient_id>', methods=['DELETE'])
 @login_required
 def delete_patient(patient_id):
+    return remove_patient(patient_id, archive=False)
+
+@app.route('/api/patient/<int:patient_id>/archive', methods=['POST'])
+@login_required
+def archive_patient(patient_id):
+    return remove_patient(patient_id, archive=True)
+
+def remove_patient(patient_id, archive):
+    # ?dry_run=1 reports what would be removed without touching anything
+    dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true')
+    if db.session.query(Patient.id).filter(Patient.id == patient_id).first() is None:
+        abort(404)
     try:
-        patient = Patient.query.get_or_404(patient_id)
-        db.session.delete(patient)
-        db.session.commit()
-        
+        counts = remove_subtrees(patient_subtree, [patient_id], archive=archive, dry_run=dry_run)
+        action = 'archived' if archive else 'deleted'
         return jsonify({
             'success': True,
-            'message': 'Patient deleted successfully'
+            'dry_run': dry_run,
+            'counts': counts,
+            'message': f'Patient would be {action}' if dry_run else f'Patient {action} successfully'
         })
     except Exception as e:
         db.session.rollback()
@@ -1176,10 +3020,15 @@ def create_activity():
                 'message': 'No patients found in the system.'
             }), 400
 
+        scheduled_date = datetime.fromisoformat(data['scheduled_date'].replace('Z', '+00:00'))
+        conflicts = find_schedule_conflicts(data.get('doctor_name'), scheduled_date, None, location=data.get('location'))
+        if conflicts:
+            return schedule_conflict_response(conflicts, data.get('doctor_name'), data.get('location'))
+
         new_activity = Activity(
             title=data['title'],
             description=data.get('description', ''),
-            scheduled_date=datetime.fromisoformat(data['scheduled_date'].replace('Z', '+00:00')),
+            scheduled_date=scheduled_date,
             patient_id=patient.id,  # Using the first patient's ID
             activity_type='appointment',
             location=data.get('location'),
@@ -1187,6 +3036,8 @@ def create_activity():
             enable_reminder=data.get('enable_reminder', True)
         )
         db.session.add(new_activity)
+        db.session.flush()
+        notify_activity_scheduled(new_activity)
         db.session.commit()
         
         return jsonify({
@@ -1211,46 +3062,26 @@ def create_activity():
 @app.route('/api/activity/<int:activity_id>', methods=['GET'])
 @login_required
 def get_activity(activity_id):
+    etag = entity_etag(Activity, activity_id)
+    audit('read', 'activity', activity_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     try:
-        activity = Activity.query.get_or_404(activity_id)
-        return jsonify({
+        row = activity_schema.project(Activity.query.filter(Activity.id == activity_id)).first_or_404()
+        return with_etag(jsonify({
             'success': True,
-            'activity': {
-                'id': activity.id,
-                'title': activity.title,
-                'description': activity.description,
-                'scheduled_date': activity.scheduled_date.isoformat() if activity.scheduled_date else None,
-                'formatted_date': activity.formatted_date,
-                'formatted_time': activity.formatted_time,
-                'doctor_name': activity.doctor_name,
-                'location': activity.location,
-                'duration': activity.duration,
-                'activity_type': activity.activity_type,
-                'status': activity.status,
-                'patient_id': activity.patient_id,
-                'care_plan_id': activity.care_plan_id,
-                'goal_id': activity.goal_id,
-                'patient': {
-                    'id': activity.patient.id,
-                    'first_name': activity.patient.first_name,
-                    'last_name': activity.patient.last_name
-                } if activity.patient else None,
-                'care_plan': {
-                    'id': activity.care_plan.id,
-                    'title': activity.care_plan.title
-                } if activity.care_plan else None,
-                'goal': {
-                    'id': activity.goal.id,
-                    'title': activity.goal.title
-                } if activity.goal else None
-            }
-        })
+            'activity': activity_payload(row)
+        }), etag)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
 @app.route('/api/activity/<int:activity_id>', methods=['PUT'])
 @login_required
 def update_activity(activity_id):
+    conflict = precondition_failed(entity_etag(Activity, activity_id))
+    if conflict:
+        return conflict
     try:
         activity = Activity.query.get_or_404(activity_id)
         data = request.get_json()
@@ -1261,13 +3092,22 @@ def update_activity(activity_id):
                 'message': 'Title and scheduled date are required.'
             }), 400
         
+        scheduled_date = datetime.fromisoformat(data['scheduled_date'])
+        status = data.get('status', activity.status)
+        if status != 'cancelled':
+            conflicts = find_schedule_conflicts(activity.doctor_name, scheduled_date, activity.duration,
+                                                exclude_id=activity.id, location=activity.location)
+            if conflicts:
+                return schedule_conflict_response(conflicts, activity.doctor_name, activity.location)
+
         activity.title = data['title']
         activity.description = data.get('description', '')
-        activity.scheduled_date = datetime.fromisoformat(data['scheduled_date'])
-        activity.status = data.get('status', activity.status)
+        activity.scheduled_date = scheduled_date
+        activity.status = status
         
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Activity updated successfully'})
+        return with_etag(jsonify({'success': True, 'message': 'Activity updated successfully'}),
+                         entity_etag(Activity, activity_id))
     except ValueError as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Invalid date format'}), 400
@@ -1275,6 +3115,55 @@ def update_activity(activity_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
 
+@app.route('/api/activities/status', methods=['POST'])
+@login_required
+def bulk_update_activities():
+    """Change the status of many activities at once, picked either by
+    ``ids`` or by a ``filter`` of ``from``/``to`` (ISO dates, ``to``
+    exclusive), ``doctor`` and current ``status``."""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Expected a JSON object.'}), 400
+    status = data.get('status')
+    if status not in BULK_ACTIVITY_STATUSES:
+        return jsonify({
+            'success': False,
+            'message': f"Status must be one of: {', '.join(BULK_ACTIVITY_STATUSES)}."
+        }), 400
+
+    criteria = []
+    ids = data.get('ids')
+    filters = data.get('filter') or {}
+    try:
+        if ids is not None:
+            if not isinstance(ids, list) or not 0 < len(ids) <= app.config['BULK_UPDATE_MAX_ROWS']:
+                raise ValueError
+            criteria.append(Activity.id.in_([int(activity_id) for activity_id in ids]))
+        if filters.get('from'):
+            criteria.append(Activity.scheduled_date >= datetime.fromisoformat(filters['from']))
+        if filters.get('to'):
+            criteria.append(Activity.scheduled_date < datetime.fromisoformat(filters['to']))
+        if filters.get('doctor'):
+            criteria.append(Activity.doctor_name == filters['doctor'])
+        if filters.get('status'):
+            criteria.append(Activity.status == filters['status'])
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Invalid ids or filter.'}), 400
+    if not criteria:
+        # Never update the whole table by accident
+        return jsonify({
+            'success': False,
+            'message': 'Give the ids to update or at least one filter.'
+        }), 400
+
+    try:
+        updated = bulk_update_activity_status(criteria, status, app.config['BULK_UPDATE_MAX_ROWS'])
+        return jsonify({'success': True, 'updated': len(updated), 'ids': updated})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/activity/<int:activity_id>', methods=['DELETE'])
 @login_required
 def delete_activity(activity_id):
@@ -1287,6 +3176,70 @@ def delete_activity(activity_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
 
+@app.route('/api/slots')
+@login_required
+def get_free_slots():
+    try:
+        doctor_name = request.args.get('doctor')
+        location = request.args.get('location')
+        if not doctor_name and not location:
+            return jsonify({
+                'success': False,
+                'message': 'A doctor or location is required.'
+            }), 400
+
+        try:
+            duration = int(request.args.get('duration', app.config['DEFAULT_ACTIVITY_DURATION_MINUTES']))
+            limit = min(int(request.args.get('limit', 10)), 100)
+            start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.now()
+            end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=14)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid duration, limit or date format.'
+            }), 400
+
+        if duration <= 0 or limit <= 0 or end <= start:
+            return jsonify({
+                'success': False,
+                'message': 'Duration and limit must be positive and "to" must be after "from".'
+            }), 400
+        if end - start > timedelta(days=app.config['SLOT_MAX_HORIZON_DAYS']):
+            return jsonify({
+                'success': False,
+                'message': f"The search window can be at most {app.config['SLOT_MAX_HORIZON_DAYS']} days."
+            }), 400
+
+        start = start.replace(second=0, microsecond=0, tzinfo=None)
+        end = end.replace(tzinfo=None)
+        windows = working_windows(
+            start, end,
+            datetime.strptime(app.config['WORKING_HOURS_START'], '%H:%M').time(),
+            datetime.strptime(app.config['WORKING_HOURS_END'], '%H:%M').time(),
+            app.config['WORKING_DAYS']
+        )
+        slots = free_slots(
+            busy_intervals(start, end, doctor_name, location),
+            windows,
+            timedelta(minutes=duration),
+            limit,
+            step=timedelta(minutes=app.config['SLOT_STEP_MINUTES'])
+        )
+        return jsonify({
+            'success': True,
+            'slots': [{
+                'start': slot_start.isoformat(),
+                'end': slot_end.isoformat(),
+                'date': slot_start.strftime('%Y-%m-%d'),
+                'time': slot_start.strftime('%H:%M')
+            } for slot_start, slot_end in slots]
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @app.route('/api/patients')
 @login_required
 def get_patients():
@@ -1300,56 +3253,38 @@ def get_patients():
     except Exception as e:
         return jsonify([]), 500
 
+@app.route('/api/patients/search')
+@login_required
+@admission('search')
+def search_patients():
+    try:
+        term = request.args.get('q', '')
+        limit = min(max(request.args.get('limit', app.config['PATIENT_SEARCH_LIMIT'], type=int), 1), 100)
+        return jsonify(ensure_patient_index().search(term, limit))
+    except Exception as e:
+        return jsonify([]), 500
+
+EXPORT_KINDS = ('patients', 'activities')
+
+def export_data(kind, args):
+    """Rows of the patient or activity export for the list filters in ``args``."""
+    if kind == 'patients':
+        query, filters = filtered_patients_query(args)
+        schema = patient_export_schema(datetime.now().date())
+    else:
+        query, filters = filtered_activities_query(args)
+        schema = activity_export_schema
+    return schema.dump(schema.project(query).all())
+
 @app.route('/api/activities/export')
 @login_required
+@admission('export')
+@read_from_snapshot
 def export_activities():
     try:
-        # Get filter parameters
-        activity_type = request.args.get('type', 'all')
-        status_filter = request.args.get('status', 'all')
-        search_term = request.args.get('search', '').lower()
-        
-        # Base query
-        query = Activity.query
-        
-        # Apply filters
-        if activity_type != 'all':
-            query = query.filter(Activity.activity_type == activity_type)
-        if status_filter != 'all':
-            query = query.filter(Activity.status == status_filter)
-        if search_term:
-            query = query.filter(
-                db.or_(
-                    Activity.title.ilike(f'%{search_term}%'),
-                    Activity.description.ilike(f'%{search_term}%'),
-                    Activity.doctor_name.ilike(f'%{search_term}%'),
-                    Activity.location.ilike(f'%{search_term}%')
-                )
-            )
-        
-        # Get activities
-        activities = query.order_by(Activity.scheduled_date.desc()).all()
-        
-        # Format data for export
-        export_data = []
-        for activity in activities:
-            export_data.append({
-                'title': activity.title,
-                'description': activity.description,
-                'date': activity.scheduled_date.strftime('%Y-%m-%d'),
-                'time': activity.scheduled_date.strftime('%I:%M %p'),
-                'type': activity.activity_type,
-                'doctor': activity.doctor_name,
-                'location': activity.location,
-                'status': activity.status,
-                'patient': f"{activity.patient.first_name} {activity.patient.last_name}" if activity.patient else '',
-                'care_plan': activity.care_plan.title if activity.care_plan else '',
-                'goal': activity.goal.title if activity.goal else ''
-            })
-        
         return jsonify({
             'success': True,
-            'data': export_data
+            'data': export_data('activities', request.args)
         })
     except Exception as e:
         return jsonify({
@@ -1359,86 +3294,255 @@ def export_activities():
 
 @app.route('/api/patients/export')
 @login_required
+@admission('export')
+@read_from_snapshot
 def export_patients():
     try:
-        # Get filter parameters
-        search_term = request.args.get('search', '').lower()
-        gender_filter = request.args.get('gender', 'all')
-        age_filter = request.args.get('age', 'all')
-        
-        # Base query
-        query = Patient.query
-        
-        # Apply search
-        if search_term:
-            query = query.filter(
-                db.or_(
-                    Patient.first_name.ilike(f'%{search_term}%'),
-                    Patient.last_name.ilike(f'%{search_term}%'),
-                    Patient.email.ilike(f'%{search_term}%'),
-                    Patient.phone.ilike(f'%{search_term}%')
-                )
-            )
-        
-        # Apply gender filter
-        if gender_filter != 'all':
-            query = query.filter(Patient.gender == gender_filter)
-        
-        # Apply age filter
-        if age_filter != 'all':
-            today = datetime.now().date()
-            if age_filter == '0-18':
-                query = query.filter(Patient.date_of_birth >= today - timedelta(days=18*365))
-            elif age_filter == '19-30':
-                query = query.filter(
-                    Patient.date_of_birth < today - timedelta(days=18*365),
-                    Patient.date_of_birth >= today - timedelta(days=30*365)
-                )
-            elif age_filter == '31-50':
-                query = query.filter(
-                    Patient.date_of_birth < today - timedelta(days=30*365),
-                    Patient.date_of_birth >= today - timedelta(days=50*365)
-                )
-            elif age_filter == '50+':
-                query = query.filter(Patient.date_of_birth < today - timedelta(days=50*365))
-        
-        # Get patients
-        patients = query.order_by(Patient.first_name).all()
-        
-        # Format data for export
-        export_data = []
-        for patient in patients:
-            age = (datetime.now().date() - patient.date_of_birth).days // 365
-            export_data.append({
-                'first_name': patient.first_name,
-                'last_name': patient.last_name,
-                'date_of_birth': patient.date_of_birth.strftime('%Y-%m-%d'),
-                'age': age,
-                'gender': patient.gender,
-                'phone': patient.phone,
-                'email': patient.email,
-                'address': patient.address,
-                'emergency_contact': patient.emergency_contact,
-                'emergency_phone': patient.emergency_phone,
-                'medical_history': patient.medical_history,
-                'current_medications': patient.current_medications,
-                'allergies': patient.allergies
-            })
-        
         return jsonify({
             'success': True,
-            'data': export_data
+            'data': export_data('patients', request.args)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# Background exports: queue the same export as a job, poll its status and
+# download the file it wrote
+@app.route('/api/exports/<kind>', methods=['POST'])
+@login_required
+@admission('export', hold_slot=False)
+def queue_export(kind):
+    if kind not in EXPORT_KINDS:
+        abort(404)
+    try:
+        job_id = job_queue.enqueue('export', {
+            'kind': kind,
+            'filters': request.args.to_dict(),
+            'clinic_id': current_clinic_id(),
+            'user_id': current_user.id
         })
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id)
+        }), 202
     except Exception as e:
         return jsonify({
             'success': False,
             'message': str(e)
         }), 500
 
+def own_job(job_id):
+    """The job row, if the current user queued it; 404 otherwise."""
+    row = db.session.execute(db.select([jobs_table]).where(jobs_table.c.id == job_id)).first()
+    if row is None or json.loads(row.payload).get('user_id') != current_user.id:
+        abort(404)
+    return row
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = own_job(job_id)
+    result = json.loads(job.result) if job.result else None
+    response = {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+    if job.name == 'export' and job.status == 'succeeded':
+        response['rows'] = result['rows']
+        response['download_url'] = url_for('download_export', job_id=job.id)
+    elif job.error:
+        # The traceback stays in the table; its last line says what went wrong
+        response['error'] = job.error.strip().splitlines()[-1]
+    return jsonify(response)
+
+# The file goes out as written, through the server's file wrapper, rather
+# than being compressed again on every download
+@app.route('/api/exports/<int:job_id>/download')
+@login_required
+@skip_compression
+def download_export(job_id):
+    job = own_job(job_id)
+    if job.name != 'export' or job.status != 'succeeded':
+        abort(404)
+    path = json.loads(job.result)['path']
+    if not os.path.exists(path):
+        abort(410)
+    return send_file(path, mimetype='application/json', as_attachment=True, download_name=os.path.basename(path))
+
+@app.cli.group()
+def reminders():
+    """Activity reminder commands."""
+
+@reminders.command('run')
+def run_reminders():
+    """Run the reminder scheduler until interrupted."""
+    ReminderScheduler().run()
+
+@reminders.command('tick')
+def tick_reminders():
+    """Send any reminders that are due and exit."""
+    click.echo(f"Sent {ReminderScheduler().tick()} activity reminders")
+
+@app.cli.group('snapshot')
+def snapshot_cli():
+    """Read-only snapshot commands."""
+
+@snapshot_cli.command('refresh')
+def refresh_snapshot():
+    """Copy the live database into the snapshot once."""
+    snapshot.refresh()
+    click.echo(f"Snapshot written to {snapshot.path}")
+
+@snapshot_cli.command('run')
+def run_snapshots():
+    """Refresh the snapshot every SNAPSHOT_REFRESH_SECONDS until interrupted."""
+    while True:
+        try:
+            snapshot.refresh()
+        except Exception as e:
+            print(f"Error refreshing snapshot: {str(e)}")
+        time.sleep(app.config['SNAPSHOT_REFRESH_SECONDS'])
+
+@app.cli.group('assets')
+def assets_cli():
+    """Static asset commands."""
+
+@assets_cli.command('vendor')
+@click.option('--force', is_flag=True, help='Download files that are already present again.')
+def vendor_assets(force):
+    """Download the pinned third-party CSS/JS into the static folder."""
+    fetched = asset_pipeline.vendor(force=force)
+    click.echo(f"Fetched {len(fetched)} vendor files")
+
+@assets_cli.command('build')
+def build_assets():
+    """Write fingerprinted, precompressed bundles to the dist folder."""
+    try:
+        manifest = asset_pipeline.build()
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+    for name, filename in sorted(manifest.items()):
+        click.echo(f"{name} -> {filename}")
+
+@app.cli.group('notifications')
+def notifications_cli():
+    """Notification maintenance commands."""
+
+@notifications_cli.command('rebuild-counters')
+def rebuild_notification_counters_command():
+    """Recount unread notifications, e.g. after adding the counter table to
+    an existing database or changing notifications by hand."""
+    try:
+        users = rebuild_notification_counters()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    click.echo(f"Rebuilt unread counters for {users} users")
+
+@app.cli.group('patients')
+def patients_cli():
+    """Patient maintenance commands."""
+
+@patients_cli.command('find-duplicates')
+def find_duplicates_command():
+    """List clusters of patients that are likely the same person."""
+    filled = backfill_patient_blocking_keys()
+    if filled:
+        click.echo(f"Set blocking keys on {filled} patients")
+    clusters = find_duplicate_patient_clusters()
+    for cluster in clusters:
+        click.echo(f"Clinic {cluster[0].clinic_id}: " + '; '.join(
+            f"#{row.id} {row.first_name} {row.last_name} ({row.date_of_birth}, {row.phone})" for row in cluster
+        ))
+    click.echo(f"Found {len(clusters)} clusters of likely duplicates")
+
+@app.cli.group('activities')
+def activities_cli():
+    """Activity maintenance commands."""
+
+@activities_cli.command('move-cold')
+@click.option('--days', type=int, help='Move activities scheduled more than this many days ago '
+                                       '(default ACTIVITY_COLD_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Activities moved per transaction (default ACTIVITY_COLD_BATCH_SIZE).')
+def move_cold_activities_command(days, batch_size):
+    """Move old completed and cancelled activities to the cold tier."""
+    days = app.config['ACTIVITY_COLD_AFTER_DAYS'] if days is None else days
+    moved = move_cold_activities(datetime.now() - timedelta(days=days),
+                                 batch_size or app.config['ACTIVITY_COLD_BATCH_SIZE'])
+    click.echo(f"Moved {moved} activities to the cold tier")
+
+@app.cli.group('jobs')
+def jobs_cli():
+    """Background job commands."""
+
+@jobs_cli.command('run')
+@click.option('--workers', type=int, help='Worker threads (default JOBS_WORKERS).')
+def run_jobs(workers):
+    """Run queued jobs until interrupted; jobs in flight are finished first."""
+    workers = workers or app.config['JOBS_WORKERS']
+    click.echo(f"Running jobs with {workers} workers")
+    job_worker_pool(workers).run_forever()
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', help='JSON payload passed to the handler.')
+@click.option('--delay', type=float, default=0, help='Seconds before the job becomes due.')
+def enqueue_job(name, payload, delay):
+    """Queue a job, e.g. `flask jobs enqueue snapshot.refresh`."""
+    try:
+        job_id = job_queue.enqueue(name, json.loads(payload), delay=delay)
+    except ValueError as e:
+        raise click.ClickException(f"{str(e)}; registered: {', '.join(sorted(job_queue.handlers))}")
+    click.echo(f"Queued job {job_id}")
+
+@jobs_cli.command('status')
+def job_counts():
+    """Show how many jobs are in each state."""
+    counts = job_queue.counts()
+    for queue in sorted({queue for queue, _ in counts}):
+        summary = ', '.join(f"{status} {counts.get((queue, status), 0)}" for status in JOB_STATUSES)
+        click.echo(f"{queue}: {summary}")
+
+@jobs_cli.command('retry')
+@click.argument('job_id', type=int)
+def retry_job(job_id):
+    """Queue a failed job again."""
+    if not job_queue.retry(job_id):
+        raise click.ClickException(f"Job {job_id} does not exist or has not failed")
+    click.echo(f"Job {job_id} queued again")
+
+@jobs_cli.command('purge')
+@click.option('--days', type=int, default=7, help='Keep jobs that finished more recently than this.')
+def purge_jobs(days):
+    """Delete finished jobs and the export files they wrote."""
+    removed = job_queue.purge(datetime.utcnow() - timedelta(days=days))
+    files = 0
+    for job_id, name, result in removed:
+        if name == 'export' and result and result.get('path'):
+            try:
+                os.remove(result['path'])
+                files += 1
+            except FileNotFoundError:
+                pass
+    click.echo(f"Removed {len(removed)} finished jobs and {files} export files")
+
 if __name__ == '__main__':
     with app.app_context():
         # Create all database tables
         db.create_all()
+
+        # Rows default to this clinic until more are set up
+        if not db.session.get(Clinic, DEFAULT_CLINIC_ID):
+            db.session.add(Clinic(id=DEFAULT_CLINIC_ID, name='Main clinic'))
         
         # Create a test user if none exists
         if not User.query.first():
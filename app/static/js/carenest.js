@@ -0,0 +1,78 @@
+// Helpers shared by the CareNest pages
+
+// Swap a list container's contents for a server-rendered fragment and keep
+// the address bar in step so a reload shows the same page of results.
+function loadListFragment(container, fragmentUrl, params, onSwap) {
+    const query = params.toString();
+    return fetch(`${fragmentUrl}?${query}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`Failed to load ${fragmentUrl}`);
+            return response.text();
+        })
+        .then(html => {
+            container.innerHTML = html;
+            history.replaceState(null, '', `${window.location.pathname}?${query}`);
+            if (onSwap) onSwap();
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            window.location.href = `${window.location.pathname}?${query}`;
+        });
+}
+
+// Route clicks on the pager links inside a list container to onPage(page)
+function onPagerClick(container, onPage) {
+    container.addEventListener('click', function(e) {
+        const link = e.target.closest('.list-pager a[data-page]');
+        if (!link) return;
+        e.preventDefault();
+        if (link.parentElement.classList.contains('disabled')) return;
+        onPage(link.dataset.page);
+    });
+}
+
+// Fill a patient <select> with the top typeahead matches for term, keeping
+// the current choice selectable even when it no longer matches
+async function loadPatientOptions(select, term) {
+    const matches = await fetch(`/api/patients/search?q=${encodeURIComponent(term)}`).then(r => r.json());
+    const current = select.value ? select.selectedOptions[0] : null;
+    select.innerHTML = '<option value="">Select patient</option>';
+    if (current && !matches.some(p => String(p.id) === current.value)) {
+        select.appendChild(current);
+    }
+    matches.forEach(patient => {
+        const option = document.createElement('option');
+        option.value = patient.id;
+        option.textContent = `${patient.first_name} ${patient.last_name}`;
+        option.selected = !!current && String(patient.id) === current.value;
+        select.appendChild(option);
+    });
+}
+
+// Refresh a patient <select> as the user types into its search box
+function bindPatientSearch(input, select) {
+    let timer = null;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const term = this.value;
+        timer = setTimeout(() => {
+            loadPatientOptions(select, term).catch(error => console.error('Error searching patients:', error));
+        }, 150);
+    });
+}
+
+// Show what deleting a record would take with it, using the API's dry run
+function showDeleteImpact(url, target) {
+    const labels = {care_plan: 'care plans', goal: 'goals', activity: 'activities'};
+    target.textContent = '';
+    return fetch(`${url}?dry_run=1`, {method: 'DELETE'})
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) return;
+            const parts = Object.entries(labels)
+                .filter(([table]) => data.counts[table])
+                .map(([table, label]) => `${data.counts[table]} ${label}`);
+            if (parts.length) target.textContent = `This also deletes ${parts.join(', ')}.`;
+        })
+        .catch(error => console.error('Error:', error));
+}
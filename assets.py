@@ -0,0 +1,222 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import requests
+from flask import request, send_from_directory, url_for
+from markupsafe import Markup, escape
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional; without it only .gz variants are built
+    brotli = None
+
+# Third-party files we self-host: path under the static folder -> pinned upstream URL.
+# The upstream URL doubles as the fallback until `flask assets vendor` has run.
+VENDOR_FILES = {
+    'vendor/bootstrap/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.7.2/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.7.2/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.7.2/font/fonts/bootstrap-icons.woff',
+    'vendor/chart.js/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+    'vendor/jspdf/jspdf.umd.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/jspdf/2.5.1/jspdf.umd.min.js',
+    'vendor/jspdf/jspdf.plugin.autotable.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/jspdf-autotable/3.5.31/jspdf.plugin.autotable.min.js',
+}
+
+# Bundles referenced from templates: name -> files under the static folder, in load order
+BUNDLES = {
+    'core.css': [
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/bootstrap-icons/bootstrap-icons.css',
+        'css/carenest.css',
+    ],
+    'core.js': [
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'js/carenest.js',
+    ],
+    'charts.js': ['vendor/chart.js/chart.umd.js'],
+    'pdf.js': [
+        'vendor/jspdf/jspdf.umd.min.js',
+        'vendor/jspdf/jspdf.plugin.autotable.min.js',
+    ],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+ONE_YEAR = 365 * 24 * 3600
+
+SOURCE_MAP_RE = re.compile(r'^\s*(?://[#@] sourceMappingURL=.*|/\*[#@] sourceMappingURL=.*?\*/)\s*$', re.M)
+CSS_URL_RE = re.compile(r'''url\((['"]?)([^'")]+)\1\)''')
+
+class AssetPipeline:
+    """Fingerprinted, precompressed static bundles.
+
+    ``build()`` concatenates each bundle, names the output after a hash of
+    its contents and writes ``.gz`` (and ``.br`` when brotli is installed)
+    siblings next to it, so the files can be cached forever and served
+    without compressing on the fly. Until a build exists, ``asset_tags``
+    links the unbundled sources, or the CDN for vendor files that have not
+    been fetched yet.
+    """
+
+    def __init__(self, app=None):
+        self.static_dir = None
+        self.dist_dir = None
+        self._manifest = {}
+        self._manifest_mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_dir = app.static_folder
+        self.dist_dir = app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.send_asset)
+        app.jinja_env.globals['asset_tags'] = self.tags
+        app.extensions['assets'] = self
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dist_dir, 'manifest.json')
+
+    def manifest(self):
+        """Bundle name -> fingerprinted filename, reloaded when a build replaces it."""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return {}
+        if mtime != self._manifest_mtime:
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def tags(self, name):
+        """Render the <link>/<script> tags for a bundle."""
+        built = self.manifest().get(name)
+        if built:
+            urls = [url_for('assets', filename=built)]
+        else:
+            urls = [self._source_url(path) for path in BUNDLES[name]]
+        if name.endswith('.css'):
+            return Markup('\n    '.join(f'<link rel="stylesheet" href="{escape(url)}">' for url in urls))
+        return Markup('\n    '.join(f'<script src="{escape(url)}"></script>' for url in urls))
+
+    def _source_url(self, path):
+        if os.path.isfile(os.path.join(self.static_dir, path)) or path not in VENDOR_FILES:
+            return url_for('static', filename=path)
+        return VENDOR_FILES[path]
+
+    def send_asset(self, filename):
+        """Serve a built file, preferring a precompressed variant the client accepts."""
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = None
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            path = safe_join(self.dist_dir, filename + suffix)
+            if request.accept_encodings[encoding] and path and os.path.isfile(path):
+                response = send_from_directory(self.dist_dir, filename + suffix, mimetype=mimetype, max_age=ONE_YEAR)
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_from_directory(self.dist_dir, filename, mimetype=mimetype, max_age=ONE_YEAR)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
+
+    def vendor(self, force=False, timeout=30):
+        """Download the pinned third-party files into the static folder."""
+        fetched = []
+        for path, source_url in VENDOR_FILES.items():
+            target = os.path.join(self.static_dir, path)
+            if os.path.isfile(target) and not force:
+                continue
+            response = requests.get(source_url, timeout=timeout)
+            response.raise_for_status()
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f'{target}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp_path, target)
+            fetched.append(path)
+        return fetched
+
+    def build(self):
+        """Write every bundle and its compressed variants, then the manifest.
+
+        Files from the previous build are kept so pages rendered just before
+        a deploy can still load their assets; anything older is removed.
+        """
+        missing = [path for paths in BUNDLES.values() for path in paths
+                   if not os.path.isfile(os.path.join(self.static_dir, path))]
+        if missing:
+            raise FileNotFoundError(f"Missing asset sources (run `flask assets vendor`): {', '.join(missing)}")
+
+        os.makedirs(self.dist_dir, exist_ok=True)
+        previous = self.manifest()
+        manifest = {}
+        for name, paths in BUNDLES.items():
+            parts = []
+            for path in paths:
+                with open(os.path.join(self.static_dir, path), encoding='utf-8') as f:
+                    text = SOURCE_MAP_RE.sub('', f.read())
+                if name.endswith('.css'):
+                    text = self._rewrite_css_urls(text, path, manifest)
+                parts.append(text.strip())
+            separator = '\n' if name.endswith('.css') else '\n;\n'
+            manifest[name] = self._emit(name, (separator.join(parts) + '\n').encode('utf-8'))
+
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+        keep = set(manifest.values()) | set(previous.values()) | {'manifest.json'}
+        for filename in os.listdir(self.dist_dir):
+            if filename not in keep and re.sub(r'\.(gz|br)$', '', filename) not in keep:
+                os.remove(os.path.join(self.dist_dir, filename))
+        return manifest
+
+    def _rewrite_css_urls(self, css, path, manifest):
+        """Fingerprint files a stylesheet references (e.g. icon fonts) and
+        point its url(...) entries at the copies in the dist folder."""
+        base = os.path.dirname(path)
+
+        def replace(match):
+            ref = match.group(2)
+            if ref.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+                return match.group(0)
+            ref_path = os.path.normpath(os.path.join(base, re.split(r'[?#]', ref)[0]))
+            source = os.path.join(self.static_dir, ref_path)
+            if not os.path.isfile(source):
+                return match.group(0)
+            if ref_path not in manifest:
+                with open(source, 'rb') as f:
+                    manifest[ref_path] = self._emit(os.path.basename(ref_path), f.read())
+            return f'url("{manifest[ref_path]}")'
+
+        return CSS_URL_RE.sub(replace, css)
+
+    def _emit(self, name, data):
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        self._write(filename, data)
+        if ext in COMPRESSIBLE:
+            variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data, quality=11)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(data):
+                    self._write(filename + suffix, compressed)
+        return filename
+
+    def _write(self, filename, data):
+        target = os.path.join(self.dist_dir, filename)
+        if os.path.isfile(target):
+            return
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, target)
@@ -0,0 +1,157 @@
+import atexit
+import collections
+import os
+import threading
+import time
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+class AuditWriter:
+    """Write-behind buffer for audit records.
+
+    ``record()`` only appends to a bounded in-memory buffer; a background
+    thread hands the records to ``sink(records)`` in batches of up to
+    ``batch_size``, at least every ``flush_interval`` seconds. Requests
+    therefore never wait on the audit table.
+
+    When the buffer is full the ``overflow`` policy decides what gives:
+
+    ``block``
+        wait up to ``block_timeout`` seconds for the writer to make room,
+        then drop the new record (back-pressure without hanging requests
+        forever if the sink is down)
+    ``drop_oldest`` / ``drop_newest``
+        discard a record straight away
+
+    Every dropped record is counted. ``close()`` drains whatever is still
+    buffered and is registered with ``atexit``, so a clean shutdown never
+    loses records. A failed batch is retried before newer records.
+    """
+
+    def __init__(self, sink, capacity=10000, batch_size=500, flush_interval=1.0,
+                 overflow='block', block_timeout=1.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy {overflow!r}; use one of {', '.join(OVERFLOW_POLICIES)}")
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._buffer = collections.deque()
+        self._retry = []
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)  # writer waits for records
+        self._room = threading.Condition(lock)  # blocked producers wait for space
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        atexit.register(self.close)
+
+    def record(self, entry):
+        """Queue one audit record. Returns False if it was dropped."""
+        with self._cond:
+            self._ensure_writer()
+            if len(self._buffer) >= self.capacity:
+                if self.overflow == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                if self.overflow == 'drop_oldest':
+                    self._buffer.popleft()
+                    self.dropped += 1
+                else:
+                    self._cond.notify_all()
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._buffer) >= self.capacity:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self._room.wait(remaining)
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of records written."""
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return total
+                if not self._write(batch):
+                    return total
+                total += len(batch)
+
+    def close(self):
+        """Stop the writer and drain the buffer synchronously."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._buffer) + len(self._retry)
+        return {
+            'buffered': buffered,
+            'capacity': self.capacity,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed_batches': self.failed_batches,
+            'overflow': self.overflow,
+        }
+
+    def _ensure_writer(self):
+        # Started lazily, and again in a forked worker, whose copy of the
+        # parent's thread does not run
+        pid = os.getpid()
+        if self._closed or (self._pid == pid and self._thread is not None):
+            return
+        if self._pid is not None and self._pid != pid:
+            self._buffer.clear()
+            self._retry = []
+        self._pid = pid
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _take_batch(self):
+        with self._cond:
+            if self._retry:
+                batch, self._retry = self._retry, []
+                return batch
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if batch:
+                self._room.notify_all()
+            return batch
+
+    def _write(self, batch):
+        try:
+            self.sink(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            with self._cond:
+                self._retry = batch + self._retry
+            print(f"Error writing {len(batch)} audit records: {str(e)}")
+            return False
+        self.written += len(batch)
+        return True
@@ -0,0 +1,108 @@
+"""Benchmark for deleting a long-term patient's whole record.
+
+Seeds a patient with a few care plans, goals and N activities, then times
+removing it three ways on fresh copies of the same database: loading and
+deleting every row through the ORM (what a per-row cascade does), the
+set-based delete, and the set-based archive. The dry-run count is timed
+as well.
+
+    python benchmarks/cascade_delete.py --activities 10000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def seed(m, db, activities, care_plans, goals_per_plan):
+    patient = m.Patient(first_name='Long', last_name='Term', date_of_birth=date(1950, 1, 1), gender='Female', phone='555')
+    db.session.add(patient)
+    db.session.flush()
+    goal_ids = []
+    plan_ids = []
+    for i in range(care_plans):
+        plan = m.CarePlan(patient_id=patient.id, title=f'Plan {i}', diagnosis='Chronic', start_date=date(2015, 1, 1),
+                          end_date=date(2030, 1, 1), goals='-', interventions='-')
+        db.session.add(plan)
+        db.session.flush()
+        plan_ids.append(plan.id)
+        for j in range(goals_per_plan):
+            goal = m.Goal(title=f'Goal {i}.{j}', patient_id=patient.id, care_plan_id=plan.id, target_date=date(2030, 1, 1))
+            db.session.add(goal)
+            db.session.flush()
+            goal_ids.append((plan.id, goal.id))
+    start = datetime(2015, 1, 1, 9)
+    db.session.execute(m.Activity.__table__.insert(), [{
+        'title': f'Visit {i}',
+        'patient_id': patient.id,
+        'care_plan_id': goal_ids[i % len(goal_ids)][0],
+        'goal_id': goal_ids[i % len(goal_ids)][1],
+        'scheduled_date': start + timedelta(hours=i),
+        'duration': 30,
+        'activity_type': 'checkup',
+        'status': 'completed',
+        'created_at': start,
+        'updated_at': start,
+    } for i in range(activities)])
+    db.session.commit()
+    return patient.id
+
+def orm_delete(m, db, patient_id):
+    patient = db.session.get(m.Patient, patient_id)
+    for activity in m.Activity.query.filter_by(patient_id=patient_id):
+        db.session.delete(activity)
+    for goal in m.Goal.query.filter_by(patient_id=patient_id):
+        db.session.delete(goal)
+    for plan in m.CarePlan.query.filter_by(patient_id=patient_id):
+        db.session.delete(plan)
+    db.session.delete(patient)
+    db.session.commit()
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<22} {(time.perf_counter() - start) * 1000:9.1f} ms   {result if result is not None else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--activities', type=int, default=10000)
+    parser.add_argument('--care-plans', type=int, default=5)
+    parser.add_argument('--goals-per-plan', type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    seeded = os.path.join(workdir, 'seeded.db')
+    live = os.path.join(workdir, 'cascade.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{live}'
+    sys.path.insert(0, ROOT)
+    import app as m
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        patient_id = seed(m, db, args.activities, args.care_plans, args.goals_per_plan)
+        db.session.remove()
+        db.engine.dispose()
+        shutil.copyfile(live, seeded)
+        print(f"patient {patient_id}: {args.care_plans} care plans, "
+              f"{args.care_plans * args.goals_per_plan} goals, {args.activities} activities")
+
+        runs = [
+            ('dry run', lambda: m.patient_subtree.count(db.session, [patient_id])),
+            ('orm per-row delete', lambda: orm_delete(m, db, patient_id)),
+            ('set-based delete', lambda: m.remove_subtrees(m.patient_subtree, [patient_id])),
+            ('set-based archive', lambda: m.remove_subtrees(m.patient_subtree, [patient_id], archive=True)),
+        ]
+        for label, run in runs:
+            shutil.copyfile(seeded, live)
+            timed(label, run)
+            db.session.remove()
+            db.engine.dispose()
+    shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Microbenchmark for the patient and activity export serializers.
+
+Seeds a database with benchmarks/seed.py's generator, then measures
+rows/sec for each export two ways: the previous approach (load ORM
+objects, build each dict attribute by attribute with strftime, encode with
+the stdlib-backed default JSON provider) and the column-projection schemas
+encoded with FastJSONProvider. Building and encoding are timed
+separately and together.
+
+    python benchmarks/export_serializers.py --patients 5000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from seed import seed_patients
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def legacy_patient_rows(m, query):
+    export_data = []
+    for patient in query.all():
+        age = (datetime.now().date() - patient.date_of_birth).days // 365
+        export_data.append({
+            'first_name': patient.first_name,
+            'last_name': patient.last_name,
+            'date_of_birth': patient.date_of_birth.strftime('%Y-%m-%d'),
+            'age': age,
+            'gender': patient.gender,
+            'phone': patient.phone,
+            'email': patient.email,
+            'address': patient.address,
+            'emergency_contact': patient.emergency_contact,
+            'emergency_phone': patient.emergency_phone,
+            'medical_history': patient.medical_history,
+            'current_medications': patient.current_medications,
+            'allergies': patient.allergies
+        })
+    return export_data
+
+def legacy_activity_rows(m, query):
+    export_data = []
+    for activity in query.all():
+        export_data.append({
+            'title': activity.title,
+            'description': activity.description,
+            'date': activity.scheduled_date.strftime('%Y-%m-%d'),
+            'time': activity.scheduled_date.strftime('%I:%M %p'),
+            'type': activity.activity_type,
+            'doctor': activity.doctor_name,
+            'location': activity.location,
+            'status': activity.status,
+            'patient': f"{activity.patient.first_name} {activity.patient.last_name}" if activity.patient else '',
+            'care_plan': activity.care_plan.title if activity.care_plan else '',
+            'goal': activity.goal.title if activity.goal else ''
+        })
+    return export_data
+
+def projected_patient_rows(m, query):
+    schema = m.patient_export_schema(datetime.now().date())
+    return schema.dump(schema.project(query).all())
+
+def projected_activity_rows(m, query):
+    return m.activity_export_schema.dump(m.activity_export_schema.project(query).all())
+
+def measure(m, db, provider, build, query, repeat):
+    best_build = best_encode = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        rows = build(m, query)
+        built = time.perf_counter()
+        provider.response({'success': True, 'data': rows})
+        encoded = time.perf_counter()
+        best_build = min(best_build or float('inf'), built - start)
+        best_encode = min(best_encode or float('inf'), encoded - built)
+    return len(rows), best_build, best_encode
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--activities', type=int, default=20, help='activities per patient')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the best is reported')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'serializers.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    sys.path.insert(0, ROOT)
+    import app as m
+    from app import app, db
+    from flask.json.provider import DefaultJSONProvider
+    from serializers import FastJSONProvider, orjson
+    from werkzeug.datastructures import MultiDict
+
+    with app.app_context():
+        db.create_all()
+    connection = sqlite3.connect(path)
+    seed_patients(connection, SimpleNamespace(
+        patients=args.patients, care_plans=2, goals=2, activities=args.activities, batch=1000, seed=1,
+        history_years=3, future_days=90
+    ), ['Dr. Ada Lovelace', 'Dr. Alan Turing'], lambda done: None)
+    connection.close()
+
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    print(f"orjson {'available' if orjson is not None else 'not installed (stdlib fallback)'}")
+    print(f"{'export':<20} {'serializer':<12} {'rows':>8} {'build rows/s':>14} {'encode rows/s':>14} {'total rows/s':>14}")
+    with app.test_request_context():
+        cases = [
+            ('patients', m.filtered_patients_query, legacy_patient_rows, projected_patient_rows),
+            ('activities', m.filtered_activities_query, legacy_activity_rows, projected_activity_rows),
+        ]
+        for name, filtered_query, legacy, projected in cases:
+            query, _ = filtered_query(MultiDict())
+            for label, build, provider in (('before', legacy, default_provider), ('after', projected, fast_provider)):
+                rows, build_s, encode_s = measure(m, db, provider, build, query, args.repeat)
+                print(f"{name:<20} {label:<12} {rows:>8} {rows / build_s:>14,.0f} {rows / encode_s:>14,.0f} "
+                      f"{rows / (build_s + encode_s):>14,.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Scripted load test with a per-route latency report.
+
+Logs a pool of workers in as seeded staff and has them hit a weighted mix
+of the list pages, the schedule, the export APIs, detail lookups and the
+write routes for a fixed duration, then prints p50/p95/p99 per route.
+The report can be saved as JSON (commit it next to the change it
+measures) and compared against an earlier one.
+
+Seed a database first with benchmarks/seed.py. Without --url the app is
+served in-process by a threaded werkzeug server; that shares the GIL with
+the load generator, so for absolute numbers point --url at the app running
+under the production server on the same database.
+
+    python benchmarks/seed.py --database /tmp/carenest_load.db
+    python benchmarks/loadtest.py --database /tmp/carenest_load.db --concurrency 16 --duration 60 \\
+        --output benchmarks/results/before.json
+    python benchmarks/loadtest.py --database /tmp/carenest_load.db --compare benchmarks/results/before.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from seed import FIRST_NAMES, LAST_NAMES, STAFF_PASSWORD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Dataset:
+    """Id ranges and names to draw request parameters from."""
+
+    def __init__(self, path):
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            self.patient_ids = connection.execute('SELECT MIN(id), MAX(id) FROM patient').fetchone()
+            self.activity_ids = connection.execute('SELECT MIN(id), MAX(id) FROM activity').fetchone()
+            self.doctors = [row[0] for row in connection.execute(
+                'SELECT DISTINCT doctor_name FROM activity WHERE doctor_name IS NOT NULL LIMIT 100')]
+            self.staff = [row[0] for row in connection.execute(
+                "SELECT email FROM user WHERE email LIKE '%@loadtest.example'")]
+            self.counts = {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                           for table in ('patient', 'care_plan', 'goal', 'activity')}
+        finally:
+            connection.close()
+        if not self.staff or self.patient_ids[0] is None or self.activity_ids[0] is None:
+            raise SystemExit(f'{path} has no seeded data; run benchmarks/seed.py first')
+
+    def patient_id(self, rng):
+        return rng.randint(*self.patient_ids)
+
+    def activity_id(self, rng):
+        return rng.randint(*self.activity_ids)
+
+def patient_form(rng):
+    return {
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'date_of_birth': f'{rng.randint(1930, 2015)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'gender': rng.choice(['Male', 'Female', 'Other']),
+        'phone': f'555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}',
+        'email': 'loadtest@example.com',
+    }
+
+def future_slot(rng):
+    day = datetime.now() + timedelta(days=rng.randint(1, 60))
+    return day.replace(hour=rng.randint(8, 16), minute=rng.choice([0, 15, 30, 45]), second=0, microsecond=0).isoformat()
+
+# name -> (weight, request builder); builders return (method, path, requests kwargs)
+ROUTES = {
+    'GET /dashboard': (5, lambda data, rng: ('GET', '/dashboard', {})),
+    'GET /patients': (10, lambda data, rng: ('GET', f'/patients?page={rng.randint(1, 20)}', {})),
+    'GET /activities': (10, lambda data, rng: ('GET', f'/activities?page={rng.randint(1, 20)}', {})),
+    'GET /schedule': (8, lambda data, rng: ('GET', '/schedule', {})),
+    'GET /api/patient/<id>': (15, lambda data, rng: ('GET', f'/api/patient/{data.patient_id(rng)}', {})),
+    'GET /api/activity/<id>': (10, lambda data, rng: ('GET', f'/api/activity/{data.activity_id(rng)}', {})),
+    'GET /api/patients/search': (10, lambda data, rng: (
+        'GET', f'/api/patients/search?q={rng.choice(LAST_NAMES)[:rng.randint(1, 4)]}', {})),
+    'GET /api/patients/export': (2, lambda data, rng: (
+        'GET', f'/api/patients/export?search={rng.choice(LAST_NAMES)[:3]}', {})),
+    'GET /api/activities/export': (2, lambda data, rng: (
+        'GET', f'/api/activities/export?status=scheduled&search={rng.choice(data.doctors).split()[-1]}', {})),
+    'POST /add-patient': (3, lambda data, rng: ('POST', '/add-patient', {'data': patient_form(rng)})),
+    'PUT /api/patient/<id>': (5, lambda data, rng: (
+        'PUT', f'/api/patient/{data.patient_id(rng)}', {'data': patient_form(rng)})),
+    'POST /api/activity': (3, lambda data, rng: ('POST', '/api/activity', {'json': {
+        'title': 'Load test visit', 'scheduled_date': future_slot(rng), 'doctor_name': rng.choice(data.doctors)}})),
+    'PUT /api/activity/<id>': (5, lambda data, rng: ('PUT', f'/api/activity/{data.activity_id(rng)}', {'json': {
+        'title': 'Load test visit', 'scheduled_date': future_slot(rng), 'status': 'scheduled'}})),
+}
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def login(base_url, email):
+    session = requests.Session()
+    response = session.post(f'{base_url}/login', data={'email': email, 'password': STAFF_PASSWORD},
+                            allow_redirects=False, timeout=30)
+    if response.status_code != 302 or 'dashboard' not in response.headers.get('Location', ''):
+        raise SystemExit(f'Could not log in as {email}')
+    return session
+
+def run_worker(base_url, session, data, routes, seed, deadline, warmup_until, samples):
+    rng = random.Random(seed)
+    names = list(routes)
+    weights = [routes[name][0] for name in names]
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, kwargs = routes[name][1](data, rng)
+        start = time.perf_counter()
+        try:
+            status = session.request(method, f'{base_url}{path}', timeout=120, allow_redirects=False, **kwargs).status_code
+        except requests.RequestException:
+            status = 'error'
+        elapsed = (time.perf_counter() - start) * 1000
+        if time.monotonic() >= warmup_until:
+            samples.append((name, elapsed, status))
+
+def summarize(samples, duration):
+    by_route = {}
+    for name, elapsed, status in samples:
+        by_route.setdefault(name, []).append((elapsed, status))
+    report = {}
+    for name, rows in sorted(by_route.items()):
+        latencies = [elapsed for elapsed, _ in rows]
+        statuses = {}
+        for _, status in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[name] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / duration, 2),
+            'errors': sum(1 for _, status in rows if status == 'error' or status >= 500),
+            'statuses': statuses,
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2),
+        }
+    return report
+
+def print_report(routes, baseline=None):
+    header = f"{'route':<30} {'reqs':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header if baseline is None else f"{header}   {'p50 Δ':>7} {'p95 Δ':>7} {'p99 Δ':>7}")
+    for name, row in routes.items():
+        line = (f"{name:<30} {row['requests']:>7} {row['errors']:>5} "
+                f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            deltas = [(row[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                      for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+            line += '   ' + ' '.join(f'{delta:>+6.0f}%' for delta in deltas)
+        print(line)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def serve_in_process(database):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='seeded SQLite file (also served in-process without --url)')
+    parser.add_argument('--url', help='base URL of an already running app using --database')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to record, after the warmup')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='only exercise these routes')
+    parser.add_argument('--reads-only', action='store_true', help='skip the write routes')
+    parser.add_argument('--label', help='name stored in the report (defaults to the git revision)')
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    parser.add_argument('--compare', help='earlier JSON report to show latency changes against')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.abspath(args.database)
+    data = Dataset(database)
+    routes = {name: ROUTES[name] for name in (args.route or ROUTES)
+              if not (args.reads_only and not name.startswith('GET '))}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        server, base_url = serve_in_process(database)
+
+    sessions = [login(base_url, data.staff[i % len(data.staff)]) for i in range(args.concurrency)]
+    samples = []
+    started = time.monotonic()
+    warmup_until = started + args.warmup
+    deadline = warmup_until + args.duration
+    workers = [
+        threading.Thread(target=run_worker, args=(base_url, session, data, routes, args.seed + i,
+                                                  deadline, warmup_until, samples))
+        for i, session in enumerate(sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if server is not None:
+        server.shutdown()
+
+    revision = git_revision()
+    report = {
+        'label': args.label or revision,
+        'revision': revision,
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'target': 'in-process' if args.url is None else args.url,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'dataset': data.counts,
+        'total_requests': len(samples),
+        'routes': summarize(samples, args.duration),
+    }
+    print(f"{report['label']}: {report['total_requests']} requests in {args.duration:.0f} s "
+          f"at concurrency {args.concurrency} against {data.counts}")
+    print_report(report['routes'], baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Report written to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Load test for the Google OAuth callback.
+
+Starts a slow local stand-in for Google's discovery, token and userinfo
+endpoints, serves the app on a fixed pool of worker threads (like a
+gunicorn/uWSGI deployment) and fires concurrent OAuth callbacks at it while
+timing GET /login. Only OAUTH_MAX_CONCURRENT_CALLS callbacks at a time may
+hold a worker while they wait on Google; the rest get 503 straight away, so
+/login keeps the remaining workers however slow Google is.
+
+    python benchmarks/oauth_callback.py --delay 2 --callbacks 40 --workers 8 --max-oauth 2
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class SlowGoogleHandler(BaseHTTPRequestHandler):
+    delay = 1.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        base = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+        if self.path.startswith('/.well-known/openid-configuration'):
+            self._send_json({
+                'authorization_endpoint': f'{base}/auth',
+                'token_endpoint': f'{base}/token',
+                'userinfo_endpoint': f'{base}/userinfo'
+            })
+        elif self.path.startswith('/userinfo'):
+            time.sleep(self.delay)
+            self._send_json({
+                'sub': '1000',
+                'email': 'loadtest@example.com',
+                'email_verified': True,
+                'given_name': 'Load'
+            })
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.delay)
+        self._send_json({'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+def pooled_server(host, port, app, workers):
+    """A WSGI server handing each connection to one of ``workers`` threads."""
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return PooledWSGIServer(host, port, app)
+
+def start_server(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def time_requests(url, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        requests.get(url, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def summarize(label, latencies):
+    print(f"{label:<28} p50 {statistics.median(latencies):8.1f} ms   "
+          f"p95 {percentile(latencies, 95):8.1f} ms   max {max(latencies):8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=1.0, help='seconds the stand-in takes per token/userinfo call')
+    parser.add_argument('--callbacks', type=int, default=20, help='concurrent OAuth callbacks')
+    parser.add_argument('--probes', type=int, default=50, help='GET /login requests to time')
+    parser.add_argument('--workers', type=int, default=8, help='app worker threads')
+    parser.add_argument('--max-oauth', type=int, default=2, help='OAUTH_MAX_CONCURRENT_CALLS for the app')
+    args = parser.parse_args()
+
+    SlowGoogleHandler.delay = args.delay
+    google = start_server(ThreadingHTTPServer(('127.0.0.1', 0), SlowGoogleHandler))
+    google_base = f'http://127.0.0.1:{google.server_address[1]}'
+
+    workdir = tempfile.mkdtemp()
+    os.environ['GOOGLE_DISCOVERY_URL'] = f'{google_base}/.well-known/openid-configuration'
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'oauth_loadtest.db')}"
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+    os.environ['OAUTH_MAX_CONCURRENT_CALLS'] = str(args.max_oauth)
+    os.environ.setdefault('GOOGLE_CLIENT_ID', 'loadtest')
+    os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'loadtest')
+    sys.path.insert(0, ROOT)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+
+    server = start_server(pooled_server('127.0.0.1', 0, app, args.workers))
+    app_base = f'http://127.0.0.1:{server.server_port}'
+
+    summarize('/login idle', time_requests(f'{app_base}/login', args.probes))
+
+    callback_latencies = []
+    def callback(_):
+        start = time.perf_counter()
+        response = requests.get(f'{app_base}/google-login/callback?code=abc', allow_redirects=False, timeout=60)
+        callback_latencies.append((time.perf_counter() - start) * 1000)
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=args.callbacks) as pool:
+        statuses = pool.map(callback, range(args.callbacks))
+        time.sleep(0.1)
+        summarize(f'/login with {args.callbacks} callbacks', time_requests(f'{app_base}/login', args.probes))
+        statuses = list(statuses)
+
+    summarize('/google-login/callback', callback_latencies)
+    print(f"callback statuses: { {status: statuses.count(status) for status in set(statuses)} } ({args.workers} workers)")
+    server.shutdown()
+    google.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Synthetic data generator for load testing.
+
+Bulk-loads staff users, patients and, per patient, care plans, goals and
+activities with realistic spreads: activities run from a few years back
+to a few months ahead, past ones are mostly completed, and each is booked
+with one of a pool of doctors. Rows are written with executemany in large
+transactions and explicit ids, so the default volume (50k patients,
+200k care plans, 200k goals, 2M activities) loads in a few minutes.
+With --clinics N, patients and staff are spread round-robin over N
+clinics and every record belongs to its patient's clinic.
+
+The same --seed always produces the same data.
+
+    python benchmarks/seed.py --database /tmp/carenest_load.db
+    python benchmarks/seed.py --database /tmp/small.db --patients 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every seeded staff account uses this password
+STAFF_PASSWORD = 'loadtest'
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Ahmed', 'Fatima', 'Wei', 'Mei', 'Raj', 'Priya', 'Carlos', 'Sofia', 'José', 'Lucía', 'Olu', 'Amara',
+    'Hiroshi', 'Yuki', 'Ivan', 'Olga', 'Pierre', 'Chloé', 'Liam', 'Aoife',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Khan', 'Chen', 'Wang', 'Patel', 'Singh', 'Nguyen', 'Kim', 'Okafor', 'Adeyemi', 'Müller',
+    'Schmidt', 'Rossi', 'Dubois', "O'Brien", 'Murphy', 'Tanaka', 'Sato', 'Ivanov', 'Kowalski',
+]
+DIAGNOSES = [
+    'Type 2 Diabetes', 'Hypertension', 'COPD', 'Congestive Heart Failure', 'Chronic Kidney Disease',
+    'Post-operative Recovery', 'Rheumatoid Arthritis', 'Major Depressive Disorder', 'Asthma', 'Osteoporosis',
+]
+GOAL_TITLES = [
+    'Lower HbA1c below 7%', 'Walk 30 minutes daily', 'Reduce blood pressure', 'Medication adherence',
+    'Lose 5% body weight', 'Quit smoking', 'Improve sleep quality', 'Regain full mobility',
+]
+ACTIVITY_TYPES = ['appointment', 'medication', 'therapy', 'checkup', 'lab_test', 'exercise']
+ACTIVITY_TITLES = {
+    'appointment': 'Follow-up appointment', 'medication': 'Medication review', 'therapy': 'Physical therapy',
+    'checkup': 'Routine checkup', 'lab_test': 'Blood panel', 'exercise': 'Supervised exercise',
+}
+LOCATIONS = ['Main Clinic', 'North Wing', 'Cardiology Suite', 'Therapy Center', 'Lab 2', 'Telehealth']
+STREETS = ['Oak St', 'Maple Ave', 'Cedar Rd', 'Pine Ln', 'Elm Dr', 'Lake Blvd']
+
+def doctor_names(count):
+    rng = random.Random(7)
+    return [f'Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(count)]
+
+def stamp(value):
+    # The text format SQLAlchemy stores DateTime columns in on SQLite, so
+    # seeded rows compare correctly against the app's own bound parameters
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def next_id(cursor, table):
+    return (cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0] or 0) + 1
+
+def insert_rows(cursor, table, columns, rows):
+    placeholders = ', '.join('?' for _ in columns)
+    cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+def seed_clinics(cursor, clinics):
+    now = stamp(datetime.utcnow())
+    cursor.executemany('INSERT OR IGNORE INTO clinic (id, name, created_at) VALUES (?, ?, ?)',
+                       [(i, f'Clinic {i}', now) for i in range(1, clinics + 1)])
+
+def seed_staff(cursor, password_hash, doctors, nurses, clinics):
+    names = doctor_names(doctors)
+    user_id = next_id(cursor, 'user')
+    now = stamp(datetime.utcnow())
+    rows = []
+    for i, name in enumerate(names):
+        rows.append((user_id + i, f'doctor{i}@loadtest.example', name[4:], password_hash, 'doctor',
+                     i % clinics + 1, now, now))
+    for i in range(nurses):
+        rows.append((user_id + doctors + i, f'nurse{i}@loadtest.example', f'Nurse {i}', password_hash, 'nurse',
+                     i % clinics + 1, now, now))
+    insert_rows(cursor, 'user', ['id', 'email', 'name', 'password_hash', 'role', 'clinic_id', 'created_at',
+                                 'updated_at'], rows)
+    return names
+
+def seed_patients(connection, args, doctors, report):
+    """Insert patients with their care plans, goals and activities, one
+    transaction per ``args.batch`` patients."""
+    from dedupe import blocking_keys  # ROOT is on sys.path by now
+    rng = random.Random(args.seed)
+    cursor = connection.cursor()
+    patient_id = next_id(cursor, 'patient')
+    care_plan_id = next_id(cursor, 'care_plan')
+    goal_id = next_id(cursor, 'goal')
+    activity_id = next_id(cursor, 'activity')
+    today = datetime.combine(date.today(), datetime.min.time())
+    history = timedelta(days=365 * args.history_years)
+    future_days = args.future_days
+
+    patient_cols = ['id', 'clinic_id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'phone', 'email',
+                    'address', 'emergency_contact', 'emergency_phone', 'medical_history', 'current_medications',
+                    'allergies', 'created_at', 'updated_at', 'name_key', 'phone_key']
+    plan_cols = ['id', 'clinic_id', 'patient_id', 'title', 'diagnosis', 'start_date', 'end_date', 'goals',
+                 'interventions', 'notes', 'status', 'created_at', 'updated_at']
+    goal_cols = ['id', 'clinic_id', 'title', 'description', 'patient_id', 'care_plan_id', 'target_date', 'status',
+                 'created_at', 'version']
+    activity_cols = ['id', 'clinic_id', 'title', 'description', 'patient_id', 'care_plan_id', 'goal_id',
+                     'scheduled_date', 'duration', 'activity_type', 'location', 'doctor_name', 'enable_reminder',
+                     'status', 'notes', 'created_at', 'updated_at']
+
+    done = 0
+    while done < args.patients:
+        patients, plans, goals, activities = [], [], [], []
+        for _ in range(min(args.batch, args.patients - done)):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            clinic = patient_id % args.clinics + 1
+            created_at = today - timedelta(days=rng.randrange(history.days or 1))
+            created = stamp(created_at)
+            date_of_birth = date(1930, 1, 1) + timedelta(days=rng.randrange(365 * 85))
+            phone = f'555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}'
+            patients.append((
+                patient_id, clinic, first, last,
+                date_of_birth.isoformat(),
+                rng.choice(['Male', 'Female', 'Other']),
+                phone,
+                f'{first.lower()}.{last.lower()}{patient_id}@example.com',
+                f'{rng.randrange(1, 9999)} {rng.choice(STREETS)}',
+                f'{rng.choice(FIRST_NAMES)} {last}',
+                f'555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}',
+                rng.choice(DIAGNOSES), 'Metformin 500mg' if rng.random() < 0.3 else None,
+                'Penicillin' if rng.random() < 0.1 else None,
+                created, created,
+                *blocking_keys(last, date_of_birth, phone)
+            ))
+            patient_goals = []
+            for _ in range(args.care_plans):
+                start = (created_at + timedelta(days=rng.randrange(60))).date()
+                status = rng.choices(['active', 'completed', 'pending'], [6, 3, 1])[0]
+                plans.append((
+                    care_plan_id, clinic, patient_id, f'{rng.choice(DIAGNOSES)} management', rng.choice(DIAGNOSES),
+                    start.isoformat(), (start + timedelta(days=rng.randrange(90, 730))).isoformat(),
+                    'See goals', 'Monitoring and education', None, status, created, created
+                ))
+                for _ in range(args.goals):
+                    goals.append((
+                        goal_id, clinic, rng.choice(GOAL_TITLES), None, patient_id, care_plan_id,
+                        (start + timedelta(days=rng.randrange(30, 365))).isoformat(),
+                        rng.choices(['pending', 'in_progress', 'completed'], [3, 4, 3])[0], created, 1
+                    ))
+                    patient_goals.append((care_plan_id, goal_id))
+                    goal_id += 1
+                care_plan_id += 1
+            for _ in range(args.activities):
+                kind = rng.choice(ACTIVITY_TYPES)
+                offset = rng.uniform(-history.total_seconds(), future_days * 86400)
+                when = (today + timedelta(seconds=offset)).replace(minute=rng.choice([0, 15, 30, 45]), second=0, microsecond=0)
+                if when < today:
+                    status = rng.choices(['completed', 'cancelled', 'scheduled'], [85, 10, 5])[0]
+                else:
+                    status = rng.choices(['scheduled', 'cancelled'], [95, 5])[0]
+                plan, goal = rng.choice(patient_goals) if patient_goals else (None, None)
+                activities.append((
+                    activity_id, clinic, ACTIVITY_TITLES[kind], None, patient_id, plan, goal if rng.random() < 0.7 else None,
+                    stamp(when.replace(hour=rng.randrange(8, 17))), rng.choice([15, 30, 30, 45, 60]), kind,
+                    rng.choice(LOCATIONS), rng.choice(doctors), 1, status, None, created, created
+                ))
+                activity_id += 1
+            patient_id += 1
+        insert_rows(cursor, 'patient', patient_cols, patients)
+        insert_rows(cursor, 'care_plan', plan_cols, plans)
+        insert_rows(cursor, 'goal', goal_cols, goals)
+        insert_rows(cursor, 'activity', activity_cols, activities)
+        connection.commit()
+        done += len(patients)
+        report(done)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLite file to create or extend')
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--care-plans', type=int, default=4, help='care plans per patient')
+    parser.add_argument('--goals', type=int, default=1, help='goals per care plan')
+    parser.add_argument('--activities', type=int, default=40, help='activities per patient')
+    parser.add_argument('--clinics', type=int, default=1)
+    parser.add_argument('--doctors', type=int, default=40)
+    parser.add_argument('--nurses', type=int, default=20)
+    parser.add_argument('--history-years', type=int, default=3)
+    parser.add_argument('--future-days', type=int, default=90)
+    parser.add_argument('--batch', type=int, default=1000, help='patients per transaction')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.database)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    sys.path.insert(0, ROOT)
+    from werkzeug.security import generate_password_hash
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(path)
+    # Nothing reads the file until we are done, so skip the fsyncs
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA journal_mode = MEMORY')
+    try:
+        seed_clinics(connection.cursor(), args.clinics)
+        doctors = seed_staff(connection.cursor(), generate_password_hash(STAFF_PASSWORD), args.doctors, args.nurses,
+                             args.clinics)
+        connection.commit()
+
+        def report(done):
+            elapsed = time.perf_counter() - started
+            print(f'\r{done}/{args.patients} patients  {elapsed:6.1f} s', end='', flush=True)
+
+        seed_patients(connection, args, doctors, report)
+        print()
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+
+    total = args.patients
+    print(f"Seeded {total} patients, {total * args.care_plans} care plans, "
+          f"{total * args.care_plans * args.goals} goals and {total * args.activities} activities "
+          f"in {time.perf_counter() - started:.1f} s")
+    print(f"Staff logins: doctor0@loadtest.example ... / {STAFF_PASSWORD}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import threading
+import time
+
+class TTLCache:
+    """Per-key memoization with a short time-to-live and single-flight refresh.
+
+    When an entry is missing or expired, only one caller recomputes it;
+    concurrent callers for the same key wait on that computation and share
+    its result instead of each running their own. Keys share a fixed set of
+    ``lock_stripes`` locks, so the locks never outgrow the cache; two keys
+    on the same stripe just refresh one after the other.
+    """
+
+    def __init__(self, ttl, maxsize=1024, lock_stripes=64):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}  # key -> (expires_at, value)
+        # Reentrant, so a compute() that reads another key on its stripe
+        # does not deadlock
+        self._key_locks = [threading.RLock() for _ in range(lock_stripes)]
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            # Another caller may have refreshed the entry while we waited
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+            value = compute()
+            with self._lock:
+                if key not in self._entries and len(self._entries) >= self.maxsize:
+                    self._evict()
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) >= self.maxsize:
+            key = next(iter(self._entries))
+            del self._entries[key]
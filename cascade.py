@@ -0,0 +1,90 @@
+import sqlalchemy as sa
+
+# SQLite caps the number of bound parameters per statement, so root ids
+# are processed in chunks of this size
+ID_CHUNK_SIZE = 500
+
+# Bookkeeping columns every archive table adds to the source's columns
+ARCHIVE_COLUMNS = ('archive_id', 'archived_at')
+
+def archive_table(table, metadata, name=None):
+    """Declare ``<table>_archive`` (or ``name``): the same columns as
+    ``table`` without constraints, plus when each row was archived.
+
+    Archived rows keep their original id in a plain indexed column; the
+    archive has its own surrogate key so an id SQLite hands out again
+    after a delete can be archived a second time.
+    """
+    columns = [sa.Column('archive_id', sa.Integer, primary_key=True)]
+    for column in table.columns:
+        columns.append(sa.Column(column.name, column.type, nullable=column.nullable or column.primary_key,
+                                 index=column.primary_key or bool(column.foreign_keys)))
+    columns.append(sa.Column('archived_at', sa.DateTime, nullable=False, index=True))
+    return sa.Table(name or f'{table.name}_archive', metadata, *columns)
+
+class SubtreeCascade:
+    """Set-based delete or archive of some root rows and every row that hangs off them.
+
+    ``steps`` is a list of ``(table, predicate)`` pairs ordered leaves
+    first, ending with the root table. ``predicate(ids)`` returns the WHERE
+    clause selecting that table's rows in the subtree of the root ``ids``;
+    it may refer to tables later in the list, which still hold their rows
+    when it runs. Each step is one ``DELETE`` (preceded by one
+    ``INSERT ... SELECT`` when archiving) no matter how many rows it
+    touches, so removing a patient with years of activities costs a
+    handful of statements instead of a load and delete per row.
+
+    Nothing here commits: run it inside the caller's transaction so the
+    whole subtree goes, or stays, together.
+    """
+
+    def __init__(self, steps, archives=None):
+        self.steps = steps
+        self.archives = archives or {}
+
+    def count(self, session, ids):
+        """Rows per table that deleting or archiving ``ids`` would remove."""
+        counts = {table.name: 0 for table, _ in self.steps}
+        for chunk in _chunks(ids):
+            row = session.execute(sa.select([
+                sa.select([sa.func.count()]).select_from(table).where(predicate(chunk))
+                .scalar_subquery().label(table.name)
+                for table, predicate in self.steps
+            ])).one()
+            for name, value in row._mapping.items():
+                counts[name] += value
+        return counts
+
+    def delete(self, session, ids):
+        """Delete the subtrees of ``ids``; returns rows deleted per table."""
+        return self._run(session, ids, archived_at=None)
+
+    def archive(self, session, ids, archived_at):
+        """Copy the subtrees of ``ids`` into the archive tables, then delete
+        them; returns rows moved per table."""
+        missing = [table.name for table, _ in self.steps if table not in self.archives]
+        if missing:
+            raise ValueError(f"No archive table for: {', '.join(missing)}")
+        return self._run(session, ids, archived_at=archived_at)
+
+    def _run(self, session, ids, archived_at):
+        counts = {table.name: 0 for table, _ in self.steps}
+        for chunk in _chunks(ids):
+            for table, predicate in self.steps:
+                if archived_at is not None:
+                    archive = self.archives[table]
+                    # The source may itself be an archive table, whose own
+                    # bookkeeping columns are replaced
+                    columns = [column for column in table.columns if column.name not in ARCHIVE_COLUMNS]
+                    session.execute(archive.insert().from_select(
+                        [column.name for column in columns] + ['archived_at'],
+                        sa.select([*columns, sa.literal(archived_at, sa.DateTime)]).where(predicate(chunk))
+                    ))
+                result = session.execute(table.delete().where(predicate(chunk)))
+                counts[table.name] += result.rowcount
+        return counts
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
@@ -0,0 +1,262 @@
+import threading
+import zlib
+from functools import wraps
+
+from flask import make_response
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # optional; without it only gzip is offered
+    brotli = None
+
+# Views decorated with @skip_compression set this header; the middleware
+# strips it and passes the response through untouched
+SKIP_HEADER = 'X-Skip-Compression'
+
+COMPRESSIBLE_TYPES = frozenset([
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+])
+
+def skip_compression(view):
+    """Opt a view out of response compression."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        response.headers[SKIP_HEADER] = '1'
+        return response
+    return wrapper
+
+class CompressionStats:
+    """Process-wide counters of what the middleware compressed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._by_encoding = {}
+
+    def record(self, encoding, bytes_in, bytes_out):
+        with self._lock:
+            entry = self._by_encoding.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+            entry['responses'] += 1
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def snapshot(self):
+        with self._lock:
+            by_encoding = {name: dict(entry) for name, entry in self._by_encoding.items()}
+        bytes_in = sum(entry['bytes_in'] for entry in by_encoding.values())
+        bytes_out = sum(entry['bytes_out'] for entry in by_encoding.values())
+        return {
+            'responses': sum(entry['responses'] for entry in by_encoding.values()),
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'bytes_saved': bytes_in - bytes_out,
+            'by_encoding': by_encoding,
+        }
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+class CompressionMiddleware:
+    """WSGI middleware that gzip/brotli-encodes responses on the way out.
+
+    Only responses whose content type is allowlisted and whose body is at
+    least ``min_size`` bytes are compressed. Bodies are compressed as they
+    are produced: generator responses are never buffered beyond
+    ``min_size`` (to decide whether compressing is worthwhile), and the
+    encoder is flushed every ``flush_size`` input bytes so streamed exports
+    keep reaching the client incrementally.
+    """
+
+    def __init__(self, app, min_size=500, level=6, brotli_quality=4, flush_size=8192,
+                 content_types=COMPRESSIBLE_TYPES, stats=None):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.flush_size = flush_size
+        self.content_types = content_types
+        self.stats = stats if stats is not None else CompressionStats()
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def negotiate(self, accept_encoding):
+        if not accept_encoding:
+            return None
+        accept = parse_accept_header(accept_encoding)
+        return accept.best_match(self.encodings)
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            def passthrough(status, headers, exc_info=None):
+                headers = [(name, value) for name, value in headers if name.lower() != SKIP_HEADER.lower()]
+                return start_response(status, headers, exc_info)
+            return self.app(environ, passthrough)
+
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'], captured['exc_info'] = status, headers, exc_info
+            return written.append
+
+        app_iter = self.app(environ, capture)
+        if 'status' in captured:
+            headers = Headers(captured['headers'])
+            if not self.should_compress(captured['status'], headers):
+                # Hand the app's own iterable back so the server still sees
+                # e.g. a wsgi.file_wrapper and can sendfile() it
+                headers.remove(SKIP_HEADER)
+                write = start_response(captured['status'], headers.to_wsgi_list(), captured['exc_info'])
+                for chunk in written:
+                    write(chunk)
+                return app_iter
+        return _CompressedResponse(self, app_iter, captured, written, encoding, start_response)
+
+    def should_compress(self, status, headers):
+        if headers.get(SKIP_HEADER):
+            return False
+        if status[:3] in ('204', '206', '304') or 'Content-Range' in headers:
+            return False
+        if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in self.content_types:
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def make_encoder(self, encoding):
+        if encoding == 'br':
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.level)
+
+class _CompressedResponse:
+    """Iterable returned to the server; closes the wrapped app_iter exactly once."""
+
+    def __init__(self, middleware, app_iter, captured, written, encoding, start_response):
+        self.middleware = middleware
+        self.app_iter = app_iter
+        self.captured = captured
+        self.written = written
+        self.encoding = encoding
+        self.start_response = start_response
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+    def __iter__(self):
+        chunks = iter(self.app_iter)
+        # Responses that had already started and won't be compressed never
+        # get here. Flask calls start_response lazily in some error paths;
+        # pull the first chunk so the status and headers are known
+        pending = list(self.written)
+        if 'status' not in self.captured:
+            pending.extend(_take(chunks, 1))
+
+        status = self.captured['status']
+        headers = Headers(self.captured['headers'])
+        exc_info = self.captured['exc_info']
+        middleware = self.middleware
+
+        if not middleware.should_compress(status, headers):
+            headers.remove(SKIP_HEADER)
+            self.start_response(status, headers.to_wsgi_list(), exc_info)
+            yield from pending
+            yield from chunks
+            return
+
+        if 'Content-Length' not in headers:
+            # Streaming body of unknown size: read just enough to tell
+            # whether it clears the threshold
+            size = sum(len(chunk) for chunk in pending)
+            for chunk in chunks:
+                pending.append(chunk)
+                size += len(chunk)
+                if size >= middleware.min_size:
+                    break
+            else:
+                self.start_response(status, headers.to_wsgi_list(), exc_info)
+                yield from pending
+                return
+
+        headers.remove('Content-Length')
+        headers['Content-Encoding'] = self.encoding
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            # The encoded body is no longer byte-identical to the original
+            headers['ETag'] = f'W/{etag}'
+        self.start_response(status, headers.to_wsgi_list(), exc_info)
+
+        encoder = middleware.make_encoder(self.encoding)
+        bytes_in = bytes_out = unflushed = 0
+        for chunk in _chain(pending, chunks):
+            if not chunk:
+                continue
+            bytes_in += len(chunk)
+            unflushed += len(chunk)
+            out = encoder.compress(chunk)
+            if unflushed >= middleware.flush_size:
+                out += encoder.flush()
+                unflushed = 0
+            if out:
+                bytes_out += len(out)
+                yield out
+        out = encoder.finish()
+        bytes_out += len(out)
+        middleware.stats.record(self.encoding, bytes_in, bytes_out)
+        yield out
+
+def _take(iterator, n):
+    taken = []
+    for chunk in iterator:
+        taken.append(chunk)
+        if len(taken) >= n:
+            break
+    return taken
+
+def _chain(first, rest):
+    yield from first
+    yield from rest
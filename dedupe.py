@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+def normalize_name(name):
+    """Lower-case ASCII letters only: accents, spaces, hyphens and
+    apostrophes make no difference to whether two names match."""
+    name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z]', '', name.lower())
+
+def soundex(name):
+    """American Soundex code of ``name``, e.g. ``R163`` for Robert and Rupert."""
+    name = normalize_name(name)
+    if not name:
+        return ''
+    code, previous = name[0].upper(), _SOUNDEX_CODES.get(name[0])
+    for char in name[1:]:
+        digit = _SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w do not separate letters with the same code; vowels do
+        if char not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+def normalize_phone(phone):
+    """The last ten digits of ``phone``, or '' if it has fewer than seven."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+def blocking_keys(last_name, date_of_birth, phone):
+    """``(name_key, phone_key)`` for a patient. Possible duplicates share at
+    least one of them, so a candidate lookup is an index probe per key
+    instead of a scan. Either is None when there is nothing to block on."""
+    code = soundex(last_name)
+    name_key = f'{code}:{date_of_birth.isoformat()}' if code and date_of_birth else None
+    return name_key, normalize_phone(phone) or None
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # An initial matches the name it abbreviates
+    if len(a) == 1 or len(b) == 1:
+        return 0.8 if a[0] == b[0] else 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def _date_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # One mistyped part, or day and month swapped
+    same_parts = (a.year == b.year) + (a.month == b.month) + (a.day == b.day)
+    if same_parts == 2 or (a.year == b.year and a.month == b.day and a.day == b.month):
+        return 0.5
+    return 0.0
+
+def match_score(a, b):
+    """How likely two patient records (objects or rows with first_name,
+    last_name, date_of_birth, phone and email) are the same person, from 0
+    to 1. Names count half, date of birth 30% and phone 20%; a shared email
+    adds a tenth. First and last names swapped still match."""
+    first_a, last_a = normalize_name(a.first_name), normalize_name(a.last_name)
+    first_b, last_b = normalize_name(b.first_name), normalize_name(b.last_name)
+    name = max(
+        0.4 * _similarity(first_a, first_b) + 0.6 * _similarity(last_a, last_b),
+        0.4 * _similarity(first_a, last_b) + 0.6 * _similarity(last_a, first_b),
+    )
+    phone_a = normalize_phone(a.phone)
+    phone = 1.0 if phone_a and phone_a == normalize_phone(b.phone) else 0.0
+    score = 0.5 * name + 0.3 * _date_similarity(a.date_of_birth, b.date_of_birth) + 0.2 * phone
+    email_a = (getattr(a, 'email', None) or '').strip().lower()
+    if email_a and email_a == (getattr(b, 'email', None) or '').strip().lower():
+        score += 0.1
+    return min(score, 1.0)
+
+def duplicate_clusters(blocks, threshold, max_block_size=None):
+    """Group records into clusters of likely duplicates.
+
+    ``blocks`` yields lists of records sharing a blocking key; every pair
+    within a block scoring at least ``threshold`` is linked, and linked
+    records are clustered transitively. Blocks larger than
+    ``max_block_size`` (typically a placeholder phone number shared by many
+    patients) are skipped. Returns clusters of two or more records' ids,
+    largest first.
+    """
+    parent = {}
+
+    def find(record_id):
+        root = parent.setdefault(record_id, record_id)
+        while parent[root] != root:
+            root = parent[root]
+        while record_id != root:
+            parent[record_id], record_id = root, parent[record_id]
+        return root
+
+    for block in blocks:
+        if max_block_size and len(block) > max_block_size:
+            continue
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                if find(a.id) != find(b.id) and match_score(a, b) >= threshold:
+                    parent[find(a.id)] = find(b.id)
+
+    clusters = {}
+    for record_id in list(parent):
+        clusters.setdefault(find(record_id), set()).add(record_id)
+    return sorted((sorted(ids) for ids in clusters.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids))
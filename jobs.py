@@ -0,0 +1,353 @@
+import contextlib
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+def job_table(metadata, name='job'):
+    """The jobs table. ``run_at`` is when a queued job becomes due (pushed
+    back on every retry) and ``locked_until`` is the visibility timeout of
+    a running one."""
+    return sa.Table(
+        name, metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('queue', sa.String(50), nullable=False, default='default'),
+        sa.Column('payload', sa.Text, nullable=False, default='{}'),
+        sa.Column('status', sa.String(20), nullable=False, default='queued'),
+        sa.Column('priority', sa.Integer, nullable=False, default=0),
+        sa.Column('attempts', sa.Integer, nullable=False, default=0),
+        sa.Column('max_attempts', sa.Integer, nullable=False),
+        sa.Column('run_at', sa.DateTime, nullable=False),
+        sa.Column('locked_by', sa.String(100)),
+        sa.Column('locked_until', sa.DateTime),
+        sa.Column('result', sa.Text),
+        sa.Column('error', sa.Text),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('started_at', sa.DateTime),
+        sa.Column('finished_at', sa.DateTime),
+        sa.Index(f'ix_{name}_claim', 'queue', 'status', 'run_at'),
+        sa.Index(f'ix_{name}_lease', 'status', 'locked_until'),
+    )
+
+class Job:
+    """A claimed job as handed to its handler."""
+
+    def __init__(self, id, name, payload, attempts, max_attempts):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.follow_ups = []
+
+    def then(self, name, payload=None, delay=0, unique=False):
+        """Queue ``name`` once this job succeeds, in the same transaction
+        that records the success: a job whose result is dropped (worker
+        gone, lease reclaimed) queues nothing. See ``JobQueue.enqueue``."""
+        self.follow_ups.append((name, payload, delay, unique))
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} attempt {self.attempts}/{self.max_attempts}>'
+
+class JobQueue:
+    """Durable job queue kept in a SQL table (SQLite 3.35+ for RETURNING).
+
+    ``claim()`` moves the next due job to ``running`` with one
+    ``UPDATE ... RETURNING`` statement, so concurrent workers, in threads or
+    in separate processes, never get the same job. A claimed job is hidden
+    for ``visibility_timeout`` seconds; if its worker dies without
+    finishing it, the job becomes claimable again once that lapses. Failed
+    attempts are retried with exponential backoff until ``max_attempts``,
+    then the job stays ``failed`` for inspection.
+
+    ``engine`` is a callable returning the Engine to use, so the queue can
+    be created before the application's database is configured.
+    """
+
+    def __init__(self, table, engine, visibility_timeout=300, max_attempts=5, backoff=10, max_backoff=3600):
+        self.table = table
+        self.engine = engine
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.handlers = {}
+        name = table.name
+        self._claim = sa.text(f"""
+            UPDATE {name}
+            SET status = 'running', attempts = attempts + 1, locked_by = :worker,
+                locked_until = :locked_until, started_at = :now
+            WHERE id = (
+                SELECT id FROM {name}
+                WHERE queue = :queue AND (
+                    (status = 'queued' AND run_at <= :now)
+                    OR (status = 'running' AND locked_until < :now AND attempts < max_attempts)
+                )
+                ORDER BY priority DESC, run_at, id
+                LIMIT 1
+            )
+            RETURNING id, name, payload, attempts, max_attempts
+        """).bindparams(
+            sa.bindparam('now', type_=sa.DateTime),
+            sa.bindparam('locked_until', type_=sa.DateTime),
+        )
+
+    def task(self, name):
+        """Register the decorated function as the handler for ``name``. It
+        is called with the :class:`Job` and its return value is stored as
+        the job's JSON result."""
+        def register(handler):
+            self.handlers[name] = handler
+            return handler
+        return register
+
+    def enqueue(self, name, payload=None, delay=0, queue='default', priority=0, max_attempts=None, connection=None,
+                unique=False):
+        """Add a job and return its id. Pass ``connection`` to enqueue inside
+        a transaction that is already open, so the job only exists if that
+        transaction commits. With ``unique`` nothing is added, and None is
+        returned, if a job of that name is already queued."""
+        if name not in self.handlers:
+            raise ValueError(f'No job handler registered for {name!r}')
+        now = datetime.utcnow()
+        values = {
+            'name': name,
+            'queue': queue,
+            'payload': json.dumps(payload or {}),
+            'status': 'queued',
+            'priority': priority,
+            'attempts': 0,
+            'max_attempts': max_attempts or self.max_attempts,
+            'run_at': now + timedelta(seconds=delay),
+            'created_at': now,
+        }
+        if connection is None:
+            with self.engine().begin() as connection:
+                return self._insert(connection, values, unique)
+        return self._insert(connection, values, unique)
+
+    def _insert(self, connection, values, unique):
+        table = self.table
+        if not unique:
+            return connection.execute(table.insert().values(**values)).inserted_primary_key[0]
+        # One INSERT ... SELECT ... WHERE NOT EXISTS, so two processes
+        # cannot both see no queued job and both add one
+        rows = sa.select([sa.literal(value, type_=table.c[key].type) for key, value in values.items()]).where(
+            ~sa.exists().where(table.c.name == values['name'], table.c.queue == values['queue'],
+                               table.c.status == 'queued')
+        )
+        result = connection.execute(table.insert().from_select(list(values), rows))
+        return result.lastrowid if result.rowcount == 1 else None
+
+    def claim(self, worker, queue='default', now=None):
+        """Claim the next due job for ``worker``, or return None."""
+        now = now or datetime.utcnow()
+        with self.engine().begin() as connection:
+            self._expire(connection, now)
+            row = connection.execute(self._claim, {
+                'worker': worker,
+                'queue': queue,
+                'now': now,
+                'locked_until': now + timedelta(seconds=self.visibility_timeout),
+            }).first()
+        if row is None:
+            return None
+        return Job(row.id, row.name, json.loads(row.payload), row.attempts, row.max_attempts)
+
+    def _expire(self, connection, now):
+        # Jobs whose worker vanished on their last attempt are not reclaimed
+        table = self.table
+        connection.execute(
+            table.update()
+            .where(table.c.status == 'running', table.c.locked_until < now,
+                   table.c.attempts >= table.c.max_attempts)
+            .values(status='failed', locked_by=None, locked_until=None, finished_at=now,
+                    error='Visibility timeout expired on the final attempt')
+        )
+
+    def extend(self, job_ids, worker, now=None):
+        """Push the visibility timeout of jobs ``worker`` is still running."""
+        if not job_ids:
+            return 0
+        now = now or datetime.utcnow()
+        table = self.table
+        with self.engine().begin() as connection:
+            return connection.execute(
+                table.update()
+                .where(table.c.id.in_(job_ids), table.c.locked_by == worker, table.c.status == 'running')
+                .values(locked_until=now + timedelta(seconds=self.visibility_timeout))
+            ).rowcount
+
+    def complete(self, job, worker, result=None):
+        return self._finish(job, worker, status='succeeded', result=json.dumps(result, default=str), error=None,
+                            locked_by=None, locked_until=None, finished_at=datetime.utcnow(),
+                            follow_ups=job.follow_ups)
+
+    def fail(self, job, worker, error):
+        """Record a failed attempt; schedule a retry unless it was the last."""
+        now = datetime.utcnow()
+        if job.attempts >= job.max_attempts:
+            return self._finish(job, worker, status='failed', error=error, locked_by=None, locked_until=None,
+                                finished_at=now)
+        return self._finish(job, worker, status='queued', error=error, locked_by=None, locked_until=None,
+                            run_at=now + timedelta(seconds=self.retry_delay(job.attempts)))
+
+    def retry_delay(self, attempts):
+        # Exponential backoff with jitter so a burst of failures does not
+        # come back all at once
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _finish(self, job, worker, follow_ups=(), **values):
+        # Only the worker holding the job may finish it; if its lease lapsed
+        # and someone else claimed the job meanwhile, the result is dropped
+        table = self.table
+        with self.engine().begin() as connection:
+            finished = connection.execute(
+                table.update()
+                .where(table.c.id == job.id, table.c.locked_by == worker, table.c.status == 'running')
+                .values(**values)
+            ).rowcount == 1
+            if finished:
+                for name, payload, delay, unique in follow_ups:
+                    self.enqueue(name, payload, delay=delay, connection=connection, unique=unique)
+            return finished
+
+    def run(self, job, worker):
+        """Run one claimed job's handler and record the outcome."""
+        handler = self.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f'No job handler registered for {job.name!r}')
+            result = handler(job)
+        except Exception:
+            self.fail(job, worker, traceback.format_exc(limit=20))
+            return False
+        return self.complete(job, worker, result)
+
+    def retry(self, job_id):
+        """Queue a failed job again with a fresh set of attempts."""
+        table = self.table
+        with self.engine().begin() as connection:
+            return connection.execute(
+                table.update()
+                .where(table.c.id == job_id, table.c.status == 'failed')
+                .values(status='queued', attempts=0, run_at=datetime.utcnow(), error=None, finished_at=None)
+            ).rowcount == 1
+
+    def purge(self, older_than):
+        """Delete finished jobs that finished before ``older_than`` and
+        return them as ``(id, name, result)`` tuples, so the caller can
+        clean up files the jobs left behind."""
+        table = self.table
+        criteria = [table.c.status.in_(['succeeded', 'failed']), table.c.finished_at < older_than]
+        with self.engine().begin() as connection:
+            rows = connection.execute(sa.select([table.c.id, table.c.name, table.c.result]).where(*criteria)).all()
+            # Jobs finishing now finish after older_than, so the DELETE
+            # matches exactly the rows read above
+            connection.execute(table.delete().where(*criteria))
+        return [(row.id, row.name, json.loads(row.result) if row.result else None) for row in rows]
+
+    def counts(self):
+        table = self.table
+        with self.engine().connect() as connection:
+            rows = connection.execute(
+                sa.select([table.c.queue, table.c.status, sa.func.count()]).group_by(table.c.queue, table.c.status)
+            ).all()
+        return {(queue, status): count for queue, status, count in rows}
+
+class WorkerPool:
+    """Threads that claim and run jobs until stopped.
+
+    Each thread polls its queue, sleeping ``poll_interval`` seconds when it
+    finds nothing to do. A heartbeat thread keeps extending the visibility
+    timeout of the jobs in flight, so long-running jobs are not handed to
+    another worker while this one is alive. ``context`` wraps every job,
+    e.g. to push an application context.
+    """
+
+    def __init__(self, queue, workers=4, poll_interval=1.0, queue_name='default', context=None):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.queue_name = queue_name
+        self.context = context
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.processed = 0
+        self.failed = 0
+        self._running = {}  # thread name -> job id
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop claiming new jobs and wait for the ones in flight."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Run until SIGINT or SIGTERM, then finish the jobs in flight."""
+        self.start()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: self._stop.set())
+        while not self._stop.is_set():
+            self._stop.wait(1)
+        self.stop()
+
+    def _context(self):
+        return self.context() if self.context is not None else contextlib.nullcontext()
+
+    def _work(self):
+        name = threading.current_thread().name
+        while not self._stop.is_set():
+            try:
+                with self._context():
+                    job = self.queue.claim(self.worker_id, self.queue_name)
+                    if job is None:
+                        self._stop.wait(self.poll_interval)
+                        continue
+                    with self._lock:
+                        self._running[name] = job.id
+                    try:
+                        succeeded = self.queue.run(job, self.worker_id)
+                    finally:
+                        with self._lock:
+                            self._running.pop(name, None)
+                with self._lock:
+                    self.processed += 1
+                    self.failed += not succeeded
+            except Exception as e:
+                # The database being briefly unavailable must not kill the worker
+                print(f"Error in job worker {name}: {str(e)}")
+                self._stop.wait(self.poll_interval)
+
+    def _heartbeat(self):
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while not self._stop.wait(interval):
+            with self._lock:
+                job_ids = list(self._running.values())
+            try:
+                with self._context():
+                    self.queue.extend(job_ids, self.worker_id)
+            except Exception as e:
+                print(f"Error extending job leases: {str(e)}")
@@ -0,0 +1,155 @@
+import contextlib
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+class RateLimited(Exception):
+    """Raised when a request is not admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdmissionControl:
+    """Per-user token buckets and per-class concurrency limits shared by every
+    worker process through a small SQLite file.
+
+    ``take()`` spends a token from the ``(user, class)`` bucket, which refills
+    at ``rate`` tokens a second up to ``burst``. ``slot()`` holds one of
+    ``concurrency`` slots of a class for the duration of a ``with`` block;
+    when they are all taken up to ``queue`` callers wait, polling for a free
+    slot, for at most ``wait`` seconds. Everyone beyond that, and anyone
+    still waiting when the time is up, gets :class:`RateLimited`.
+
+    Slots carry a lease, so a process that dies while holding one only
+    blocks it until the lease runs out. The file is separate from the
+    application database so admission checks never queue behind clinical
+    writes, and if it cannot be used at all requests are let through
+    rather than refused.
+    """
+
+    def __init__(self, path, lease=300, poll_interval=0.05):
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._initialized = False
+        self.rejected = 0
+
+    def _connection(self):
+        # One connection per thread and process; a forked worker must not
+        # reuse its parent's
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            if not self._initialized:
+                connection.executescript("""
+                    CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+                    CREATE TABLE IF NOT EXISTS slot (
+                        id TEXT PRIMARY KEY, name TEXT NOT NULL, waiting INTEGER NOT NULL, expires REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS ix_slot_name ON slot (name, waiting, expires);
+                """)
+                self._initialized = True
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, rate, burst, cost=1):
+        """Spend ``cost`` tokens from the bucket ``key`` or raise RateLimited."""
+        now = time.time()
+        connection = self._connection()
+        # Refill and spend in one statement; the WHERE leaves an empty bucket
+        # untouched and makes RETURNING come back empty
+        row = connection.execute("""
+            INSERT INTO bucket (key, tokens, updated) VALUES (:key, :burst - :cost, :now)
+            ON CONFLICT (key) DO UPDATE
+                SET tokens = min(:burst, tokens + (:now - updated) * :rate) - :cost, updated = :now
+                WHERE min(:burst, tokens + (:now - updated) * :rate) >= :cost
+            RETURNING tokens
+        """, {'key': key, 'rate': rate, 'burst': burst, 'cost': cost, 'now': now}).fetchone()
+        if row is not None:
+            return row[0]
+        tokens, updated = connection.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+        available = min(burst, tokens + (now - updated) * rate)
+        self.rejected += 1
+        raise RateLimited('Too many requests; slow down', (cost - available) / rate if rate else 60)
+
+    @contextlib.contextmanager
+    def slot(self, name, concurrency, queue=0, wait=0):
+        slot_id = self.acquire(name, concurrency, queue, wait)
+        try:
+            yield
+        finally:
+            self.release(slot_id)
+
+    def acquire(self, name, concurrency, queue=0, wait=0):
+        """Take a slot of ``name`` or raise RateLimited; returns the id to
+        pass to :meth:`release`."""
+        slot_id = uuid.uuid4().hex
+        connection = self._connection()
+        deadline = time.monotonic() + wait
+        waiting = False
+        try:
+            while True:
+                now = time.time()
+                with _immediate(connection):
+                    connection.execute('DELETE FROM slot WHERE name = ? AND expires < ?', (name, now))
+                    running, queued = connection.execute(
+                        'SELECT count(*) - coalesce(sum(waiting), 0), coalesce(sum(waiting), 0) FROM slot WHERE name = ?',
+                        (name,)
+                    ).fetchone()
+                    free = concurrency - running
+                    if waiting:
+                        # Waiters are served in arrival order
+                        ahead = connection.execute(
+                            'SELECT count(*) FROM slot WHERE name = ? AND waiting = 1 AND rowid < '
+                            '(SELECT rowid FROM slot WHERE id = ?)', (name, slot_id)
+                        ).fetchone()[0]
+                        if ahead < free:
+                            connection.execute('UPDATE slot SET waiting = 0, expires = ? WHERE id = ?',
+                                               (now + self.lease, slot_id))
+                            return slot_id
+                    elif free > 0 and queued == 0:
+                        connection.execute('INSERT INTO slot (id, name, waiting, expires) VALUES (?, ?, 0, ?)',
+                                           (slot_id, name, now + self.lease))
+                        return slot_id
+                    elif queued >= queue or wait <= 0:
+                        break
+                    else:
+                        connection.execute('INSERT INTO slot (id, name, waiting, expires) VALUES (?, ?, 1, ?)',
+                                           (slot_id, name, now + wait + self.lease))
+                        waiting = True
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self.release(slot_id)
+            raise
+        self.release(slot_id)
+        self.rejected += 1
+        raise RateLimited(f'Too many concurrent {name} requests; try again shortly', max(wait, 1))
+
+    def release(self, slot_id):
+        self._connection().execute('DELETE FROM slot WHERE id = ?', (slot_id,))
+
+class _immediate:
+    # BEGIN IMMEDIATE takes the write lock up front, so the count and the
+    # insert that depends on it cannot interleave with another process
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, *exc):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,41 @@
+import heapq
+
+class ReminderQueue:
+    """Min-heap of pending reminders ordered by (fire_at, activity_id).
+
+    Each activity is queued at most once, so reloading an overlapping scan
+    window does not produce duplicate reminders.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._queued = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, fire_at, activity_id):
+        if activity_id in self._queued:
+            return False
+        heapq.heappush(self._heap, (fire_at, activity_id))
+        self._queued.add(activity_id)
+        return True
+
+    def peek(self):
+        return self._heap[0] if self._heap else None
+
+    def has_due(self, now):
+        return bool(self._heap) and self._heap[0][0] <= now
+
+    def pop_due(self, now, limit):
+        """Pop up to ``limit`` reminders whose fire time is not after ``now``."""
+        batch = []
+        while self._heap and len(batch) < limit and self._heap[0][0] <= now:
+            fire_at, activity_id = heapq.heappop(self._heap)
+            self._queued.discard(activity_id)
+            batch.append((fire_at, activity_id))
+        return batch
+
+    def clear(self):
+        self._heap.clear()
+        self._queued.clear()
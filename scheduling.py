@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+def working_windows(start, end, day_start, day_end, working_days):
+    """Yield the working-hour (start, end) windows that fall inside [start, end).
+
+    ``day_start`` and ``day_end`` are ``datetime.time`` values and
+    ``working_days`` holds weekday numbers (Monday is 0).
+    """
+    day = start.date()
+    while day <= end.date():
+        if day.weekday() in working_days:
+            window_start = max(datetime.combine(day, day_start), start)
+            window_end = min(datetime.combine(day, day_end), end)
+            if window_start < window_end:
+                yield window_start, window_end
+        day += timedelta(days=1)
+
+def merge_intervals(intervals):
+    """Merge (start, end) intervals that are already sorted by start."""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def align(moment, origin, step):
+    """Round ``moment`` up to the next multiple of ``step`` after ``origin``."""
+    remainder = (moment - origin) % step
+    return moment if not remainder else moment + (step - remainder)
+
+def free_slots(busy, windows, duration, limit, step=timedelta(minutes=15)):
+    """Sweep the working windows against the busy intervals and return free slots.
+
+    ``busy`` must be sorted by start time. Slot starts are aligned to
+    ``step`` from midnight, and consecutive slots in the same gap don't
+    overlap. At most ``limit`` (start, end) pairs are returned.
+    """
+    busy = merge_intervals(busy)
+    slots = []
+    i = 0
+    for window_start, window_end in windows:
+        midnight = datetime.combine(window_start.date(), datetime.min.time())
+        cursor = window_start
+        # Busy intervals that ended before this window can never matter again
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        j = i
+        while cursor < window_end:
+            gap_end = window_end
+            if j < len(busy) and busy[j][0] < window_end:
+                gap_end = max(busy[j][0], cursor)
+
+            slot_start = align(cursor, midnight, step)
+            while slot_start + duration <= gap_end:
+                slots.append((slot_start, slot_start + duration))
+                if len(slots) >= limit:
+                    return slots
+                slot_start = align(slot_start + duration, midnight, step)
+
+            if gap_end >= window_end:
+                break
+            cursor = max(cursor, busy[j][1])
+            j += 1
+    return slots
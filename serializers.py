@@ -0,0 +1,118 @@
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; without it the stdlib json module is used
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed.
+
+    Output matches the default provider's: keys are sorted, and dates,
+    decimals, UUIDs and dataclasses still go through Flask's ``default``
+    hook. The only difference is that non-ASCII text is emitted as UTF-8
+    rather than ``\\u`` escapes. Calls orjson cannot honour (``indent=4``,
+    a custom ``cls``, ...) and pretty-printed debug responses fall back to
+    the stdlib encoder.
+    """
+
+    def _orjson_options(self, kwargs):
+        if orjson is None or set(kwargs) - {'sort_keys', 'ensure_ascii', 'indent', 'default'}:
+            return None
+        if kwargs.get('indent') not in (None, 2):
+            return None
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent') == 2:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        options = self._orjson_options(kwargs)
+        if options is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=options).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options({}))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+class Field:
+    """One output key of a :class:`Schema`: the column expression to select
+    and an optional formatter applied to its non-null values."""
+
+    def __init__(self, name, column, format=None):
+        self.name = name
+        self.column = column
+        self.format = format
+
+class Schema:
+    """Column projection for an API payload.
+
+    Instead of hydrating ORM objects and reading attributes row by row, a
+    schema selects just its fields' columns as plain tuples and formats
+    them a column at a time. Formatters run once per distinct value, which
+    for dates and other low-cardinality columns is a small fraction of the
+    rows.
+    """
+
+    def __init__(self, *fields, joins=()):
+        self.fields = fields
+        self.joins = joins  # (target, onclause) pairs, outer-joined in order
+        self.names = [field.name for field in fields]
+
+    def columns(self):
+        return [field.column.label(field.name) for field in self.fields]
+
+    def project(self, query):
+        """Narrow an ORM query (keeping its filters and ordering) to the schema's columns."""
+        for target, onclause in self.joins:
+            query = query.outerjoin(target, onclause)
+        return query.with_entities(*self.columns())
+
+    def dump(self, rows):
+        """Format rows fetched with :meth:`project` as a list of dicts."""
+        if not rows:
+            return []
+        columns = [format_column(values, field.format) for values, field in zip(zip(*rows), self.fields)]
+        names = self.names
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def dump_one(self, row):
+        return self.dump([row])[0] if row is not None else None
+
+def format_column(values, format):
+    if format is None:
+        return values
+    cache = {None: None}
+    for value in values:
+        if value not in cache:
+            cache[value] = format(value)
+    return [cache[value] for value in values]
+
+def date_format(pattern):
+    """Formatter for date/datetime columns; ISO layouts skip strftime."""
+    if pattern == '%Y-%m-%d':
+        return lambda value: (value.date() if isinstance(value, datetime) else value).isoformat()
+    return lambda value: value.strftime(pattern)
+
+def iso_format(value):
+    return value.isoformat()
+
+def age_on(today):
+    """Formatter turning a date of birth into whole years (365-day years, as
+    the patient pages count them) on ``today``."""
+    def age(date_of_birth):
+        return (today - date_of_birth).days // 365
+    return age
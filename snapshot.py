@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.pool import NullPool
+
+class SnapshotManager:
+    """Read-only copy of the primary SQLite database for heavy read endpoints.
+
+    ``refresh()`` copies the live database with the sqlite3 online backup
+    API into a temporary file and atomically swaps it into place, so readers
+    never see a half-written snapshot. The snapshot engine uses ``NullPool``
+    so every checkout opens the newest file.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.path = None
+        self.max_staleness = None
+        self.engine = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.path = app.config['SNAPSHOT_DATABASE_PATH']
+        self.max_staleness = app.config['SNAPSHOT_MAX_STALENESS_SECONDS']
+        self.engine = sa.create_engine('sqlite://', creator=self._connect, poolclass=NullPool)
+        app.extensions['snapshot'] = self
+
+    def _connect(self):
+        return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+
+    def age(self):
+        """Seconds since the snapshot was taken, or None if there is none."""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def is_fresh(self):
+        age = self.age()
+        return age is not None and age <= self.max_staleness
+
+    def refresh(self, pages=1024):
+        """Copy the primary database into the snapshot file.
+
+        The backup runs ``pages`` pages at a time so clinical writes are only
+        held up for one step, not for the whole copy.
+        """
+        source_path = self.db.engine.url.database
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+        try:
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target, pages=pages, sleep=0.005)
+            finally:
+                target.close()
+        finally:
+            source.close()
+        os.replace(tmp_path, self.path)
+
+class RoutingSession(Session):
+    """Session that sends reads to the snapshot inside snapshot-routed requests.
+
+    Flushes always go to the primary, and the snapshot connection is opened
+    read-only, so an accidental write in a routed request fails loudly
+    instead of being lost. Statements with the ``use_primary`` execution
+    option always read the primary, for values that must not lag behind,
+    such as counters shown on every page.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('use_snapshot') \
+                and not (clause is not None and clause.get_execution_options().get('use_primary')):
+            return current_app.extensions['snapshot'].engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_from_snapshot(view):
+    """Serve a read-only view from the snapshot when it is fresh enough.
+
+    Falls back to the primary when there is no snapshot or it is older than
+    ``SNAPSHOT_MAX_STALENESS_SECONDS``. Apply it below ``login_required`` so
+    the current user is still loaded from the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_snapshot = current_app.extensions['snapshot'].is_fresh()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.use_snapshot = False
+    return wrapper
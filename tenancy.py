@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import g, has_app_context
+from sqlalchemy.orm import declared_attr, with_loader_criteria
+
+# Clinic that rows and users belong to when nothing says otherwise, so a
+# single-clinic deployment never has to think about tenancy
+DEFAULT_CLINIC_ID = 1
+
+def current_clinic_id():
+    """The clinic the current request (or :func:`clinic_scope` block) works
+    in, or None outside of one."""
+    return g.get('clinic_id') if has_app_context() else None
+
+@contextmanager
+def clinic_scope(clinic_id):
+    """Scope ORM reads and new rows to ``clinic_id`` for the duration of the
+    block, e.g. in a CLI command working on one clinic's data."""
+    previous = g.get('clinic_id')
+    g.clinic_id = clinic_id
+    try:
+        yield
+    finally:
+        g.clinic_id = previous
+
+class ClinicScoped:
+    """Mixin for models whose rows belong to one clinic.
+
+    New rows default to the current clinic. While a clinic is current, every
+    ORM SELECT, UPDATE and DELETE through the session is limited to its rows
+    by :func:`scope_to_clinic`; lazy loads and eager loads inherit the
+    criteria from the statement that loaded their parent.
+    """
+
+    @declared_attr
+    def clinic_id(cls):
+        return sa.Column(sa.Integer, sa.ForeignKey('clinic.id'), nullable=False,
+                         default=lambda: current_clinic_id() or DEFAULT_CLINIC_ID,
+                         server_default=str(DEFAULT_CLINIC_ID))
+
+def scope_to_clinic(execute_state):
+    """``do_orm_execute`` hook adding the current clinic's criteria to every
+    ClinicScoped entity in the statement, subqueries included. Pass the
+    ``all_clinics=True`` execution option to opt a statement out.
+
+    A statement with no mapped entity at its top level, such as a SELECT of
+    scalar subqueries or of ``exists()``, is compiled as plain Core and is
+    not scoped; filter those with :func:`clinic_criteria`."""
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if execute_state.execution_options.get('all_clinics'):
+        return
+    clinic_id = current_clinic_id()
+    if clinic_id is None:
+        return
+    execute_state.statement = execute_state.statement.options(with_loader_criteria(
+        ClinicScoped, lambda cls: cls.clinic_id == clinic_id, include_aliases=True
+    ))
+
+def clinic_criteria(model):
+    """The current clinic's filter on ``model``, spelled out for statements
+    :func:`scope_to_clinic` cannot scope."""
+    clinic_id = current_clinic_id()
+    return sa.true() if clinic_id is None else model.clinic_id == clinic_id
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from audit import AuditWriter
+
+
+class Sink:
+    def __init__(self, fail=0):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, records):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('audit table unavailable')
+        self.batches.append(list(records))
+
+
+def writer(sink, **kwargs):
+    # A long flush interval keeps the background thread out of the way
+    # unless a test wants it
+    kwargs.setdefault('flush_interval', 60)
+    return AuditWriter(sink, **kwargs)
+
+
+def test_flush_writes_in_batches():
+    sink = Sink()
+    audit = writer(sink, batch_size=2)
+    for i in range(5):
+        audit.record(i)
+    # Reaching batch_size wakes the writer; flush() takes whatever is left
+    audit.flush()
+    assert [record for batch in sink.batches for record in batch] == [0, 1, 2, 3, 4]
+    assert all(len(batch) <= 2 for batch in sink.batches)
+    assert audit.stats()['written'] == 5
+    audit.close()
+
+
+def test_failed_batch_is_retried_first():
+    sink = Sink(fail=1)
+    audit = writer(sink, batch_size=10)
+    audit.record('a')
+    assert audit.flush() == 0
+    audit.record('b')
+    assert audit.flush() == 2
+    assert sink.batches == [['a'], ['b']]
+    assert audit.stats()['failed_batches'] == 1
+    audit.close()
+
+
+def test_close_drains_the_buffer():
+    sink = Sink()
+    audit = writer(sink, batch_size=100)
+    for i in range(3):
+        audit.record(i)
+    audit.close()
+    assert sink.batches == [[0, 1, 2]]
+
+
+@pytest.mark.parametrize('overflow, kept', [('drop_newest', [0, 1]), ('drop_oldest', [1, 2])])
+def test_overflow_drops_records(overflow, kept):
+    sink = Sink()
+    audit = writer(sink, capacity=2, overflow=overflow)
+    # Closed first so no writer thread makes room behind the test's back
+    audit.close()
+    results = [audit.record(i) for i in range(3)]
+    assert results == [True, True, overflow == 'drop_oldest']
+    audit.flush()
+    assert sink.batches == [kept]
+    assert audit.stats()['dropped'] == 1
+
+
+def test_block_gives_up_after_timeout():
+    audit = writer(Sink(), capacity=1, block_timeout=0.05)
+    audit.close()
+    assert audit.record('a')
+    assert not audit.record('b')
+    assert audit.stats() == {'buffered': 1, 'capacity': 1, 'written': 0, 'dropped': 1, 'failed_batches': 0,
+                             'overflow': 'block'}
+
+
+def test_block_waits_for_the_writer():
+    release = threading.Event()
+    sink = Sink()
+
+    def slow_sink(records):
+        release.wait(5)
+        sink(records)
+
+    audit = writer(slow_sink, capacity=1, batch_size=1, block_timeout=5)
+    assert audit.record('a')
+    threading.Timer(0.05, release.set).start()
+    assert audit.record('b')
+    audit.close()
+    assert [record for batch in sink.batches for record in batch] == ['a', 'b']
+    assert audit.stats()['dropped'] == 0
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError, match='drop_oldest'):
+        AuditWriter(Sink(), overflow='ignore')
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import cascade
+from cascade import SubtreeCascade, archive_table
+
+metadata = sa.MetaData()
+parent = sa.Table('parent', metadata, sa.Column('id', sa.Integer, primary_key=True))
+child = sa.Table('child', metadata, sa.Column('id', sa.Integer, primary_key=True),
+                 sa.Column('parent_id', sa.Integer, sa.ForeignKey('parent.id'), nullable=False))
+leaf = sa.Table('leaf', metadata, sa.Column('id', sa.Integer, primary_key=True),
+                sa.Column('child_id', sa.Integer, sa.ForeignKey('child.id'), nullable=False),
+                sa.Column('note', sa.String(20)))
+# An archive tier of leaf rows, shaped like an archive table, as
+# activity_cold is for activities
+leaf_cold = archive_table(leaf, metadata, name='leaf_cold')
+ARCHIVES = {table: archive_table(table, metadata) for table in (parent, child, leaf)}
+ARCHIVES[leaf_cold] = ARCHIVES[leaf]
+
+subtree = SubtreeCascade([
+    (leaf_cold, lambda ids: leaf_cold.c.child_id.in_(sa.select([child.c.id]).where(child.c.parent_id.in_(ids)))),
+    (leaf, lambda ids: leaf.c.child_id.in_(sa.select([child.c.id]).where(child.c.parent_id.in_(ids)))),
+    (child, lambda ids: child.c.parent_id.in_(ids)),
+    (parent, lambda ids: parent.c.id.in_(ids)),
+], archives=ARCHIVES)
+
+ARCHIVED_AT = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def session():
+    engine = sa.create_engine('sqlite://')
+    metadata.create_all(engine)
+    with Session(engine) as session:
+        # Parent p has children 10p, 10p+1, each with two leaves; parent
+        # 1 also has a cold leaf
+        for p in (1, 2, 3):
+            session.execute(parent.insert().values(id=p))
+            for c in (10 * p, 10 * p + 1):
+                session.execute(child.insert().values(id=c, parent_id=p))
+                for n in (0, 1):
+                    session.execute(leaf.insert().values(id=10 * c + n, child_id=c, note=f'leaf {c}.{n}'))
+        session.execute(leaf_cold.insert().values(id=999, child_id=10, note='cold', archived_at=ARCHIVED_AT))
+        session.commit()
+        yield session
+
+
+def rows(session, table):
+    return session.execute(sa.select([sa.func.count()]).select_from(table)).scalar()
+
+
+def test_count_changes_nothing(session):
+    assert subtree.count(session, [1, 2]) == {'leaf_cold': 1, 'leaf': 8, 'child': 4, 'parent': 2}
+    assert rows(session, leaf) == 12
+
+
+def test_delete_removes_only_the_subtree(session):
+    assert subtree.delete(session, [1, 2]) == {'leaf_cold': 1, 'leaf': 8, 'child': 4, 'parent': 2}
+    assert session.execute(sa.select([parent.c.id])).scalars().all() == [3]
+    assert session.execute(sa.select([child.c.id])).scalars().all() == [30, 31]
+    assert rows(session, leaf) == 4 and rows(session, leaf_cold) == 0
+    assert all(rows(session, archive) == 0 for archive in ARCHIVES.values())
+
+
+def test_archive_moves_the_subtree(session):
+    counts = subtree.archive(session, [1], ARCHIVED_AT)
+    assert counts == {'leaf_cold': 1, 'leaf': 4, 'child': 2, 'parent': 1}
+    assert rows(session, parent) == 2 and rows(session, leaf) == 8
+    archived = ARCHIVES[leaf]
+    # The cold tier's leaves land in the same archive as the live ones
+    assert sorted(session.execute(sa.select([archived.c.id])).scalars()) == [100, 101, 110, 111, 999]
+    assert session.execute(sa.select([archived.c.note]).where(archived.c.id == 999)).scalar() == 'cold'
+    assert rows(session, ARCHIVES[child]) == 2 and rows(session, ARCHIVES[parent]) == 1
+
+
+def test_reused_id_can_be_archived_twice(session):
+    subtree.archive(session, [1], ARCHIVED_AT)
+    session.execute(parent.insert().values(id=1))
+    subtree.archive(session, [1], ARCHIVED_AT)
+    archived = ARCHIVES[parent]
+    assert session.execute(sa.select([archived.c.id])).scalars().all() == [1, 1]
+
+
+def test_archive_needs_every_archive_table(session):
+    partial = SubtreeCascade(subtree.steps, archives={parent: ARCHIVES[parent]})
+    with pytest.raises(ValueError, match='leaf_cold, leaf, child'):
+        partial.archive(session, [1], ARCHIVED_AT)
+    assert rows(session, parent) == 3
+
+
+def test_ids_are_processed_in_chunks(session, monkeypatch):
+    monkeypatch.setattr(cascade, 'ID_CHUNK_SIZE', 2)
+    assert subtree.count(session, [3, 1, 2, 2]) == {'leaf_cold': 1, 'leaf': 12, 'child': 6, 'parent': 3}
+    assert subtree.delete(session, [3, 1, 2]) == {'leaf_cold': 1, 'leaf': 12, 'child': 6, 'parent': 3}
+    assert rows(session, parent) == 0
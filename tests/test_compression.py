@@ -0,0 +1,130 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, send_file
+from werkzeug.test import EnvironBuilder
+
+from compression import CompressionMiddleware, skip_compression
+
+BODY = 'x' * 2000
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    download = tmp_path / 'export.csv'
+    download.write_text('a,b\n' * 1000)
+
+    @app.route('/page')
+    def page():
+        return BODY
+
+    @app.route('/small')
+    def small():
+        return 'x' * 100
+
+    @app.route('/image')
+    def image():
+        return Response(b'\0' * 2000, mimetype='image/png')
+
+    @app.route('/stream/<int:size>')
+    def stream(size):
+        return Response((b'x' * 100 for _ in range(size // 100)), mimetype='text/csv')
+
+    @app.route('/etag')
+    def etag():
+        response = Response(BODY)
+        response.set_etag('abc')
+        return response
+
+    @app.route('/download')
+    @skip_compression
+    def download_file():
+        return send_file(download)
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=500)
+    return app
+
+
+def get(app, path, encoding='gzip', method='GET'):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    return app.test_client().open(path, method=method, headers=headers)
+
+
+def test_negotiate_prefers_client_quality():
+    middleware = CompressionMiddleware(None)
+    middleware.encodings = ['br', 'gzip']
+    assert middleware.negotiate('gzip, deflate, br') == 'br'
+    assert middleware.negotiate('br;q=0.5, gzip') == 'gzip'
+    assert middleware.negotiate('deflate') is None
+    assert middleware.negotiate(None) is None
+
+
+def test_large_text_is_gzipped(app):
+    response = get(app, '/page')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.data).decode() == BODY
+    assert app.wsgi_app.stats.snapshot()['by_encoding']['gzip']['bytes_in'] == len(BODY)
+
+
+def test_client_without_accept_encoding_gets_identity(app):
+    response = get(app, '/page', encoding=None)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data(as_text=True) == BODY
+
+
+def test_head_is_not_compressed(app):
+    response = get(app, '/page', method='HEAD')
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Length'] == str(len(BODY))
+
+
+def test_body_under_threshold_is_not_compressed(app):
+    response = get(app, '/small')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == b'x' * 100
+
+
+def test_other_content_types_are_not_compressed(app):
+    assert 'Content-Encoding' not in get(app, '/image').headers
+
+
+@pytest.mark.parametrize('size, compressed', [(400, False), (5000, True)])
+def test_streamed_body_is_sized_before_compressing(app, size, compressed):
+    response = get(app, f'/stream/{size}')
+    assert ('Content-Encoding' in response.headers) == compressed
+    data = gzip.decompress(response.data) if compressed else response.data
+    assert data == b'x' * size
+
+
+def test_strong_etag_is_weakened(app):
+    assert get(app, '/etag').headers['ETag'] == 'W/"abc"'
+
+
+def test_skipped_response_keeps_file_wrapper(app):
+    class FileWrapper:
+        def __init__(self, file, block_size=8192):
+            self.file = file
+
+        def __iter__(self):
+            return iter(lambda: self.file.read(8192), b'')
+
+        def close(self):
+            self.file.close()
+
+    environ = EnvironBuilder(path='/download', headers={'Accept-Encoding': 'gzip'}).get_environ()
+    environ['wsgi.file_wrapper'] = FileWrapper
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, dict(headers)
+
+    app_iter = app.wsgi_app(environ, start_response)
+    try:
+        assert isinstance(app_iter, FileWrapper)
+        assert b''.join(app_iter) == b'a,b\n' * 1000
+    finally:
+        app_iter.close()
+    assert 'Content-Encoding' not in started['headers']
+    assert 'X-Skip-Compression' not in started['headers']
@@ -0,0 +1,82 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from dedupe import blocking_keys, duplicate_clusters, match_score, normalize_phone, soundex
+
+DOB = date(1990, 4, 12)
+
+
+def patient(id=0, first_name='John', last_name='Smith', date_of_birth=DOB, phone='', email=None):
+    return SimpleNamespace(id=id, first_name=first_name, last_name=last_name, date_of_birth=date_of_birth,
+                           phone=phone, email=email)
+
+
+@pytest.mark.parametrize('name, code', [
+    ('Robert', 'R163'), ('Rupert', 'R163'), ('Ashcraft', 'A261'), ('Tymczak', 'T522'),
+    ('Pfister', 'P236'), ('Lee', 'L000'), ("O'Brien", 'O165'), ('', ''),
+])
+def test_soundex(name, code):
+    assert soundex(name) == code
+
+
+def test_normalize_phone_keeps_last_ten_digits():
+    assert normalize_phone('+1 (555) 010-0199') == '5550100199'
+    assert normalize_phone('555 0199') == '5550199'
+    assert normalize_phone('12345') == ''
+
+
+def test_blocking_keys():
+    assert blocking_keys('Smith', DOB, '555-0199') == ('S530:1990-04-12', '5550199')
+    assert blocking_keys('', DOB, None) == (None, None)
+
+
+@pytest.mark.parametrize('other, score', [
+    # Names count half, date of birth 30% and phone 20%
+    (patient(phone='555 0100'), 1.0),
+    (patient(), 0.8),
+    (patient(first_name='Smith', last_name='John'), 0.8),
+    (patient(first_name='J.'), 0.5 * (0.4 * 0.8 + 0.6) + 0.3),
+    (patient(date_of_birth=date(1990, 12, 4)), 0.5 + 0.15),
+    (patient(date_of_birth=date(1991, 4, 12), phone='555 0100'), 0.5 + 0.15 + 0.2),
+    (patient(date_of_birth=date(1970, 1, 1)), 0.5),
+    (patient(first_name='Kay', last_name='Ruff', phone='555 0100'), 0.3 + 0.2),
+])
+def test_match_score_weights(other, score):
+    assert match_score(patient(phone='(555) 0100'), other) == pytest.approx(score)
+
+
+def test_shared_email_adds_a_tenth_capped_at_one():
+    a = patient(email='John@Example.com')
+    assert match_score(a, patient(email='john@example.com ')) == pytest.approx(0.9)
+    assert match_score(a, patient(date_of_birth=None, email='john@example.com')) == pytest.approx(0.6)
+    assert match_score(patient(phone='5550100', email='j@x'), patient(phone='5550100', email='j@x')) == 1.0
+
+
+def test_accents_and_punctuation_do_not_matter():
+    assert match_score(patient(first_name='José', last_name="O'Neil"), patient(first_name='Jose', last_name='ONeil')) \
+        == pytest.approx(0.8)
+
+
+@pytest.mark.parametrize('threshold, clustered', [(0.65, True), (0.8, False)])
+def test_clusters_respect_threshold(threshold, clustered):
+    # Day and month swapped: 0.65
+    block = [patient(1), patient(2, date_of_birth=date(1990, 12, 4))]
+    assert duplicate_clusters([block], threshold) == ([[1, 2]] if clustered else [])
+
+
+def test_clusters_are_transitive_and_largest_first():
+    blocks = [
+        [patient(1), patient(2)],
+        [patient(2), patient(3, first_name='J')],
+        [patient(7, last_name='Jones'), patient(8, last_name='Jones')],
+        [patient(9, last_name='Brown'), patient(10, first_name='Mary', last_name='Green', date_of_birth=None)],
+    ]
+    assert duplicate_clusters(blocks, 0.7) == [[1, 2, 3], [7, 8]]
+
+
+def test_oversized_blocks_are_skipped():
+    block = [patient(i, phone='000 0000', date_of_birth=None) for i in range(1, 4)]
+    assert duplicate_clusters([block], 0.7) == [[1, 2, 3]]
+    assert duplicate_clusters([block], 0.7, max_block_size=2) == []
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+import pytest
+
+from jobs import JobQueue, job_table
+
+
+@pytest.fixture
+def queue(tmp_path):
+    metadata = sa.MetaData()
+    table = job_table(metadata)
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    metadata.create_all(engine)
+    queue = JobQueue(table, lambda: engine, visibility_timeout=60, max_attempts=3, backoff=10)
+
+    @queue.task('tick')
+    def tick(job):
+        job.then('tick', delay=5, unique=True)
+        return {'ok': True}
+
+    @queue.task('boom')
+    def boom(job):
+        raise RuntimeError('boom')
+
+    return queue
+
+
+def row(queue, job_id):
+    table = queue.table
+    with queue.engine().connect() as connection:
+        return connection.execute(sa.select([table]).where(table.c.id == job_id)).first()
+
+
+def statuses(queue, name='tick'):
+    table = queue.table
+    with queue.engine().connect() as connection:
+        return [row.status for row in connection.execute(
+            sa.select([table.c.status]).where(table.c.name == name).order_by(table.c.id))]
+
+
+def test_follow_up_is_queued_with_success(queue):
+    queue.enqueue('tick')
+    job = queue.claim('w')
+    assert queue.run(job, 'w')
+    assert statuses(queue) == ['succeeded', 'queued']
+
+
+def test_second_chain_merges_into_first(queue):
+    queue.enqueue('tick')
+    queue.enqueue('tick')
+    first, second = queue.claim('w'), queue.claim('w')
+    assert queue.run(first, 'w') and queue.run(second, 'w')
+    assert statuses(queue).count('queued') == 1
+
+
+def test_dropped_result_queues_no_follow_up(queue):
+    queue.enqueue('tick')
+    job = queue.claim('w')
+    # Another worker reclaimed the job after our lease lapsed
+    assert not queue.run(job, 'someone-else')
+    assert statuses(queue) == ['running']
+
+
+def test_unique_enqueue_skips_queued_duplicate(queue):
+    first = queue.enqueue('tick', unique=True)
+    assert first is not None
+    assert queue.enqueue('tick', unique=True) is None
+    assert queue.enqueue('tick') is not None
+
+
+def test_claim_hands_each_job_out_once(queue):
+    low = queue.enqueue('boom')
+    high = queue.enqueue('boom', priority=5)
+    assert queue.claim('a').id == high
+    assert queue.claim('b').id == low
+    assert queue.claim('c') is None
+
+
+def test_claim_waits_for_run_at(queue):
+    queue.enqueue('boom', delay=30)
+    assert queue.claim('w') is None
+    assert queue.claim('w', now=datetime.utcnow() + timedelta(seconds=31)) is not None
+
+
+def test_failed_attempt_is_retried_with_backoff(queue):
+    job_id = queue.enqueue('boom')
+    job = queue.claim('w')
+    before = datetime.utcnow()
+    assert not queue.run(job, 'w')
+    retried = row(queue, job_id)
+    assert retried.status == 'queued'
+    assert 'RuntimeError' in retried.error
+    # backoff=10: the first retry comes back after 5-10 seconds
+    assert before + timedelta(seconds=5) <= retried.run_at <= datetime.utcnow() + timedelta(seconds=10)
+    assert queue.claim('w') is None
+    assert queue.claim('w', now=retried.run_at).attempts == 2
+
+
+def test_retry_delay_doubles_up_to_the_cap(queue):
+    queue.max_backoff = 30
+    for attempts, ceiling in ((1, 10), (2, 20), (3, 30), (10, 30)):
+        delay = queue.retry_delay(attempts)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = queue.enqueue('boom', max_attempts=2)
+    now = datetime.utcnow()
+    for _ in range(2):
+        job = queue.claim('w', now=now)
+        queue.run(job, 'w')
+        now = row(queue, job_id).run_at
+    assert row(queue, job_id).status == 'failed'
+    assert queue.claim('w', now=now + timedelta(days=1)) is None
+    assert queue.retry(job_id)
+    assert queue.claim('w').attempts == 1
+
+
+def test_lapsed_lease_is_reclaimed(queue):
+    job_id = queue.enqueue('tick')
+    first = queue.claim('dead')
+    assert queue.claim('live') is None
+    later = datetime.utcnow() + timedelta(seconds=61)
+    second = queue.claim('live', now=later)
+    assert (second.id, second.attempts) == (job_id, first.attempts + 1)
+    assert not queue.run(first, 'dead')
+    assert queue.run(second, 'live')
+    assert row(queue, job_id).status == 'succeeded'
+
+
+def test_extend_keeps_lease_alive(queue):
+    queue.enqueue('tick')
+    job = queue.claim('w')
+    later = datetime.utcnow() + timedelta(seconds=61)
+    assert queue.extend([job.id], 'w', now=later - timedelta(seconds=30)) == 1
+    assert queue.claim('other', now=later) is None
+
+
+def test_lapsed_final_attempt_is_marked_failed(queue):
+    job_id = queue.enqueue('tick', max_attempts=1)
+    queue.claim('dead')
+    assert queue.claim('live', now=datetime.utcnow() + timedelta(seconds=61)) is None
+    assert row(queue, job_id).status == 'failed'
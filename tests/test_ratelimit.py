@@ -0,0 +1,92 @@
+import threading
+import time
+import types
+
+import pytest
+
+import ratelimit
+from ratelimit import AdmissionControl, RateLimited, retry_after_header
+
+
+@pytest.fixture
+def control(tmp_path):
+    return AdmissionControl(str(tmp_path / 'ratelimit.db'), lease=60, poll_interval=0.01)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze time.time() for the module; advance it with ``clock.now += s``."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ratelimit, 'time', types.SimpleNamespace(
+        time=lambda: clock.now, monotonic=time.monotonic, sleep=time.sleep))
+    return clock
+
+
+def test_bucket_allows_burst_then_refuses(control, clock):
+    for remaining in (2, 1, 0):
+        assert control.take('user:1:api', rate=1, burst=3) == remaining
+    with pytest.raises(RateLimited) as excinfo:
+        control.take('user:1:api', rate=1, burst=3)
+    assert excinfo.value.retry_after == pytest.approx(1)
+    assert control.rejected == 1
+
+
+def test_bucket_refills_at_rate_up_to_burst(control, clock):
+    for _ in range(3):
+        control.take('k', rate=2, burst=3)
+    clock.now += 0.5
+    assert control.take('k', rate=2, burst=3) == pytest.approx(0)
+    clock.now += 60
+    assert control.take('k', rate=2, burst=3) == pytest.approx(2)
+
+
+def test_buckets_are_per_key(control, clock):
+    control.take('user:1:export', rate=0.1, burst=1)
+    with pytest.raises(RateLimited) as excinfo:
+        control.take('user:1:export', rate=0.1, burst=1)
+    assert excinfo.value.retry_after == pytest.approx(10)
+    assert control.take('user:2:export', rate=0.1, burst=1) == 0
+
+
+def test_slot_is_released_after_block(control):
+    with control.slot('export', concurrency=1):
+        with pytest.raises(RateLimited):
+            control.acquire('export', concurrency=1)
+    with control.slot('export', concurrency=1):
+        pass
+
+
+def test_slot_is_released_when_block_raises(control):
+    with pytest.raises(ValueError):
+        with control.slot('export', concurrency=1):
+            raise ValueError
+    control.release(control.acquire('export', concurrency=1))
+
+
+def test_slots_are_per_class(control):
+    control.acquire('export', concurrency=1)
+    control.release(control.acquire('search', concurrency=1))
+
+
+def test_expired_lease_frees_slot(control, clock):
+    control.acquire('export', concurrency=1)
+    clock.now += 61
+    control.acquire('export', concurrency=1)
+
+
+def test_waiter_gets_slot_when_released(control):
+    held = control.acquire('export', concurrency=1)
+    threading.Timer(0.1, control.release, (held,)).start()
+    control.release(control.acquire('export', concurrency=1, queue=1, wait=5))
+
+
+def test_full_queue_is_refused(control):
+    control.acquire('export', concurrency=1)
+    with pytest.raises(RateLimited) as excinfo:
+        control.acquire('export', concurrency=1, queue=0, wait=5)
+    assert excinfo.value.retry_after == 5
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.2) == '1'
+    assert retry_after_header(2.1) == '3'
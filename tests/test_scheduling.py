@@ -0,0 +1,80 @@
+from datetime import datetime, time, timedelta
+
+from scheduling import align, free_slots, merge_intervals, working_windows
+
+MONDAY = datetime(2024, 1, 1)
+WEEKDAYS = range(5)
+
+
+def at(day, hour, minute=0):
+    return MONDAY + timedelta(days=day, hours=hour, minutes=minute)
+
+
+def starts(slots):
+    return [start.strftime('%a %H:%M') for start, _ in slots]
+
+
+def window(day, start_hour, end_hour):
+    return at(day, start_hour), at(day, end_hour)
+
+
+def test_working_windows_skip_weekends_and_clip_to_range():
+    windows = list(working_windows(at(0, 10), at(7, 11), time(9), time(17), WEEKDAYS))
+    assert windows[0] == (at(0, 10), at(0, 17))
+    assert [start.weekday() for start, _ in windows] == [0, 1, 2, 3, 4, 0]
+    assert windows[-1] == (at(7, 9), at(7, 11))
+
+
+def test_merge_intervals_joins_overlapping_and_touching():
+    busy = [(at(0, 9), at(0, 10)), (at(0, 9, 30), at(0, 11)), (at(0, 11), at(0, 12)), (at(0, 13), at(0, 14))]
+    assert merge_intervals(busy) == [[at(0, 9), at(0, 12)], [at(0, 13), at(0, 14)]]
+
+
+def test_align_rounds_up_to_step():
+    step = timedelta(minutes=15)
+    assert align(at(0, 9, 1), MONDAY, step) == at(0, 9, 15)
+    assert align(at(0, 9, 15), MONDAY, step) == at(0, 9, 15)
+
+
+def test_empty_day_is_cut_into_back_to_back_slots():
+    slots = free_slots([], [window(0, 9, 11)], timedelta(minutes=30), limit=10)
+    assert starts(slots) == ['Mon 09:00', 'Mon 09:30', 'Mon 10:00', 'Mon 10:30']
+
+
+def test_slots_fill_gaps_between_busy_intervals():
+    busy = [(at(0, 9, 10), at(0, 9, 40)), (at(0, 10, 30), at(0, 11, 15))]
+    slots = free_slots(busy, [window(0, 9, 12)], timedelta(minutes=30), limit=10)
+    # 09:00-09:10 is too short; the next start is aligned to 09:45, and the
+    # 10:15 start would run into the 10:30 appointment
+    assert starts(slots) == ['Mon 09:45', 'Mon 11:15']
+    for start, end in slots:
+        assert all(end <= busy_start or start >= busy_end for busy_start, busy_end in busy)
+
+
+def test_exact_fit_gap_is_used():
+    busy = [(at(0, 9), at(0, 10)), (at(0, 10, 30), at(0, 12))]
+    assert starts(free_slots(busy, [window(0, 9, 12)], timedelta(minutes=30), limit=10)) == ['Mon 10:00']
+
+
+def test_overlapping_busy_intervals_are_merged():
+    busy = [(at(0, 9), at(0, 11)), (at(0, 10), at(0, 10, 30)), (at(0, 10, 15), at(0, 11, 30))]
+    assert starts(free_slots(busy, [window(0, 9, 12)], timedelta(minutes=30), limit=10)) == ['Mon 11:30']
+
+
+def test_busy_interval_spanning_days_blocks_both():
+    busy = [(at(0, 16), at(1, 10))]
+    windows = [window(0, 9, 17), window(1, 9, 17)]
+    slots = free_slots(busy, windows, timedelta(hours=1), limit=20)
+    assert starts(slots)[6:8] == ['Mon 15:00', 'Tue 10:00']
+
+
+def test_fully_booked_window_has_no_slots():
+    busy = [(at(0, 8), at(0, 18))]
+    windows = [window(0, 9, 17), window(1, 9, 10)]
+    assert starts(free_slots(busy, windows, timedelta(minutes=30), limit=5)) == ['Tue 09:00', 'Tue 09:30']
+
+
+def test_limit_stops_the_sweep():
+    windows = list(working_windows(at(0, 9), at(14, 17), time(9), time(17), WEEKDAYS))
+    slots = free_slots([], windows, timedelta(minutes=40), limit=3)
+    assert starts(slots) == ['Mon 09:00', 'Mon 09:45', 'Mon 10:30']
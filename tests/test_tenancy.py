@@ -0,0 +1,166 @@
+import os
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+_instance = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_instance, 'healthcare.db'))
+os.environ.setdefault('EXPORT_DIR', os.path.join(_instance, 'exports'))
+os.environ.setdefault('RATE_LIMIT_DATABASE_PATH', os.path.join(_instance, 'ratelimit.db'))
+os.environ.setdefault('SNAPSHOT_DATABASE_PATH', os.path.join(_instance, 'healthcare_snapshot.db'))
+
+from app import app, audit_writer, db, Activity, CarePlan, Clinic, Goal, Patient, User
+
+
+@pytest.fixture(scope='module')
+def records():
+    """A patient, care plan and goal in clinic 1 and a doctor in each clinic."""
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Clinic(id=1, name='Main clinic'), Clinic(id=2, name='Branch')])
+        for email, clinic_id in (('one@example.com', 1), ('two@example.com', 2)):
+            user = User(email=email, name='Doctor', role='doctor', clinic_id=clinic_id)
+            user.set_password('pw')
+            db.session.add(user)
+        patient = Patient(clinic_id=1, first_name='John', last_name='Doe',
+                          date_of_birth=date(1990, 1, 1), gender='Male', phone='555 0100')
+        db.session.add(patient)
+        db.session.flush()
+        care_plan = CarePlan(clinic_id=1, patient_id=patient.id, title='Plan', diagnosis='Diagnosis',
+                             goals='Goals', interventions='Interventions',
+                             start_date=date(2024, 1, 1), end_date=date(2030, 1, 1))
+        db.session.add(care_plan)
+        db.session.flush()
+        goal = Goal(clinic_id=1, patient_id=patient.id, care_plan_id=care_plan.id,
+                    title='Goal', description='Goal', target_date=date(2030, 1, 1))
+        db.session.add(goal)
+        db.session.commit()
+        ids = {'patient': patient.id, 'care_plan': care_plan.id, 'goal': goal.id}
+    yield ids
+    audit_writer.flush()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def client_for(email):
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': 'pw'})
+    return client
+
+
+def count(model):
+    with app.app_context():
+        return db.session.query(model).execution_options(all_clinics=True).count()
+
+
+def care_plan_form(patient_id):
+    return {
+        'patient_id': patient_id, 'title': 'Plan', 'diagnosis': 'Diagnosis', 'goals': 'Goals',
+        'interventions': 'Interventions', 'start_date': '2024-01-01', 'end_date': '2030-01-01',
+    }
+
+
+def activity_form(records, **overrides):
+    form = {
+        'patient_id': records['patient'], 'care_plan_id': records['care_plan'], 'goal_id': records['goal'],
+        'title': 'Visit', 'description': 'Visit', 'activity_date': '2030-01-01', 'activity_time': '10:00',
+        'duration': '30', 'activity_type': 'appointment', 'location': 'Room 1', 'doctor_name': 'Dr Test',
+    }
+    form.update(overrides)
+    return form
+
+
+def test_other_clinic_cannot_read_patient(records):
+    response = client_for('two@example.com').get(f"/api/patient/{records['patient']}")
+    assert response.status_code == 404
+    response = client_for('one@example.com').get(f"/api/patient/{records['patient']}")
+    assert response.status_code == 200
+
+
+def test_other_clinic_cannot_create_care_plan(records):
+    before = count(CarePlan)
+    response = client_for('two@example.com').post('/add-care-plan', data=care_plan_form(records['patient']))
+    assert response.status_code == 404
+    assert count(CarePlan) == before
+
+
+def test_own_clinic_creates_care_plan(records):
+    before = count(CarePlan)
+    response = client_for('one@example.com').post('/add-care-plan', data=care_plan_form(records['patient']))
+    assert response.get_json()['success']
+    assert count(CarePlan) == before + 1
+
+
+def test_other_clinic_cannot_create_goal(records):
+    before = count(Goal)
+    response = client_for('two@example.com').post('/add-goal', data={
+        'patient_id': records['patient'], 'care_plan_id': records['care_plan'],
+        'title': 'Goal', 'description': 'Goal', 'target_date': '2030-01-01',
+    })
+    assert response.status_code == 404
+    assert count(Goal) == before
+
+
+def test_other_clinic_cannot_create_activity(records):
+    before = count(Activity)
+    response = client_for('two@example.com').post('/add_activity', data=activity_form(records))
+    assert response.status_code == 404
+    assert count(Activity) == before
+
+
+def test_activity_goal_must_belong_to_care_plan(records):
+    with app.app_context():
+        other_plan = CarePlan(clinic_id=1, patient_id=records['patient'], title='Other', diagnosis='Diagnosis',
+                              goals='Goals', interventions='Interventions',
+                              start_date=date(2024, 1, 1), end_date=date(2030, 1, 1))
+        db.session.add(other_plan)
+        db.session.commit()
+        other_plan_id = other_plan.id
+    client = client_for('one@example.com')
+    response = client.post('/add_activity', data=activity_form(records, care_plan_id=other_plan_id))
+    assert response.status_code == 404
+    response = client.post('/add_activity', data=activity_form(records))
+    assert response.get_json()['success']
+
+
+def test_activities_page_lists_own_clinic_doctors(records):
+    with app.app_context():
+        doctor = User(email='other@example.com', name='Dr Elsewhere', role='doctor', clinic_id=2)
+        doctor.set_password('pw')
+        db.session.add(doctor)
+        db.session.commit()
+    response = client_for('one@example.com').get('/activities')
+    assert response.status_code == 200
+    assert b'Dr Elsewhere' not in response.data
+
+
+def test_bulk_status_update_stays_in_own_clinic(records):
+    with app.app_context():
+        patient = Patient(clinic_id=2, first_name='Jane', last_name='Roe',
+                          date_of_birth=date(1990, 1, 1), gender='Female', phone='555 0200')
+        db.session.add(patient)
+        db.session.flush()
+        activities = [
+            Activity(clinic_id=clinic_id, patient_id=patient_id, title='Visit', activity_type='appointment',
+                     doctor_name='Dr Shared', scheduled_date=datetime(2031, 1, 1, 10), status='scheduled')
+            for clinic_id, patient_id in ((1, records['patient']), (2, patient.id))
+        ]
+        db.session.add_all(activities)
+        db.session.commit()
+        own, other = activities[1].id, activities[0].id
+
+    client = client_for('two@example.com')
+    response = client.post('/api/activities/status', json={'status': 'cancelled', 'ids': [own, other]})
+    assert response.get_json()['ids'] == [own]
+    response = client.post('/api/activities/status', json={
+        'status': 'completed', 'filter': {'doctor': 'Dr Shared', 'from': '2031-01-01', 'to': '2031-01-02'},
+    })
+    assert response.get_json()['updated'] == 0
+    with app.app_context():
+        statuses = dict(db.session.query(Activity.id, Activity.status)
+                        .execution_options(all_clinics=True).filter(Activity.id.in_([own, other])))
+    assert statuses == {own: 'cancelled', other: 'scheduled'}
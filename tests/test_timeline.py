@@ -0,0 +1,91 @@
+import pytest
+
+from timeline import decode_cursor, encode_cursor, merge_timeline
+
+
+def source(*events):
+    """A fetch(after, count) over in-memory events, keyset-paginated the way
+    the database sources are."""
+    def key(event):
+        return event['at'], event.get('archived', False), event['id']
+
+    def fetch(after, count, descending=False):
+        rows = sorted((dict(event) for event in events), key=key, reverse=descending)
+        if after is not None:
+            rows = [row for row in rows if (key(row) < after if descending else key(row) > after)]
+        return rows[:count]
+    return fetch
+
+
+def descending(fetch):
+    return lambda after, count: fetch(after, count, descending=True)
+
+
+SOURCES = {
+    'care_plan': source({'id': 1, 'at': '2024-01-01'}, {'id': 2, 'at': '2024-03-01'}),
+    'goal': source({'id': 1, 'at': '2024-02-01'}, {'id': 2, 'at': '2024-03-01'}),
+    # Live and archived activities share ids
+    'activity': source(
+        {'id': 5, 'at': '2024-01-15T09:00:00', 'archived': True},
+        {'id': 5, 'at': '2024-01-15T09:00:00', 'archived': False},
+        {'id': 6, 'at': '2024-03-01T00:00:00', 'archived': True},
+        {'id': 6, 'at': '2024-03-01T00:00:00', 'archived': False},
+        {'id': 7, 'at': '2024-04-01T10:30:00', 'archived': False},
+    ),
+}
+
+
+def walk(sources, limit, descending=False):
+    pages, positions = [], None
+    while True:
+        events, cursor = merge_timeline(sources, positions, limit, descending)
+        pages.append([(event['kind'], event['id'], event.get('archived', False)) for event in events])
+        if cursor is None:
+            return pages
+        positions, descending = decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 20])
+def test_pages_cover_every_event_once_in_order(limit):
+    events = [event for page in walk(SOURCES, limit) for event in page]
+    assert events == [
+        ('care_plan', 1, False),
+        ('activity', 5, False),
+        ('activity', 5, True),
+        ('goal', 1, False),
+        ('activity', 6, False),
+        ('activity', 6, True),
+        ('care_plan', 2, False),
+        ('goal', 2, False),
+        ('activity', 7, False),
+    ]
+
+
+@pytest.mark.parametrize('limit', [1, 4])
+def test_descending_pages_reverse_the_order(limit):
+    sources = {kind: descending(fetch) for kind, fetch in SOURCES.items()}
+    ascending = [event for page in walk(SOURCES, 20) for event in page]
+    assert [event for page in walk(sources, limit, True) for event in page] == ascending[::-1]
+
+
+def test_last_page_has_no_cursor():
+    events, cursor = merge_timeline(SOURCES, limit=9)
+    assert len(events) == 9 and cursor is None
+    assert walk(SOURCES, 3)[-1] != []
+
+
+def test_cursor_round_trips_positions():
+    positions = {'activity': ('2024-01-15T09:00:00', True, 5), 'goal': ('2024-02-01', False, 1)}
+    assert decode_cursor(encode_cursor(positions, True)) == (positions, True)
+
+
+def test_cursor_without_archived_is_read_as_live():
+    cursor = encode_cursor({'goal': ('2024-02-01', 1)}, False)
+    assert decode_cursor(cursor) == ({'goal': ('2024-02-01', False, 1)}, False)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-base64!', encode_cursor({'goal': ['2024-02-01']}, False),
+                                    encode_cursor({'goal': ['2024-02-01', 'x', 1]}, False)])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
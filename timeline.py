@@ -0,0 +1,69 @@
+import base64
+import heapq
+import json
+from datetime import datetime
+
+def encode_cursor(positions, descending):
+    payload = json.dumps({'d': descending, 'p': positions}, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return ``(positions, descending)`` from a cursor made by
+    :func:`encode_cursor`. Raises ValueError if it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions = {kind: _position(*position) for kind, position in payload['p'].items()}
+        return positions, bool(payload['d'])
+    except (TypeError, ValueError, KeyError, AttributeError) as e:
+        raise ValueError(f'Invalid timeline cursor: {cursor!r}') from e
+
+def _position(at, *rest):
+    # Cursors issued before positions carried ``archived`` are [at, id]
+    archived, id = rest if len(rest) == 2 else (False, *rest)
+    if not isinstance(archived, bool):
+        raise TypeError(archived)
+    return str(at), archived, int(id)
+
+def _stream(kind, fetch, after, batch_size):
+    # Keyset-paginate one source lazily: the next batch is only fetched once
+    # the merge has consumed the previous one
+    while True:
+        events = fetch(after, batch_size)
+        for event in events:
+            event['kind'] = kind
+            yield (datetime.fromisoformat(event['at']), kind, *_key(event)[1:]), event
+        if len(events) < batch_size:
+            return
+        after = _key(events[-1])
+
+def _key(event):
+    return event['at'], event.get('archived', False), event['id']
+
+def merge_timeline(sources, positions=None, limit=50, descending=False):
+    """Merge several individually ordered event sources into one page.
+
+    ``sources`` maps an event kind to ``fetch(after, count)``, which returns
+    up to ``count`` events of that kind strictly after ``after`` (an
+    ``(at, archived, id)`` triple, or None for the start) in the timeline's
+    direction. Each event is a dict with an ISO date or datetime ``at`` and
+    an ``id``. A kind read from both a live and an archive table also sets
+    ``archived`` on its events, since ids are only unique within one table;
+    it defaults to False.
+
+    Events are ordered by ``(at, kind, archived, id)``. The cursor keeps one position
+    per source, the last event of that kind already returned, so every page
+    resumes each source's keyset scan where it stopped instead of skipping
+    over earlier pages. Returns ``(events, next_cursor)``; the cursor is None
+    on the last page.
+    """
+    positions = dict(positions or {})
+    streams = [_stream(kind, fetch, positions.get(kind), limit + 1) for kind, fetch in sources.items()]
+    events = []
+    has_more = False
+    for _, event in heapq.merge(*streams, key=lambda item: item[0], reverse=descending):
+        if len(events) == limit:
+            has_more = True
+            break
+        events.append(event)
+        positions[event['kind']] = _key(event)
+    return events, encode_cursor(positions, descending) if has_more else None
@@ -0,0 +1,89 @@
+import bisect
+import threading
+import unicodedata
+
+
+def normalize(text):
+    """Lower-case, strip accents and collapse whitespace so that 'José  Díaz'
+    and 'jose diaz' share the same key."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    """In-memory sorted index of normalized names for prefix lookups.
+
+    Every item is stored under one or more keys (e.g. "first last" and
+    "last first") in a sorted list of ``(key, item_id)`` pairs; a prefix
+    query is a single bisect followed by a short forward scan, so lookups
+    stay cheap no matter how many items are indexed. Items can be added,
+    replaced and removed one at a time as the underlying rows change.
+    """
+
+    def __init__(self):
+        self._entries = []  # sorted (key, item_id)
+        self._keys = {}  # item_id -> keys it is indexed under
+        self._payloads = {}  # item_id -> value returned by search()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def __contains__(self, item_id):
+        return item_id in self._payloads
+
+    def load(self, items):
+        """Replace the whole index with ``(item_id, names, payload)`` triples."""
+        entries, keys, payloads = [], {}, {}
+        for item_id, names, payload in items:
+            item_keys = self._make_keys(names)
+            keys[item_id] = item_keys
+            payloads[item_id] = payload
+            entries.extend((key, item_id) for key in item_keys)
+        entries.sort()
+        with self._lock:
+            self._entries, self._keys, self._payloads = entries, keys, payloads
+
+    def add(self, item_id, names, payload):
+        """Index ``item_id`` under ``names``, replacing any previous entry."""
+        item_keys = self._make_keys(names)
+        with self._lock:
+            self._discard(item_id)
+            for key in item_keys:
+                bisect.insort(self._entries, (key, item_id))
+            self._keys[item_id] = item_keys
+            self._payloads[item_id] = payload
+
+    def remove(self, item_id):
+        with self._lock:
+            self._discard(item_id)
+
+    def search(self, prefix, limit=10):
+        """Return up to ``limit`` payloads whose keys start with ``prefix``,
+        in key order, each item at most once."""
+        prefix = normalize(prefix)
+        results, seen = [], set()
+        with self._lock:
+            entries = self._entries
+            i = bisect.bisect_left(entries, (prefix,))
+            while i < len(entries) and len(results) < limit:
+                key, item_id = entries[i]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append(self._payloads[item_id])
+                i += 1
+        return results
+
+    def _discard(self, item_id):
+        for key in self._keys.pop(item_id, ()):
+            i = bisect.bisect_left(self._entries, (key, item_id))
+            if i < len(self._entries) and self._entries[i] == (key, item_id):
+                del self._entries[i]
+        self._payloads.pop(item_id, None)
+
+    @staticmethod
+    def _make_keys(names):
+        return tuple(sorted({normalize(name) for name in names if normalize(name)}))